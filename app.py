@@ -5,12 +5,16 @@ import eventlet
 eventlet.monkey_patch(socket=True, os=True, select=True, thread=True, time=True)
 
 import datetime
+import hashlib
 import json
 import logging
 import os
 import re
 import secrets
+import signal
+import sys
 import threading
+import time
 from functools import wraps
 from typing import Optional
 
@@ -29,16 +33,42 @@ from werkzeug.utils import secure_filename
 
 import character_manager  # Import the character manager module
 from nwn_roleplay_helper import chat_processing
+from nwn_roleplay_helper import history as chat_history
+from nwn_roleplay_helper import ingestion
 from nwn_roleplay_helper.auth import login_required, register_auth_routes
+from nwn_roleplay_helper.diagnostics import (
+    HOT_PATH_LOG,
+    RECENT_LINES,
+    SOCKET_LATENCY,
+)
+from nwn_roleplay_helper.history_cache import HISTORY_CACHE
+from nwn_roleplay_helper.history_retention import HISTORY_PRUNER
+from nwn_roleplay_helper.history_writer import HISTORY_WRITER
+from nwn_roleplay_helper.ingestion_queue import INGESTION_QUEUE
+from nwn_roleplay_helper.message_queue import socketio_queue_options
+from nwn_roleplay_helper.mode_router import MODE_ROUTER
+from nwn_roleplay_helper.presence import PRESENCE
+from nwn_roleplay_helper.profiles import ProfileStore
+from nwn_roleplay_helper.rooms import emit_to_user
+from nwn_roleplay_helper.shared_state import SHARED_STATE, SharedDict
 from nwn_roleplay_helper.settings import (
-    CHAT_HISTORY_DIR,
     FEEDBACK_DIR,
+    HISTORY_PAGE_DEFAULT_LIMIT,
+    HISTORY_PAGE_MAX_LIMIT,
+    HISTORY_SEARCH_DEFAULT_LIMIT,
+    INGEST_BULK_BATCH_LINES,
+    INGEST_BULK_QUEUE_TIMEOUT_SECONDS,
+    SOCKETIO_ALLOW_UPGRADES,
+    SOCKETIO_CHANNEL,
+    SOCKETIO_DEBUG_LOGGING,
+    SOCKETIO_MESSAGE_QUEUE,
+    SOCKETIO_SERIALIZER,
     UPLOAD_FOLDER,
     env_flag,
     ensure_runtime_dirs,
 )
 from nwn_roleplay_helper.socketio_server import register_socketio_handlers
-from nwn_roleplay_helper.storage import load_users
+from nwn_roleplay_helper.storage import get_sqlite_store
 
 # Set up more detailed logging
 logging.basicConfig(
@@ -47,18 +77,18 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 # Debug: capture last log_update payload for quick verification
-LAST_LOG_UPDATE = {
-    "timestamp": None,
-    "source": None,
-    "client": None,
-    "lines_preview": None,
-}
-
-# Enable detailed Socket.IO and Engine.IO logging
-engineio_logger = logging.getLogger("engineio")
-engineio_logger.setLevel(logging.DEBUG)
-socketio_logger = logging.getLogger("socketio")
-socketio_logger.setLevel(logging.DEBUG)
+LAST_LOG_UPDATE = SharedDict(
+    SHARED_STATE,
+    "last_log_update",
+    {"timestamp": None, "source": None, "client": None, "lines_preview": None},
+)
+
+# Detailed Socket.IO and Engine.IO logging logs every packet, so it is opt-in
+if SOCKETIO_DEBUG_LOGGING:
+    engineio_logger = logging.getLogger("engineio")
+    engineio_logger.setLevel(logging.DEBUG)
+    socketio_logger = logging.getLogger("socketio")
+    socketio_logger.setLevel(logging.DEBUG)
 
 # Load environment variables
 load_dotenv()
@@ -110,7 +140,37 @@ def debug_tools_required(f):
 @app.context_processor
 def inject_feature_flags():
     """Expose small feature flags to templates."""
-    return {"debug_tools_enabled": app.config.get("ENABLE_DEBUG_TOOLS", False)}
+    return {
+        "debug_tools_enabled": app.config.get("ENABLE_DEBUG_TOOLS", False),
+        "socketio_msgpack": SOCKETIO_SERIALIZER == "msgpack",
+        "msgpack_parser_script": MSGPACK_PARSER_SCRIPT,
+    }
+
+
+# Browser parser for SOCKETIO_SERIALIZER=msgpack, served from static/ rather
+# than a CDN (socket.io-msgpack-parser 3.0.2, dist/socket.io-msgpack-parser.min.js).
+MSGPACK_PARSER_SCRIPT = "vendor/socket.io-msgpack-parser-3.0.2.min.js"
+
+
+def _socketio_serializer_options():
+    if SOCKETIO_SERIALIZER in ("", "default", "json"):
+        return {}
+    if SOCKETIO_SERIALIZER != "msgpack":
+        raise ValueError(f"Unsupported SOCKETIO_SERIALIZER: {SOCKETIO_SERIALIZER}")
+    try:
+        import msgpack  # noqa: F401
+    except ImportError as e:
+        raise RuntimeError(
+            "SOCKETIO_SERIALIZER=msgpack needs the msgpack package "
+            "(pip install msgpack)"
+        ) from e
+    parser_file = os.path.join(app.static_folder, MSGPACK_PARSER_SCRIPT)
+    if not os.path.isfile(parser_file):
+        raise RuntimeError(
+            f"SOCKETIO_SERIALIZER=msgpack needs the browser parser at {parser_file} "
+            "(see WEBSOCKET_TROUBLESHOOTING.md)"
+        )
+    return {"serializer": "msgpack"}
 
 
 # Initialize SocketIO with proper configuration
@@ -121,24 +181,28 @@ socketio = SocketIO(
     manage_session=False,
     ping_timeout=20,
     ping_interval=10,
-    logger=True,
-    engineio_logger=True,
+    logger=SOCKETIO_DEBUG_LOGGING,
+    engineio_logger=SOCKETIO_DEBUG_LOGGING,
     always_connect=True,
     transports=["polling", "websocket"],
     cookie=False,
     upgrade_timeout=20000,
     max_http_buffer_size=1e7,
     http_compression=True,
-    allow_upgrades=False,  # Disable transport upgrades to prevent session issues
+    # Sockets are identified by a signed token, not the cookie session, so a
+    # polling fallback connection can upgrade to WebSocket safely.
+    allow_upgrades=SOCKETIO_ALLOW_UPGRADES,
     json=None,  # Don't rely on a specific JSON implementation
     max_cookie_size=0,  # Disable cookie size limiting
+    # Relay emits between app processes when several run behind the proxy
+    **socketio_queue_options(SOCKETIO_MESSAGE_QUEUE, SOCKETIO_CHANNEL),
+    **_socketio_serializer_options(),
 )
 
 #####################################
 ## Authentication Routes
 #####################################
-users = load_users()
-register_auth_routes(app, users)
+register_auth_routes(app)
 
 
 @app.route("/favicon.ico")
@@ -165,11 +229,12 @@ def get_openai_api_key() -> str:
 
 # Global variables
 active_character = None
-character_profiles = {}  # Will be loaded from character_manager
+character_profiles = ProfileStore()  # Will be loaded from character_manager
 chat_monitor_thread = None
 running = True
 last_position = 0
-online_users = set()
+# Profile changes bump a shared version so other processes reload from disk.
+profiles_version = 0
 
 # Setup directories
 ensure_runtime_dirs()
@@ -199,7 +264,12 @@ def detect_character(line: str) -> Optional[str]:
         if character_name != active_character:
             logger.info(f"Switched to character: {character_name}")
             active_character = character_name
-            socketio.emit("character_change", {"character": character_name})
+            emit_to_user(
+                socketio,
+                "character_change",
+                {"character": character_name},
+                current_user,
+            )
 
             # Set up chat history for this character
             chat_processing.setup_chat_history(character_name, logger=logger)
@@ -256,12 +326,7 @@ def create_character_form():
 @login_required
 def get_characters():
     """Return list of characters owned by the current user"""
-    current_user = session.get("user")
-    user_characters = {
-        name: profile
-        for name, profile in character_profiles.items()
-        if profile.get("owner") == current_user
-    }
+    user_characters = character_profiles.owned_by(session.get("user"))
     return jsonify(
         {
             "active_character": session.get("active_character"),
@@ -287,8 +352,8 @@ def create_character():
     if "error" in result:
         return jsonify(result), 400
 
-    global character_profiles
-    character_profiles = character_manager.load_all_profiles()
+    character_profiles[data["name"]] = data
+    _profiles_changed()
 
     return jsonify(result)
 
@@ -297,7 +362,6 @@ def create_character():
 @login_required
 def delete_character(name):
     """Delete a character profile if owned by the current user"""
-    global character_profiles
     # First, try to load the profile from disk (handles stale in-memory cache)
     profile = character_manager.get_profile(name)
     if not profile:
@@ -316,10 +380,42 @@ def delete_character(name):
         return jsonify(result), 400
 
     # Refresh in-memory cache
-    character_profiles = character_manager.load_all_profiles()
+    character_profiles.pop(profile.get("name", name), None)
+    _profiles_changed()
     return jsonify(result)
 
 
+def _refresh_profile(name: str) -> None:
+    """Reload one character's profile from disk after it was changed."""
+    profile = character_manager.get_profile(name)
+    if profile:
+        character_profiles[name] = profile
+        _profiles_changed()
+
+
+def _profiles_changed() -> None:
+    """Tell other app processes that a profile on disk changed."""
+    global profiles_version
+    if SHARED_STATE.shared:
+        profiles_version = SHARED_STATE.incr("profiles_version")
+
+
+def sync_profiles() -> ProfileStore:
+    """Reload the profiles if another process changed one since we loaded them."""
+    global profiles_version
+    if SHARED_STATE.shared:
+        version = SHARED_STATE.get_int("profiles_version")
+        if version != profiles_version:
+            profiles_version = version
+            character_profiles.replace(character_manager.load_all_profiles())
+    return character_profiles
+
+
+@app.before_request
+def _sync_profiles_before_request():
+    sync_profiles()
+
+
 @app.route("/api/character/<n>")
 @login_required
 def get_character(n):
@@ -345,31 +441,83 @@ def set_active_character(n):
     logger.info(f"Manually activated character: {n}")
 
     chat_processing.setup_chat_history(n, logger=logger)
-    socketio.emit("character_change", {"character": n})
+    emit_to_user(socketio, "character_change", {"character": n}, session.get("user"))
     return jsonify({"success": True, "active_character": n})
 
 
 @app.route("/api/history/<character>")
 @login_required
 def get_history(character):
-    """Return chat history for a character"""
+    """Return chat history for a character.
+
+    Without query arguments the whole history is returned as a list. With
+    ``limit``, ``before`` or ``after`` a single page is returned together with
+    its cursors. ``since``/``until`` return the entries within that timestamp
+    range. Responses carry an ETag and honour If-None-Match.
+    """
     try:
         user = session.get("user", "default")
-        character_dir = os.path.join(
-            CHAT_HISTORY_DIR, user, character.replace(" ", "_")
-        )
-        history_file = os.path.join(character_dir, "chat_history.json")
+        HISTORY_WRITER.flush(user, character)
+
+        before = request.args.get("before", type=int)
+        after = request.args.get("after", type=int)
+        limit = request.args.get("limit", type=int)
+        since = request.args.get("since")
+        until = request.args.get("until")
+
+        etag = hashlib.sha1(
+            chat_history.history_version(user, character).encode("utf-8")
+            + b"?"
+            + request.query_string
+        ).hexdigest()
+        if request.if_none_match.contains(etag):
+            not_modified = app.response_class(status=304)
+            not_modified.set_etag(etag)
+            return not_modified
+
+        if since is not None or until is not None:
+            payload = chat_history.entries_between(
+                user, character, since=since, until=until
+            )
+        elif before is None and after is None and limit is None:
+            payload = chat_history.load_entries(user, character)
+        else:
+            limit = min(
+                max(limit or HISTORY_PAGE_DEFAULT_LIMIT, 1), HISTORY_PAGE_MAX_LIMIT
+            )
+            payload = chat_history.read_page(
+                user, character, limit=limit, before=before, after=after
+            )
 
-        if os.path.exists(history_file):
-            with open(history_file, "r", encoding="utf-8") as f:
-                history = json.load(f)
-            return jsonify(history)
-        return jsonify([])
+        response = jsonify(payload)
+        response.set_etag(etag)
+        return response
     except Exception as e:
         logger.error(f"Error retrieving history: {e}")
         return jsonify({"error": str(e)}), 500
 
 
+@app.route("/api/history/<character>/search")
+@login_required
+def search_history(character):
+    """Return history entries matching ``q``, best match first."""
+    query = (request.args.get("q") or "").strip()
+    if not query:
+        return jsonify({"error": "Missing search query"}), 400
+    limit = request.args.get("limit", type=int) or HISTORY_SEARCH_DEFAULT_LIMIT
+    limit = min(max(limit, 1), HISTORY_PAGE_MAX_LIMIT)
+    try:
+        user = session.get("user", "default")
+        HISTORY_WRITER.flush(user, character)
+        started = time.perf_counter()
+        hits = chat_history.search_entries(user, character, query, limit=limit)
+        took_ms = (time.perf_counter() - started) * 1000
+        return jsonify({"query": query, "hits": hits, "took_ms": round(took_ms, 2)})
+    except Exception as e:
+        logger.error(f"Error searching history: {e}")
+        return jsonify({"error": str(e)}), 500
+
+
 @app.route("/api/character/upload-json", methods=["POST"])
 @login_required
 def upload_character_json():
@@ -460,10 +608,14 @@ def manual_respond():
 
 # Start chat monitor thread
 def start_monitor():
-    global chat_monitor_thread, running, character_profiles
+    global chat_monitor_thread, running
+
+    global profiles_version
 
     # Load character profiles from the manager module
-    character_profiles = character_manager.load_all_profiles()
+    if SHARED_STATE.shared:
+        profiles_version = SHARED_STATE.get_int("profiles_version")
+    character_profiles.replace(character_manager.load_all_profiles())
     logger.info(f"Loaded {len(character_profiles)} character profiles")
 
     # Start the monitor thread
@@ -481,10 +633,7 @@ def save_feedback(character_name, message_data, response, rating, notes=""):
     if not character_name:
         return {"error": "No character specified"}
 
-    # Create character-specific feedback directory
     user = session.get("user", "default")
-    feedback_dir = os.path.join(FEEDBACK_DIR, user, character_name.replace(" ", "_"))
-    os.makedirs(feedback_dir, exist_ok=True)
 
     # Create the feedback entry
     feedback_entry = {
@@ -496,6 +645,19 @@ def save_feedback(character_name, message_data, response, rating, notes=""):
         "notes": notes,
     }
 
+    store = get_sqlite_store()
+    if store is not None:
+        try:
+            feedback_id = store.add_feedback(user, character_name, feedback_entry)
+            return {"success": True, "id": feedback_id}
+        except Exception as e:
+            logger.error(f"Error saving feedback: {e}")
+            return {"error": str(e)}
+
+    # Create character-specific feedback directory
+    feedback_dir = os.path.join(FEEDBACK_DIR, user, character_name.replace(" ", "_"))
+    os.makedirs(feedback_dir, exist_ok=True)
+
     # Generate a unique filename
     filename = f"feedback_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
     filepath = os.path.join(feedback_dir, filename)
@@ -565,6 +727,12 @@ def get_character_feedback_summary(character_name):
         return {"error": "No character specified"}
 
     user = session.get("user", "default")
+    store = get_sqlite_store()
+    if store is not None:
+        summary = store.feedback_summary(user, character_name)
+        summary["character"] = character_name
+        return summary
+
     feedback_dir = os.path.join(FEEDBACK_DIR, user, character_name.replace(" ", "_"))
     summary_file = os.path.join(feedback_dir, "feedback_summary.json")
 
@@ -593,8 +761,8 @@ def get_character_feedback_summary(character_name):
 register_socketio_handlers(
     socketio,
     logger=logger,
-    get_character_profiles=lambda: character_profiles,
-    online_users=online_users,
+    get_character_profiles=lambda: sync_profiles(),
+    presence=PRESENCE,
     chat_processing=chat_processing,
     get_openai_api_key=get_openai_api_key,
     save_feedback=save_feedback,
@@ -629,7 +797,7 @@ def log_update():
     """Endpoint to receive log updates from NWN Log Client."""
     try:
         data = request.get_json() or request.form.to_dict()
-        app.logger.info("Received log update: %s", data)
+        app.logger.debug("Received log update: %s", data)
         try:
             if isinstance(data, dict) and "lines" in data:
                 preview_lines = (
@@ -637,7 +805,9 @@ def log_update():
                     if isinstance(data["lines"], list)
                     else data["lines"]
                 )
-                app.logger.info("log_update lines preview (up to 5): %s", preview_lines)
+                HOT_PATH_LOG.event(
+                    app.logger, "log_update lines preview (up to 5)", preview_lines
+                )
                 LAST_LOG_UPDATE.update(
                     {
                         "timestamp": datetime.datetime.now().isoformat(),
@@ -658,30 +828,115 @@ def log_update():
             app.logger.warning("Failed to log line preview: %s", log_err)
 
         if "lines" in data:
-            log_text = "\n".join(data["lines"])
             client = data.get("client", "default")
+            try:
+                seq = ingestion.parse_seq(data.get("seq"))
+            except (TypeError, ValueError) as e:
+                return jsonify(success=False, error=str(e)), 400
+            lines = data["lines"]
+            if isinstance(lines, str):
+                lines = lines.strip().split("\n")
+            try:
+                lines = ingestion.check_lines(lines)
+            except ValueError as e:
+                return jsonify(success=False, error=str(e)), 400
+            stream = data.get("stream")
+
+            # Process messages with global broadcast, minus lines already sent
+            queued = _queue_log_update(
+                client, list(ingestion.numbered(lines, seq)), stream=stream
+            )
+            if not queued:
+                return _ingestion_busy()
+            return jsonify(success=True, queued=True), 202
 
-            # Get the user's characters
-            user_characters = {
-                name: profile
-                for name, profile in character_profiles.items()
-                if profile.get("owner") == client
-            }
+        return jsonify(success=True), 200
+    except Exception as e:
+        app.logger.error("Error processing log update: %s", e)
+        return jsonify(success=False, error=str(e)), 500
 
-            # Process messages with global broadcast
+
+@app.route("/api/log_update/bulk", methods=["POST"])
+def log_update_bulk():
+    """Stream a large backlog of log lines (plain text or NDJSON, maybe gzipped).
+
+    The client is named with the ``client`` query parameter. ``seq`` numbers
+    the first plain-text line and ``stream`` names the numbering.
+    """
+    client = request.args.get("client", "default")
+    try:
+        seq = ingestion.parse_seq(request.args.get("seq"))
+    except ValueError as e:
+        return jsonify(success=False, error=str(e)), 400
+    stream = request.args.get("stream")
+    lines = ingestion.iter_bulk_lines(
+        request.stream,
+        content_type=request.headers.get("Content-Type", ""),
+        content_encoding=request.headers.get("Content-Encoding", ""),
+        seq=seq,
+    )
+    queued = 0
+    preview = []
+    try:
+        for batch in ingestion.batched(lines, INGEST_BULK_BATCH_LINES):
+            preview = preview or [line for _, line in batch[:5]]
+            # Wait for room rather than refusing, so a backlog is throttled
+            # to the rate the workers can keep up with.
+            if not _queue_log_update(
+                client, batch, stream=stream, timeout=INGEST_BULK_QUEUE_TIMEOUT_SECONDS
+            ):
+                return _ingestion_busy(lines=queued)
+            queued += len(batch)
+    except ingestion.PayloadTooLarge as e:
+        return jsonify(success=False, error=str(e), lines=queued), 413
+    except ingestion.BulkPayloadError as e:
+        return jsonify(success=False, error=str(e), lines=queued), 400
+    LAST_LOG_UPDATE.update(
+        {
+            "timestamp": datetime.datetime.now().isoformat(),
+            "source": "http-bulk",
+            "client": client,
+            "lines_preview": preview,
+        }
+    )
+    return jsonify(success=True, queued=True, lines=queued), 202
+
+
+def _queue_log_update(client, lines, *, stream=None, timeout=None) -> bool:
+    """Queue processing of ``client``'s ``(seq, line)`` pairs.
+
+    Resent lines are filtered out by the worker, in the order the client's
+    updates were queued, and the lines count as delivered only once they
+    have been processed, so an update that is refused or fails can simply be
+    resent.
+    """
+
+    def process():
+        with ingestion.INGESTION_TRACKER.accepting(
+            client, lines, stream=stream
+        ) as new_lines:
             chat_processing.process_new_messages(
-                log_text,
+                new_lines,
                 client=client,
-                user_characters=user_characters,
+                user_characters=character_profiles.owned_by(client),
                 character_profiles=character_profiles,
                 socketio=socketio,
                 logger=logger,
             )
 
-        return jsonify(success=True), 200
-    except Exception as e:
-        app.logger.error("Error processing log update: %s", e)
-        return jsonify(success=False, error=str(e)), 500
+    return INGESTION_QUEUE.submit(client, process, timeout=timeout)
+
+
+def _ingestion_busy(**extra):
+    retry_after = INGESTION_QUEUE.retry_after()
+    resp = jsonify(
+        success=False,
+        error="Ingestion queue is full",
+        retry_after=retry_after,
+        **extra,
+    )
+    resp.headers["Retry-After"] = str(retry_after)
+    return resp, 503
 
 
 @app.route("/debug_last_log")
@@ -689,7 +944,71 @@ def log_update():
 @debug_tools_required
 def debug_last_log():
     """Quick sanity check to see last log_update received."""
-    return jsonify(LAST_LOG_UPDATE)
+    return jsonify(LAST_LOG_UPDATE.to_dict())
+
+
+@app.route("/debug_ingestion")
+@login_required
+@debug_tools_required
+def debug_ingestion():
+    """Ingestion queue depth and lag, resent-line and per-mode line counters."""
+    return jsonify(
+        queue=INGESTION_QUEUE.stats(),
+        dedup=ingestion.INGESTION_TRACKER.stats(),
+        modes=MODE_ROUTER.stats(),
+        logging=HOT_PATH_LOG.stats(),
+    )
+
+
+@app.route("/debug_socket_latency")
+@login_required
+@debug_tools_required
+def debug_socket_latency():
+    """Socket.IO round-trip times reported by browsers, per transport."""
+    return jsonify(SOCKET_LATENCY.stats())
+
+
+@app.route("/debug_presence")
+@login_required
+@debug_tools_required
+def debug_presence():
+    """Online users and presence counters (sockets, debounced deltas sent)."""
+    return jsonify(users=PRESENCE.online(), **PRESENCE.stats())
+
+
+@app.route("/debug_recent_lines")
+@login_required
+@debug_tools_required
+def debug_recent_lines():
+    """The most recent raw log lines kept in memory, optionally for one client."""
+    limit = request.args.get("limit", type=int)
+    return jsonify(
+        lines=RECENT_LINES.snapshot(client=request.args.get("client"), limit=limit)
+    )
+
+
+@app.route("/debug_history_writer")
+@login_required
+@debug_tools_required
+def debug_history_writer():
+    """Write-behind history buffer counters (depth, flush latency, bytes)."""
+    return jsonify(HISTORY_WRITER.stats())
+
+
+@app.route("/debug_history_cache")
+@login_required
+@debug_tools_required
+def debug_history_cache():
+    """History cache counters (hits, misses, evictions, size)."""
+    return jsonify(HISTORY_CACHE.stats())
+
+
+@app.route("/debug_history_retention")
+@login_required
+@debug_tools_required
+def debug_history_retention():
+    """History pruning runs, entries removed and bytes reclaimed."""
+    return jsonify(HISTORY_PRUNER.stats())
 
 
 # Load server configuration
@@ -714,6 +1033,10 @@ def load_server_config():
         logger.error(f"Error loading server config: {e}")
         logger.error(f"Using default host:port {host}:{port}")
 
+    # Each process of a multi-process deployment gets its own port
+    if os.getenv("PORT"):
+        port = int(os.environ["PORT"])
+
     return host, port
 
 
@@ -744,7 +1067,7 @@ def update_character(n):
     if "error" in result:
         return jsonify(result), 400
 
-    character_profiles.update(character_manager.load_all_profiles())
+    _refresh_profile(n)
 
     return jsonify(result)
 
@@ -781,7 +1104,7 @@ def import_json_profile(n):
         if "error" in result:
             return jsonify(result), 400
 
-        character_profiles.update(character_manager.load_all_profiles())
+        _refresh_profile(n)
 
         return jsonify(
             {"success": True, "message": f"Profile for {n} updated from JSON file"}
@@ -878,13 +1201,13 @@ def debug_info():
 
     # If no active character is set, default to the first character owned by the current user
     if not session.get("active_character"):
-        current_user = session.get("user")
-        for name, profile in character_profiles.items():
-            if profile.get("owner") == current_user:
-                session["active_character"] = name
-                logger.info(f"Default active_character set to {name} in /debug")
-                socketio.emit("character_change", {"character": name})
-                break
+        for name in character_profiles.owned_by(session.get("user")):
+            session["active_character"] = name
+            logger.info(f"Default active_character set to {name} in /debug")
+            emit_to_user(
+                socketio, "character_change", {"character": name}, session.get("user")
+            )
+            break
 
     debug_data = {
         "server_time": datetime.datetime.now().isoformat(),
@@ -1400,12 +1723,17 @@ if __name__ == "__main__":
 
     # Start monitor thread
     start_monitor()
+    HISTORY_PRUNER.start()
 
     # Load server configuration
     host, port = load_server_config()
 
     logger.info(f"Starting server on {host}:{port}")
 
+    # systemd stops the service with SIGTERM; exit normally so the atexit hook
+    # flushes buffered chat history.
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+
     # Run with eventlet
     run_kwargs = {
         "debug": False,
@@ -1427,3 +1755,4 @@ if __name__ == "__main__":
 else:
     # For gunicorn or other WSGI servers
     start_monitor()
+    HISTORY_PRUNER.start()
@@ -0,0 +1 @@
+"""Local, network-free performance benchmarks (run with ``python -m``)."""
@@ -0,0 +1,91 @@
+"""Seeded synthetic NWN log corpus for the ingestion benchmarks.
+
+The mix follows what a busy roleplay server produces: mostly Talk lines,
+some of them with a ``<c>[HM]</c>`` style language tag, the other chat
+modes, conversation and crafting menus, coloured UI notifications, and a
+steady stream of combat and skill-check feedback. The same seed always
+gives the same lines.
+"""
+
+import random
+from typing import Dict, List, Sequence
+
+from nwn_roleplay_helper.chat_parser import RAVENLOFT_LANGUAGES
+
+DEFAULT_MIX: Dict[str, float] = {
+    "talk": 0.35,
+    "language": 0.15,
+    "other_mode": 0.10,
+    "system_menu": 0.05,
+    "notification": 0.05,
+    "combat": 0.30,
+}
+
+WORDS = (
+    "the mists are thick tonight and the road to Mordentshire is long "
+    "keep your lantern close friend for the dead do not rest here "
+    "I have heard whispers of a stranger asking about the old manor"
+).split()
+OTHER_MODES = ("Party", "Whisper", "Tell", "Shout", "DM")
+SYSTEM_MENUS = (
+    "What would you like to do?",
+    "Please choose section:",
+    "Crafting Menu",
+    "Back",
+    "Cancel",
+)
+NOTIFICATIONS = (
+    "<c\xff\xff\x00>Acquired Item: Healing Potion</c>",
+    "<c\x00\xff\x00>Experience Points Gained:  120</c>",
+    "<c\xcc\x99\xcc>Saving character...</c>",
+)
+MONSTERS = ("Goblin", "Zombie", "Ghoul", "Dire Wolf", "Vistani Bandit")
+
+
+def _sentence(rng: random.Random) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(rng.randint(3, 14))) + "."
+
+
+def generate_corpus(
+    count: int,
+    *,
+    seed: int = 1,
+    client: str = "BenchClient",
+    characters: Sequence[str] = ("Auguste Detourne", "Elvith Ma'for"),
+    others: Sequence[str] = ("Norfind", "Guthric", "Lobo"),
+    mix: Dict[str, float] = DEFAULT_MIX,
+) -> List[str]:
+    """Return ``count`` log lines as received from ``client``."""
+    rng = random.Random(seed)
+    kinds = list(mix)
+    weights = [mix[kind] for kind in kinds]
+    languages = sorted(RAVENLOFT_LANGUAGES)
+    lines = []
+    for kind in rng.choices(kinds, weights, k=count):
+        own = rng.random() < 0.4
+        account = client if own else f"Player{rng.randint(1, 40)}"
+        speaker = rng.choice(characters if own else others)
+        if kind == "talk":
+            lines.append(f"[{account}] {speaker}: [Talk] {_sentence(rng)}")
+        elif kind == "language":
+            code = rng.choice(languages)
+            lines.append(
+                f"[{account}] {speaker}: [Talk] <c>[{code}]</c> {_sentence(rng)}"
+            )
+        elif kind == "other_mode":
+            mode = rng.choice(OTHER_MODES)
+            lines.append(f"[{account}] {speaker}: [{mode}] {_sentence(rng)}")
+        elif kind == "system_menu":
+            menu = rng.choice(SYSTEM_MENUS)
+            lines.append(f"[{client}] {rng.choice(characters)}: [Talk] {menu}")
+        elif kind == "notification":
+            lines.append(rng.choice(NOTIFICATIONS))
+        else:
+            roll, bonus = rng.randint(1, 20), rng.randint(0, 12)
+            target = rng.choice(MONSTERS)
+            outcome = "*hit*" if roll + bonus >= 15 else "*miss*"
+            lines.append(
+                f"{speaker} attacks {target} : {outcome} : "
+                f"({roll} + {bonus} = {roll + bonus})"
+            )
+    return lines
@@ -0,0 +1,225 @@
+"""Ingestion throughput benchmark.
+
+Usage::
+
+    python -m benchmarks.ingestion [--lines 20000] [--seed 1]
+        [--batch-size 200] [--paths batch,per_line,bulk] [--json]
+
+Feeds a seeded synthetic corpus (see :mod:`benchmarks.corpus`) through
+``process_new_messages`` the way each ingestion path does, and reports
+lines/sec, per-line latency percentiles, history bytes written and
+Socket.IO emits per line. A line's latency is the time of the call that
+processed it, so batching trades latency for throughput. History entries
+are encoded but not written to disk and emits are counted, not sent, so
+the benchmark needs no network and leaves no files behind.
+
+New ingestion paths are added to :data:`PATHS`.
+"""
+
+import argparse
+import gzip
+import io
+import json
+import statistics
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence
+
+from nwn_roleplay_helper import chat_processing, history, ingestion
+from nwn_roleplay_helper.settings import INGEST_BULK_BATCH_LINES
+
+from .corpus import generate_corpus
+
+CLIENT = "BenchClient"
+CHARACTERS = ("Auguste Detourne", "Elvith Ma'for")
+
+Process = Callable[[Sequence[str]], None]
+
+
+class CountingSocketIO:
+    """Count emitted events and their JSON size instead of sending them."""
+
+    def __init__(self) -> None:
+        self.emits = 0
+        self.bytes = 0
+
+    def emit(self, event, payload=None, **kwargs) -> None:
+        self.emits += 1
+        self.bytes += len(json.dumps([event, payload], ensure_ascii=False))
+
+
+class CountingHistoryWriter:
+    """Stand-in for HISTORY_WRITER that counts the journal bytes it would write."""
+
+    def __init__(self) -> None:
+        self.entries = 0
+        self.bytes = 0
+
+    def enqueue(self, user, character_name, entries) -> None:
+        self.entries += len(entries)
+        self.bytes += len(history.encode_entries(entries))
+
+
+def _per_line(lines: Sequence[str], batch_size: int, process: Process) -> None:
+    """One update per line, as the log client sends while playing."""
+    for line in lines:
+        process([line])
+
+
+def _batch(lines: Sequence[str], batch_size: int, process: Process) -> None:
+    """``/api/log_update`` updates of ``batch_size`` lines."""
+    for start in range(0, len(lines), batch_size):
+        process(lines[start : start + batch_size])
+
+
+def _bulk(lines: Sequence[str], batch_size: int, process: Process) -> None:
+    """A gzipped NDJSON backlog through ``/api/log_update/bulk``."""
+    body = gzip.compress(
+        "".join(
+            json.dumps({"line": line, "seq": seq}) + "\n"
+            for seq, line in enumerate(lines)
+        ).encode("utf-8")
+    )
+    tracker = ingestion.IngestionTracker()
+    numbered = ingestion.iter_bulk_lines(
+        io.BytesIO(body), content_type="application/x-ndjson", content_encoding="gzip"
+    )
+    for batch in ingestion.batched(numbered, INGEST_BULK_BATCH_LINES):
+        with tracker.accepting(CLIENT, batch) as new_lines:
+            process(new_lines)
+
+
+PATHS: Dict[str, Callable[[Sequence[str], int, Process], None]] = {
+    "per_line": _per_line,
+    "batch": _batch,
+    "bulk": _bulk,
+}
+
+
+@contextmanager
+def _history_writer(writer: CountingHistoryWriter) -> Iterator[None]:
+    original = chat_processing.HISTORY_WRITER
+    chat_processing.HISTORY_WRITER = writer
+    try:
+        yield
+    finally:
+        chat_processing.HISTORY_WRITER = original
+
+
+def _percentile(sorted_values: List[float], fraction: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(int(fraction * len(sorted_values)), len(sorted_values) - 1)
+    return sorted_values[index]
+
+
+def run_path(name: str, lines: Sequence[str], *, batch_size: int) -> Dict[str, Any]:
+    """Feed ``lines`` through one ingestion path and return its measurements."""
+    socketio = CountingSocketIO()
+    writer = CountingHistoryWriter()
+    user_characters = {character: {} for character in CHARACTERS}
+    latencies: List[float] = []
+
+    def process(chunk: Sequence[str]) -> None:
+        started = time.perf_counter()
+        chat_processing.process_new_messages(
+            chunk,
+            client=CLIENT,
+            user_characters=user_characters,
+            character_profiles=user_characters,
+            socketio=socketio,
+        )
+        latencies.extend([time.perf_counter() - started] * len(chunk))
+
+    with _history_writer(writer):
+        started = time.perf_counter()
+        PATHS[name](lines, batch_size, process)
+        elapsed = time.perf_counter() - started
+
+    count = max(len(lines), 1)
+    latencies.sort()
+    return {
+        "path": name,
+        "lines": len(lines),
+        "seconds": round(elapsed, 4),
+        "lines_per_sec": round(len(lines) / elapsed) if elapsed else 0,
+        "latency_ms": {
+            "mean": round(statistics.fmean(latencies) * 1000, 4) if latencies else 0,
+            "p50": round(_percentile(latencies, 0.50) * 1000, 4),
+            "p95": round(_percentile(latencies, 0.95) * 1000, 4),
+            "p99": round(_percentile(latencies, 0.99) * 1000, 4),
+        },
+        "history_entries": writer.entries,
+        "history_bytes": writer.bytes,
+        "history_bytes_per_line": round(writer.bytes / count, 1),
+        "emits": socketio.emits,
+        "emits_per_line": round(socketio.emits / count, 4),
+        "emit_bytes_per_line": round(socketio.bytes / count, 1),
+    }
+
+
+def run(
+    *,
+    lines: int = 20000,
+    seed: int = 1,
+    batch_size: int = 200,
+    paths: Optional[Sequence[str]] = None,
+) -> List[Dict[str, Any]]:
+    """Run the benchmark for each path on the same corpus."""
+    corpus = generate_corpus(lines, seed=seed, client=CLIENT, characters=CHARACTERS)
+    # Warm the parser and speaker caches so the first path is not penalised.
+    run_path("batch", corpus[:200], batch_size=batch_size)
+    return [
+        run_path(name, corpus, batch_size=batch_size) for name in paths or list(PATHS)
+    ]
+
+
+def _print_table(results: List[Dict[str, Any]]) -> None:
+    header = (
+        f"{'path':<10}{'lines/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}"
+        f"{'hist B/line':>13}{'emits/line':>12}{'emit B/line':>13}"
+    )
+    print(header)
+    for result in results:
+        latency = result["latency_ms"]
+        print(
+            f"{result['path']:<10}{result['lines_per_sec']:>10}"
+            f"{latency['p50']:>10}{latency['p95']:>10}{latency['p99']:>10}"
+            f"{result['history_bytes_per_line']:>13}{result['emits_per_line']:>12}"
+            f"{result['emit_bytes_per_line']:>13}"
+        )
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--lines", type=int, default=20000)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=200,
+        help="Lines per update for the batch path (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--paths",
+        default=",".join(PATHS),
+        help="Comma-separated ingestion paths to run (default: %(default)s)",
+    )
+    parser.add_argument("--json", action="store_true", help="Print JSON results")
+    args = parser.parse_args(argv)
+
+    paths = [path.strip() for path in args.paths.split(",") if path.strip()]
+    unknown = [path for path in paths if path not in PATHS]
+    if unknown:
+        parser.error(f"Unknown paths: {', '.join(unknown)}")
+    results = run(
+        lines=args.lines, seed=args.seed, batch_size=args.batch_size, paths=paths
+    )
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        _print_table(results)
+
+
+if __name__ == "__main__":
+    main()
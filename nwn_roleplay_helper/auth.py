@@ -1,21 +1,26 @@
 """Authentication routes and helpers."""
 
 from functools import wraps
-from typing import Any, Dict
+from typing import Any, Optional
 
 from flask import (
+    current_app,
     flash,
+    jsonify,
     redirect,
     render_template,
     request,
     session,
     url_for,
 )
+from itsdangerous import BadSignature, URLSafeTimedSerializer
 from werkzeug.security import check_password_hash, generate_password_hash
 
-from .storage import save_users
+from . import settings
+from .storage import load_user, save_user
 
 HASH_PREFIXES = ("scrypt:", "pbkdf2:", "argon2:")
+SOCKET_TOKEN_SALT = "socket-auth"
 
 
 def is_password_hash(value: Any) -> bool:
@@ -37,6 +42,29 @@ def verify_password(stored_password: Any, candidate_password: str) -> bool:
     return stored_password == candidate_password
 
 
+def issue_socket_token(secret_key: str, username: str) -> str:
+    """Sign a short-lived token that identifies ``username`` to Socket.IO."""
+    serializer = URLSafeTimedSerializer(secret_key, salt=SOCKET_TOKEN_SALT)
+    return serializer.dumps({"user": username})
+
+
+def verify_socket_token(
+    secret_key: str, token: Any, max_age: Optional[int] = None
+) -> Optional[str]:
+    """Return the username in a valid socket token, or None."""
+    if not isinstance(token, str) or not token:
+        return None
+    if max_age is None:
+        max_age = settings.SOCKET_TOKEN_MAX_AGE_SECONDS
+    serializer = URLSafeTimedSerializer(secret_key, salt=SOCKET_TOKEN_SALT)
+    try:
+        data = serializer.loads(token, max_age=max_age)
+    except BadSignature:
+        return None
+    user = data.get("user") if isinstance(data, dict) else None
+    return user if isinstance(user, str) and user else None
+
+
 def login_required(f):
     """Ensure a user is logged in before accessing a route."""
 
@@ -49,18 +77,22 @@ def login_required(f):
     return decorated
 
 
-def register_auth_routes(app, users: Dict[str, Any]) -> None:
-    """Register login/logout/register routes on the app."""
+def register_auth_routes(app) -> None:
+    """Register login/logout/register routes on the app.
+
+    Accounts are read from storage on every request rather than cached, so
+    all app processes agree on them.
+    """
 
     @app.route("/login", methods=["GET", "POST"])
     def login():
         if request.method == "POST":
             username = request.form.get("username")
             password = request.form.get("password")
-            if username in users and verify_password(users[username], password):
-                if not is_password_hash(users[username]):
-                    users[username] = hash_password(password)
-                    save_users(users)
+            stored_password = load_user(username)
+            if verify_password(stored_password, password):
+                if not is_password_hash(stored_password):
+                    save_user(username, hash_password(password))
                 session["user"] = username
                 flash("Logged in successfully!", "success")
                 return redirect(url_for("index"))
@@ -74,20 +106,30 @@ def register_auth_routes(app, users: Dict[str, Any]) -> None:
         flash("Logged out", "success")
         return redirect(url_for("login"))
 
+    @app.route("/api/socket_token")
+    @login_required
+    def socket_token():
+        """Token the browser sends in the Socket.IO handshake ``auth``.
+
+        Socket connections are identified by this token rather than the
+        cookie session, so they work over any transport.
+        """
+        token = issue_socket_token(current_app.config["SECRET_KEY"], session["user"])
+        return jsonify(token=token, expires_in=settings.SOCKET_TOKEN_MAX_AGE_SECONDS)
+
     @app.route("/register", methods=["GET", "POST"])
     def register():
         if request.method == "POST":
             username = request.form.get("username")
             password = request.form.get("password")
             confirm_password = request.form.get("confirm_password")
-            if username in users:
+            if load_user(username) is not None:
                 flash("Username already exists", "error")
                 return redirect(url_for("register"))
             if password != confirm_password:
                 flash("Passwords do not match", "error")
                 return redirect(url_for("register"))
-            users[username] = hash_password(password)
-            save_users(users)
+            save_user(username, hash_password(password))
             flash("Registration successful! Please log in.", "success")
             return redirect(url_for("login"))
         return render_template("register.html")
@@ -0,0 +1,177 @@
+"""Parse raw NWN chat lines into structured records.
+
+Incoming log lines look like ``[account] Speaker Name: [Mode] text``.
+:func:`parse_line` matches each line once against precompiled patterns and
+returns a :class:`ParsedLine` that the rest of the pipeline reads from, so
+no branch has to run the regexes again. :class:`SpeakerIndex` then maps the
+parsed speaker to one of the sending client's characters.
+"""
+
+import re
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, Iterable, Optional
+
+from .settings import SYSTEM_PATTERN
+
+RAVENLOFT_LANGUAGES = {
+    "AN": "Abber",
+    "AK": "Akiri",
+    "AFL": "Ancient Flan",
+    "AFI": "Ancient Flan",
+    "AVE": "Avergnite",
+    "BAL": "Balok",
+    "CAV": "Cavitian",
+    "DRK": "Darkonese",
+    "FLK": "Falkovnian",
+    "FRL": "Farellian",
+    "FF": "Forfarian",
+    "GRB": "Grabenite",
+    "HM": "High Mordentish",
+    "IT": "Italian (Odiare)",
+    "KLD": "Kalidnayan",
+    "LMD": "Lamordian",
+    "LM": "Low Mordentish",
+    "LK": "Luktar",
+    "ND": "Nidalan",
+    "NOS": "Nosian",
+    "OK": "Old Kartakan",
+    "PZ": "Pharazian",
+    "RJ": "Rajian",
+    "RK": "Rokuma",
+    "SG": "Sanguine",
+    "SHU": "Shou (High Shou)",
+    "SC": "Sithican",
+    "SR": "Souragnien",
+    "ST": "Stauntonian",
+    "TP": "Tepestani",
+    "THN": "Thaani",
+    "VAS": "Vaasi",
+    "VCH": "Vechorite",
+    "VOS": "Vos",
+    "WS": "Wildspeak",
+    "ZR": "Zherisian",
+}
+LANGUAGE_PREFIX_RE = re.compile(r"^\s*\[([A-Za-z]+)\]\s*(.*)$")
+CHAT_LINE_RE = re.compile(r"^\[([^\]]+)\] ([^:]+): \[([^\]]+)\] (.*)$")
+SYSTEM_RE = re.compile(SYSTEM_PATTERN)
+MARKUP_RE = re.compile(r"</?c[^>]*>")
+
+
+@dataclass(slots=True)
+class ParsedLine:
+    """One incoming chat line, classified.
+
+    ``account``, ``speaker``, ``mode`` and ``text`` are ``None`` when the line
+    is not in the ``[account] Speaker: [Mode] text`` format. ``text`` has NWN
+    markup and any language prefix removed.
+    """
+
+    raw: str
+    account: Optional[str] = None
+    speaker: Optional[str] = None
+    mode: Optional[str] = None
+    text: Optional[str] = None
+    language: Optional[str] = None
+    is_own: bool = False
+    is_system: bool = False
+
+    @property
+    def is_chat(self) -> bool:
+        return self.mode is not None
+
+    @property
+    def language_name(self) -> Optional[str]:
+        return RAVENLOFT_LANGUAGES.get(self.language) if self.language else None
+
+
+def strip_nwn_markup(text: str) -> str:
+    """Remove NWN client formatting tags while preserving visible text."""
+    return MARKUP_RE.sub("", text).strip()
+
+
+def parse_spoken_text(text: str) -> Dict[str, Optional[str]]:
+    """Strip NWN markup and extract an optional Ravenloft language prefix."""
+    text = strip_nwn_markup(text)
+    match = LANGUAGE_PREFIX_RE.match(text)
+    if not match:
+        return {"text": text, "language_code": None, "language_name": None}
+
+    code = match.group(1).upper()
+    language_name = RAVENLOFT_LANGUAGES.get(code)
+    if not language_name:
+        return {"text": text, "language_code": None, "language_name": None}
+
+    return {
+        "text": match.group(2).strip(),
+        "language_code": code,
+        "language_name": language_name,
+    }
+
+
+def parse_line(line: str, client: Optional[str] = None) -> ParsedLine:
+    """Classify a raw log line sent by ``client`` in a single pass."""
+    is_own = bool(client) and f"[{client}]" in line
+    parsed = ParsedLine(
+        raw=line,
+        is_own=is_own,
+        is_system=is_own and SYSTEM_RE.search(line) is not None,
+    )
+    match = CHAT_LINE_RE.match(line)
+    if match:
+        parsed.account, parsed.speaker, parsed.mode, text = match.groups()
+        spoken = parse_spoken_text(text)
+        parsed.text = spoken["text"]
+        parsed.language = spoken["language_code"]
+    return parsed
+
+
+class SpeakerIndex:
+    """Resolve which of a client's characters spoke a line.
+
+    Lines are matched on their parsed ``[account] speaker`` prefix, so a
+    lookup is a single dict probe however many characters the account has.
+    Lines outside the chat format fall back to a substring scan.
+    """
+
+    __slots__ = ("client", "names", "_by_speaker")
+
+    def __init__(self, client: Optional[str], names: Iterable[str]) -> None:
+        self.client = client
+        self.names = tuple(names)
+        self._by_speaker: Dict[str, str] = {}
+        for name in self.names:
+            # The first profile wins, as it did with the old linear scan.
+            self._by_speaker.setdefault(name.strip(), name)
+
+    def resolve(self, parsed: ParsedLine) -> Optional[str]:
+        """Return the character that spoke ``parsed``, if it is one of ours."""
+        if parsed.speaker is not None:
+            if parsed.account != self.client:
+                return None
+            return self._by_speaker.get(parsed.speaker.strip())
+        for name in self.names:
+            if f"[{self.client}] {name}" in parsed.raw:
+                return name
+        return None
+
+
+# Client names come from unauthenticated log updates, so only the most
+# recently used indexes are kept.
+MAX_SPEAKER_INDEXES = 1024
+_SPEAKER_INDEXES: "OrderedDict[Optional[str], SpeakerIndex]" = OrderedDict()
+_SPEAKER_INDEXES_LOCK = threading.Lock()
+
+
+def speaker_index(client: Optional[str], names: Iterable[str]) -> SpeakerIndex:
+    """Return the client's speaker index, rebuilding it if its characters changed."""
+    names = tuple(names)
+    with _SPEAKER_INDEXES_LOCK:
+        index = _SPEAKER_INDEXES.get(client)
+        if index is None or index.names != names:
+            index = _SPEAKER_INDEXES[client] = SpeakerIndex(client, names)
+        _SPEAKER_INDEXES.move_to_end(client)
+        while len(_SPEAKER_INDEXES) > MAX_SPEAKER_INDEXES:
+            _SPEAKER_INDEXES.popitem(last=False)
+        return index
@@ -2,58 +2,26 @@
 
 import datetime
 import json
-import os
 import re
 import time
-from typing import Any, Dict, Optional, Tuple
+from collections import Counter
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple, Union
 
 import openai
 from flask import session
 
-from .settings import CHAT_HISTORY_DIR, SYSTEM_PATTERN
+from . import history, settings
+from .chat_parser import ParsedLine, parse_line, speaker_index
+from .chat_parser import parse_spoken_text as _parse_spoken_text
+from .diagnostics import HOT_PATH_LOG, RECENT_LINES
+from .history_writer import HISTORY_WRITER
+from .mode_router import MODE_ROUTER
+from .profiles import owned_by
+from .rooms import emit_to_user
 
 CONTEXT_SUMMARY_CACHE: Dict[Tuple[str, str], Dict[str, Any]] = {}
 CONTEXT_SUMMARY_MAX_MESSAGES = 16
 CONTEXT_SUMMARY_REFRESH_TURNS = 4
-RAVENLOFT_LANGUAGES = {
-    "AN": "Abber",
-    "AK": "Akiri",
-    "AFL": "Ancient Flan",
-    "AFI": "Ancient Flan",
-    "AVE": "Avergnite",
-    "BAL": "Balok",
-    "CAV": "Cavitian",
-    "DRK": "Darkonese",
-    "FLK": "Falkovnian",
-    "FRL": "Farellian",
-    "FF": "Forfarian",
-    "GRB": "Grabenite",
-    "HM": "High Mordentish",
-    "IT": "Italian (Odiare)",
-    "KLD": "Kalidnayan",
-    "LMD": "Lamordian",
-    "LM": "Low Mordentish",
-    "LK": "Luktar",
-    "ND": "Nidalan",
-    "NOS": "Nosian",
-    "OK": "Old Kartakan",
-    "PZ": "Pharazian",
-    "RJ": "Rajian",
-    "RK": "Rokuma",
-    "SG": "Sanguine",
-    "SHU": "Shou (High Shou)",
-    "SC": "Sithican",
-    "SR": "Souragnien",
-    "ST": "Stauntonian",
-    "TP": "Tepestani",
-    "THN": "Thaani",
-    "VAS": "Vaasi",
-    "VCH": "Vechorite",
-    "VOS": "Vos",
-    "WS": "Wildspeak",
-    "ZR": "Zherisian",
-}
-LANGUAGE_PREFIX_RE = re.compile(r"^\s*\[([A-Za-z]+)\]\s*(.*)$")
 
 
 def setup_chat_history(
@@ -61,16 +29,7 @@ def setup_chat_history(
 ) -> None:
     """Set up directory for character chat history."""
     user = user or session.get("user", "default")
-    character_dir = os.path.join(
-        CHAT_HISTORY_DIR, user, character_name.replace(" ", "_")
-    )
-    os.makedirs(character_dir, exist_ok=True)
-
-    # Create empty history file if it doesn't exist
-    history_file = os.path.join(character_dir, "chat_history.json")
-    if not os.path.exists(history_file):
-        with open(history_file, "w", encoding="utf-8") as f:
-            json.dump([], f)
+    history_file = history.ensure_history(user, character_name)
 
     if logger:
         logger.info(f"Set up chat history at: {history_file}")
@@ -90,25 +49,11 @@ def save_to_history(
         return
 
     user = user or session.get("user", "default")
-    character_dir = os.path.join(
-        CHAT_HISTORY_DIR, user, character_name.replace(" ", "_")
-    )
-    os.makedirs(character_dir, exist_ok=True)
-
-    history_file = os.path.join(character_dir, "chat_history.json")
 
     try:
-        if os.path.exists(history_file):
-            with open(history_file, "r", encoding="utf-8") as f:
-                history = json.load(f)
-        else:
-            history = []
-
-        history.append({"timestamp": timestamp, "sender": sender, "message": message})
-
-        with open(history_file, "w", encoding="utf-8") as f:
-            json.dump(history, f, indent=2)
-
+        HISTORY_WRITER.enqueue(
+            user, character_name, [history.make_entry(timestamp, sender, message)]
+        )
     except Exception as e:
         if logger:
             logger.error(f"Error saving to chat history: {e}")
@@ -141,30 +86,6 @@ def _extract_message_text(message: str) -> str:
     return _format_context_text(parsed)
 
 
-def _strip_nwn_markup(text: str) -> str:
-    """Remove NWN client formatting tags while preserving visible text."""
-    return re.sub(r"</?c[^>]*>", "", text).strip()
-
-
-def _parse_spoken_text(text: str) -> Dict[str, Optional[str]]:
-    """Strip NWN markup and extract an optional Ravenloft language prefix."""
-    text = _strip_nwn_markup(text)
-    match = LANGUAGE_PREFIX_RE.match(text)
-    if not match:
-        return {"text": text, "language_code": None, "language_name": None}
-
-    code = match.group(1).upper()
-    language_name = RAVENLOFT_LANGUAGES.get(code)
-    if not language_name:
-        return {"text": text, "language_code": None, "language_name": None}
-
-    return {
-        "text": match.group(2).strip(),
-        "language_code": code,
-        "language_name": language_name,
-    }
-
-
 def _format_context_text(parsed_text: Dict[str, Optional[str]]) -> str:
     """Format parsed speech for AI context."""
     text = parsed_text.get("text") or ""
@@ -174,33 +95,19 @@ def _format_context_text(parsed_text: Dict[str, Optional[str]]) -> str:
     return text
 
 
-def _load_history_entries(
-    character_name: str, *, user: Optional[str] = None, logger=None
-) -> list:
-    user = user or session.get("user", "default")
-    character_dir = os.path.join(
-        CHAT_HISTORY_DIR, user, character_name.replace(" ", "_")
-    )
-    history_file = os.path.join(character_dir, "chat_history.json")
-    if not os.path.exists(history_file):
-        return []
-    try:
-        with open(history_file, "r", encoding="utf-8") as f:
-            return json.load(f)
-    except Exception as e:
-        if logger:
-            logger.error(f"Error loading chat history: {e}")
-        return []
-
-
 def _build_recent_context_messages(
-    history_entries: list,
+    entries_newest_first,
     *,
     character_name: str,
     max_messages: int = CONTEXT_SUMMARY_MAX_MESSAGES,
 ) -> list:
+    """Collect the latest conversational lines, returned oldest first.
+
+    ``entries_newest_first`` is consumed lazily, so passing the history tail
+    reader stops reading as soon as enough messages are found.
+    """
     messages = []
-    for entry in reversed(history_entries):
+    for entry in entries_newest_first:
         sender = entry.get("sender")
         if sender not in {"self", "other"}:
             continue
@@ -292,13 +199,18 @@ def get_context_summary_from_history(
     logger=None,
 ) -> Dict[str, Any]:
     user = user or session.get("user", "default")
-    history_entries = _load_history_entries(
-        character_name, user=user, logger=logger
-    )
-    context_messages = _build_recent_context_messages(
-        history_entries, character_name=character_name
-    )
-    history_len = len(history_entries)
+    try:
+        HISTORY_WRITER.flush(user, character_name)
+        context_messages = _build_recent_context_messages(
+            history.iter_entries_reversed(user, character_name),
+            character_name=character_name,
+        )
+        history_len = history.entry_count(user, character_name)
+    except Exception as e:
+        if logger:
+            logger.error(f"Error loading chat history: {e}")
+        context_messages = []
+        history_len = 0
 
     cache_key = (user, character_name)
     cache_entry = CONTEXT_SUMMARY_CACHE.get(cache_key)
@@ -461,8 +373,16 @@ def monitor_chat(*, is_running, logger=None) -> None:
         time.sleep(5)  # Just sleep, actual processing happens in socket handlers
 
 
+def _iter_lines(data: Union[str, Iterable[str]]) -> Iterator[str]:
+    if isinstance(data, str):
+        yield from data.strip().split("\n")
+        return
+    for chunk in data:
+        yield from chunk.split("\n")
+
+
 def process_new_messages(
-    data: str,
+    data: Union[str, Iterable[str]],
     *,
     client=None,
     user_characters=None,
@@ -470,11 +390,14 @@ def process_new_messages(
     character_profiles: Dict[str, Any],
     socketio,
     logger=None,
-) -> None:
-    """Process incoming chat messages and emit events to clients."""
-    lines = data.strip().split("\n")
+) -> int:
+    """Process incoming chat messages and emit events to clients.
+
+    ``data`` is either the raw log text or an iterable of lines, which is
+    consumed lazily. Returns the number of lines read.
+    """
+    lines = _iter_lines(data)
     if logger:
-        logger.info(f"Processing {len(lines)} new message lines")
         logger.info(
             "process_new_messages: client=%s user_characters=%s override_character=%s",
             client,
@@ -486,11 +409,7 @@ def process_new_messages(
 
     # Use provided characters or get all if not provided
     if not user_characters and client:
-        user_characters = {
-            name: profile
-            for name, profile in character_profiles.items()
-            if profile.get("owner") == client
-        }
+        user_characters = owned_by(character_profiles, client)
 
     # If no active character is set but we have user characters, use the first one
     if user_characters:
@@ -504,152 +423,200 @@ def process_new_messages(
                     client,
                 )
 
+    pending_history: Dict[str, list] = {}
+    outbox: List[Tuple[ParsedLine, Optional[str]]] = []
+    mode_counts: Counter = Counter()
+    # If a line fails, nothing of the batch is counted, sent or stored: the
+    # lines are not marked delivered, so the client resends the whole update.
+    processed = _process_lines(
+        lines,
+        client=client,
+        user_characters=user_characters,
+        override_character=override_character,
+        active_char=active_char,
+        pending_history=pending_history,
+        outbox=outbox,
+        mode_counts=mode_counts,
+        logger=logger,
+    )
+    MODE_ROUTER.record(mode_counts)
+    _broadcast(outbox, client=client, socketio=socketio, logger=logger)
+    for character_name, entries in pending_history.items():
+        try:
+            HISTORY_WRITER.enqueue(client or "default", character_name, entries)
+        except Exception as e:
+            if logger:
+                logger.error(f"Error saving to chat history: {e}")
+    if logger:
+        logger.info(f"Processed {processed} new message lines")
+    return processed
+
+
+def _process_lines(
+    lines,
+    *,
+    client,
+    user_characters,
+    override_character: Optional[str],
+    active_char: Optional[str],
+    pending_history: Dict[str, list],
+    outbox: List[Tuple[ParsedLine, Optional[str]]],
+    mode_counts: Counter,
+    logger=None,
+) -> int:
+    speakers = speaker_index(client, user_characters or ())
+    processed = 0
     for line in lines:
+        processed += 1
         # Skip empty lines
         if not line.strip():
             continue
+        RECENT_LINES.record(client or "default", line)
 
         # Skip colored UI/system notifications, but keep actual chat lines such as
         # "<c>[HM]</c> Good day" because the tag only colors visible speech text.
         if "<c" in line and "</c>" in line and "[Talk]" not in line:
-            if logger:
-                logger.info(f"Skipping system notification: {line[:30]}...")
+            HOT_PATH_LOG.event(logger, "Skipping system notification", line[:30])
             continue
 
-        # Use override_character if provided, otherwise detect from line
-        character_name = override_character
-        if not character_name:
-            # For log API updates, use the client's active character
-            character_name = active_char
-
-            # Try to detect character from line
-            for char_name in user_characters.keys():
-                if f"[{client}] {char_name}" in line:
-                    character_name = char_name
-                    break
-
-        if not character_name and not client:
+        parsed = parse_line(line, client)
+        if parsed.is_system:
+            # This is a system message, we'll ignore it
+            HOT_PATH_LOG.event(logger, "Skipping system menu message", line[:30])
+            mode_counts[("system", "dropped")] += 1
             continue
 
-        # Check if this is the client's own character's message
-        is_own_message = client and f"[{client}]" in line
+        # Decide up front whether this mode is kept at all, so dropped lines
+        # (combat spam, skill checks...) cost nothing more.
+        mode = MODE_ROUTER.mode_of(parsed)
+        route = MODE_ROUTER.route(mode)
+        if route.dropped:
+            mode_counts[(mode, "dropped")] += 1
+            continue
 
-        # Check if this is likely a system menu message
-        is_system_message = is_own_message and re.search(SYSTEM_PATTERN, line)
+        # Use override_character if provided, otherwise detect from line and
+        # fall back to the client's active character
+        character_name = override_character or speakers.resolve(parsed) or active_char
 
-        if is_system_message:
-            # This is a system message, we'll ignore it
-            if logger:
-                logger.info(f"Skipping system menu message: {line[:30]}...")
+        if not character_name and not client:
             continue
 
-        if logger:
-            logger.info(f"Processing chat message: {line[:50]}...")
-
-        # Save the message if we have a character
-        if character_name:
-            # Create in-memory record only - don't rely on session
-            try:
-                user = client or "default"
-                character_dir = os.path.join(
-                    CHAT_HISTORY_DIR, user, character_name.replace(" ", "_")
+        HOT_PATH_LOG.event(logger, "Processing chat message", line[:50])
+
+        # Save the message if we have a character; the whole batch is handed
+        # to the history writer once the loop finishes.
+        if route.persist and character_name:
+            timestamp = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            pending_history.setdefault(character_name, []).append(
+                history.make_entry(
+                    timestamp, "self" if parsed.is_own else "other", line
                 )
-                os.makedirs(character_dir, exist_ok=True)
+            )
+            mode_counts[(mode, "persisted")] += 1
 
-                history_file = os.path.join(character_dir, "chat_history.json")
+        # Only lines in the [username] char name: [Mode] msg format can be shown.
+        if route.broadcast and parsed.is_chat:
+            outbox.append((parsed, character_name))
+            mode_counts[(mode, "broadcast")] += 1
+    return processed
 
-                timestamp = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
 
-                if os.path.exists(history_file):
-                    with open(history_file, "r", encoding="utf-8") as f:
-                        history = json.load(f)
-                else:
-                    history = []
+def _message_payload(parsed: ParsedLine, character_name) -> Dict[str, Any]:
+    return {
+        "character": character_name,
+        "message": f"<strong>{parsed.speaker}:</strong> {parsed.text}",
+        "raw_message": parsed.raw,
+        "is_own": parsed.is_own,
+        "original_message": None if parsed.is_own else parsed.text,
+        "player_name": parsed.speaker,
+        "mode": parsed.mode,
+        "language_code": parsed.language,
+        "language_name": parsed.language_name,
+    }
 
-                history.append(
-                    {
-                        "timestamp": timestamp,
-                        "sender": "self" if is_own_message else "other",
-                        "message": line,
-                    }
-                )
 
-                with open(history_file, "w", encoding="utf-8") as f:
-                    json.dump(history, f, indent=2)
-            except Exception as e:
-                if logger:
-                    logger.error(f"Error saving to chat history: {e}")
-
-        # Parse the original message content for player messages
-        original_message = None
-        if not is_own_message:
-            # Only accept full format: [username] char name: [mode] msg
-            match = re.match(r"^\[([^\]]+)\] ([^:]+): \[([^\]]+)\] (.*)$", line)
-            if match:
-                account, char_name, mode, player_message = match.groups()
-                if mode == "Talk":
-                    parsed_message = _parse_spoken_text(player_message)
-                    original_message = parsed_message["text"]
-
-        # Only display accepted conversation format: [username] char name: [Talk] msg
-        talk_match = re.match(r"^\[([^\]]+)\] ([^:]+): \[([^\]]+)\] (.*)$", line)
-        if not talk_match:
-            # Not a standard chat line; skip without aborting the batch.
-            if logger:
-                logger.info(f"Skipping non-chat line: {line[:120]}")
-            continue
-        account, speaker, mode, text = talk_match.groups()
-        if mode != "Talk":
-            # Only show Talk lines, but keep processing other lines in this batch.
-            if logger:
-                logger.info(f"Skipping non-Talk line: {line[:120]}")
-            continue
-        parsed_text = _parse_spoken_text(text)
-        text = parsed_text["text"]
-        formatted_message = f"<strong>{speaker}:</strong> {text}"
+# Column order of the compact new_messages rows; main.js expands them.
+COMPACT_MESSAGE_FIELDS = ("character", "speaker", "text", "mode", "language", "own")
 
-        # Emit the new_message event to all clients
-        if logger:
-            logger.info("Broadcasting message to all clients")
-        socketio.emit(
-            "new_message",
-            {
-                "character": character_name,
-                "message": formatted_message,
-                "raw_message": line,
-                "is_own": is_own_message,
-                "original_message": original_message,
-                "language_code": parsed_text["language_code"],
-                "language_name": parsed_text["language_name"],
-                "client": client,
-            },
+
+def _compact_batch(
+    outbox: List[Tuple[ParsedLine, Optional[str]]], client
+) -> Dict[str, Any]:
+    """Encode a batch as rows of parsed fields, sending each value once.
+
+    The HTML line, the original text and the player name are all derived
+    from ``speaker`` and ``text`` by the browser, and language names are sent
+    once per batch for the codes that occur in it.
+    """
+    rows = []
+    languages: Dict[str, str] = {}
+    for parsed, character_name in outbox:
+        rows.append(
+            [
+                character_name,
+                parsed.speaker,
+                parsed.text,
+                parsed.mode,
+                parsed.language,
+                int(parsed.is_own),
+            ]
         )
+        if parsed.language:
+            languages[parsed.language] = parsed.language_name
+    payload: Dict[str, Any] = {
+        "client": client,
+        "fields": list(COMPACT_MESSAGE_FIELDS),
+        "rows": rows,
+    }
+    if languages:
+        payload["languages"] = languages
+    return payload
+
+
+def _broadcast(
+    outbox: List[Tuple[ParsedLine, Optional[str]]], *, client, socketio, logger=None
+) -> None:
+    """Send a batch's chat lines to the client's sockets as one new_messages event.
 
+    The batch uses the compact row format unless SOCKETIO_MESSAGE_FORMAT is
+    "full". With SOCKETIO_PER_LINE_MESSAGE_EVENTS the older per-line
+    new_message and player_message events are sent as well.
+    """
+    if not outbox:
+        return
+    if logger:
+        logger.info(f"Sending {len(outbox)} messages to {client or 'all clients'}")
+    per_line = settings.SOCKETIO_PER_LINE_MESSAGE_EVENTS
+    messages = None
+    if settings.SOCKETIO_MESSAGE_FORMAT == "full" or per_line:
+        messages = [_message_payload(parsed, name) for parsed, name in outbox]
+    if settings.SOCKETIO_MESSAGE_FORMAT == "full":
+        payload = {"client": client, "messages": messages}
+    else:
+        payload = _compact_batch(outbox, client)
+    emit_to_user(socketio, "new_messages", payload, client)
+
+    if not per_line:
+        return
+    for message in messages:
+        new_message = dict(message, client=client)
+        del new_message["player_name"], new_message["mode"]
+        emit_to_user(socketio, "new_message", new_message, client)
         # Process NPC/player messages for auto-reply
-        if not is_own_message:
-            # Only accept full format: [username] char name: [mode] msg
-            match = re.match(r"^\[([^\]]+)\] ([^:]+): \[([^\]]+)\] (.*)$", line)
-            if match:
-                account, char_name, mode, player_message = match.groups()
-                if mode == "Talk":
-                    parsed_message = _parse_spoken_text(player_message)
-                    player_message = parsed_message["text"]
-                    if logger:
-                        logger.info(
-                            "Broadcasting player message from %s to all clients",
-                            char_name,
-                        )
-                    socketio.emit(
-                        "player_message",
-                        {
-                            "character": character_name,
-                            "player_name": char_name,
-                            "message": player_message,
-                            "language_code": parsed_message["language_code"],
-                            "language_name": parsed_message["language_name"],
-                            "client": client,
-                        },
-                    )
+        if not message["is_own"]:
+            emit_to_user(
+                socketio,
+                "player_message",
+                {
+                    "character": message["character"],
+                    "player_name": message["player_name"],
+                    "message": message["original_message"],
+                    "language_code": message["language_code"],
+                    "language_name": message["language_name"],
+                    "client": client,
+                },
+                client,
+            )
 
 
 # Generate AI responses
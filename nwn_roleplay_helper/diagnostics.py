@@ -0,0 +1,132 @@
+"""Cheap diagnostics for the ingestion hot path.
+
+Logging every incoming line costs more than processing it once updates
+arrive quickly. Instead, :data:`RECENT_LINES` keeps the last
+``DIAG_RECENT_LINES`` raw lines in memory for the debug endpoints, and
+:data:`HOT_PATH_LOG` counts per-line events and logs a summary at most once
+every ``LOG_SAMPLE_INTERVAL_SECONDS``. Set ``LOG_HOT_PATH=verbose`` to log
+each event as it happens again. :data:`SOCKET_LATENCY` collects the
+Socket.IO round-trip times browsers measure, per transport.
+"""
+
+import threading
+import time
+from collections import Counter, deque
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+from . import settings
+
+RecentLine = Tuple[float, str, str]
+
+
+class RecentLines:
+    """Bounded in-memory buffer of the most recent raw log lines."""
+
+    def __init__(self, maxlen: Optional[int] = None) -> None:
+        if maxlen is None:
+            maxlen = settings.DIAG_RECENT_LINES
+        self._lines: Deque[RecentLine] = deque(maxlen=max(maxlen, 1))
+        self._enabled = maxlen > 0
+
+    def record(self, client: str, line: str) -> None:
+        # deque.append with maxlen is atomic, so no lock is needed here.
+        if self._enabled:
+            self._lines.append((time.time(), client, line))
+
+    def snapshot(
+        self, *, client: Optional[str] = None, limit: Optional[int] = None
+    ) -> List[Dict[str, Any]]:
+        """Return recorded lines, newest last, optionally for one client."""
+        lines = [entry for entry in list(self._lines) if client in (None, entry[1])]
+        if limit is not None:
+            lines = lines[-limit:] if limit > 0 else []
+        return [
+            {"time": when, "client": who, "line": line} for when, who, line in lines
+        ]
+
+    def clear(self) -> None:
+        self._lines.clear()
+
+
+class HotPathLog:
+    """Aggregate per-line log events into a periodic summary."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._pending: Counter = Counter()
+        self._totals: Counter = Counter()
+        self._last_flush = time.monotonic()
+
+    def event(self, logger, kind: str, detail: str = "") -> None:
+        """Count one ``kind`` event, logging it or a due summary."""
+        if settings.LOG_HOT_PATH == "verbose":
+            with self._lock:
+                self._totals[kind] += 1
+            if logger:
+                logger.info("%s: %s", kind, detail)
+            return
+        now = time.monotonic()
+        with self._lock:
+            self._pending[kind] += 1
+            self._totals[kind] += 1
+            if now - self._last_flush < settings.LOG_SAMPLE_INTERVAL_SECONDS:
+                return
+            pending, self._pending = self._pending, Counter()
+            elapsed, self._last_flush = now - self._last_flush, now
+        if logger:
+            logger.info(
+                "Hot path events in the last %.0fs: %s",
+                elapsed,
+                ", ".join(f"{kind}={n}" for kind, n in pending.most_common()),
+            )
+
+    def stats(self) -> Dict[str, Any]:
+        """Return the logging mode and event totals."""
+        with self._lock:
+            return {
+                "mode": settings.LOG_HOT_PATH,
+                "sample_interval_seconds": settings.LOG_SAMPLE_INTERVAL_SECONDS,
+                "totals": dict(self._totals),
+                "pending": dict(self._pending),
+            }
+
+
+class LatencyStats:
+    """Recent Socket.IO round-trip times reported by browsers, per transport."""
+
+    def __init__(self, maxlen: int = 1000) -> None:
+        self._lock = threading.Lock()
+        self._maxlen = maxlen
+        self._samples: Dict[str, Deque[float]] = {}
+
+    def record(self, transport: str, rtt_ms: float) -> None:
+        with self._lock:
+            samples = self._samples.get(transport)
+            if samples is None:
+                samples = self._samples[transport] = deque(maxlen=self._maxlen)
+            samples.append(rtt_ms)
+
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        """Return count, mean and percentiles of the recent samples."""
+        with self._lock:
+            snapshot = {
+                name: sorted(samples) for name, samples in self._samples.items()
+            }
+        result = {}
+        for transport, samples in snapshot.items():
+            if not samples:
+                continue
+            last = len(samples) - 1
+            result[transport] = {
+                "count": len(samples),
+                "mean_ms": round(sum(samples) / len(samples), 2),
+                "p50_ms": samples[min(int(0.50 * len(samples)), last)],
+                "p95_ms": samples[min(int(0.95 * len(samples)), last)],
+                "p99_ms": samples[min(int(0.99 * len(samples)), last)],
+            }
+        return result
+
+
+RECENT_LINES = RecentLines()
+HOT_PATH_LOG = HotPathLog()
+SOCKET_LATENCY = LatencyStats()
@@ -0,0 +1,1052 @@
+"""Append-only chat history journal.
+
+Each character keeps its history in ``chat_history/<user>/<character>/``
+as a line-delimited JSON journal (one entry per line), so recording a
+message is a single small append instead of a rewrite of the whole file.
+Legacy ``chat_history.json`` arrays are migrated transparently the first
+time a character's history is touched.
+
+The journal is split into segments. New entries go to the hot segment,
+``chat_history.jsonl``. Once it grows past ``HISTORY_SEGMENT_MAX_BYTES`` or
+``HISTORY_SEGMENT_MAX_AGE_HOURS`` it is sealed and gzip-compressed into
+``segments/``. ``manifest.json`` records each cold segment's offset range,
+entry count and timestamps. Entry ids are byte offsets into the logical
+stream of all segments, so they stay stable across rotations. Recent reads
+touch only the hot segment, and older reads decompress only the segments
+they reach.
+
+Appends, rotations and pruning of a character hold an exclusive ``flock``
+on its ``.lock`` file, so several app processes can share one
+``CHAT_HISTORY_DIR``. (Without ``fcntl``, on Windows, only one process may
+write a history directory.)
+"""
+
+import gzip
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import (
+    Any,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Protocol,
+    Set,
+    Tuple,
+)
+
+from . import settings, storage
+from .history_cache import HISTORY_CACHE
+from .history_search import SEARCH_INDEX
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+HISTORY_FILENAME = "chat_history.jsonl"
+LEGACY_HISTORY_FILENAME = "chat_history.json"
+MANIFEST_FILENAME = "manifest.json"
+SEGMENTS_DIRNAME = "segments"
+MIGRATED_SUFFIX = ".migrated"
+LOCK_FILENAME = ".lock"
+TAIL_BLOCK_SIZE = 16 * 1024
+COUNT_CHUNK_SIZE = 1024 * 1024
+
+# Journal path -> (size in bytes, line count) observed at that size, so the
+# entry count can be kept current from appends instead of rescanning.
+_LINE_COUNTS: Dict[str, Tuple[int, int]] = {}
+# Manifest path -> (mtime_ns, manifest) so reads don't re-parse it.
+_MANIFESTS: Dict[str, Tuple[Optional[int], Dict[str, Any]]] = {}
+# Character directories already checked for interrupted rotations.
+_RECOVERED: Set[str] = set()
+# Character directories whose lock the current thread holds.
+_HELD_LOCKS = threading.local()
+
+LocatedEntry = Tuple[int, Dict[str, Any]]
+
+
+def character_history_dir(user: str, character_name: str) -> str:
+    """Return the history directory for a user's character."""
+    return os.path.join(
+        settings.CHAT_HISTORY_DIR, user, character_name.replace(" ", "_")
+    )
+
+
+@contextmanager
+def character_lock(character_dir: str) -> Iterator[None]:
+    """Hold the cross-process write lock of a character directory.
+
+    Re-entrant within a thread, so an append that rotates takes it once.
+    """
+    held = getattr(_HELD_LOCKS, "dirs", None)
+    if held is None:
+        held = _HELD_LOCKS.dirs = set()
+    if character_dir in held or fcntl is None:
+        yield
+        return
+    os.makedirs(character_dir, exist_ok=True)
+    with open(os.path.join(character_dir, LOCK_FILENAME), "a+b") as lock_file:
+        fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+        held.add(character_dir)
+        try:
+            yield
+        finally:
+            held.discard(character_dir)
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+
+def make_entry(timestamp: str, sender: str, message: str) -> Dict[str, Any]:
+    """Build a history entry in the stored shape."""
+    return {"timestamp": timestamp, "sender": sender, "message": message}
+
+
+def encode_entries(entries: Iterable[Dict[str, Any]]) -> bytes:
+    """Serialize entries to journal lines."""
+    return b"".join(
+        json.dumps(entry, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        + b"\n"
+        for entry in entries
+    )
+
+
+def decode_line(line: bytes) -> Optional[Dict[str, Any]]:
+    """Parse one journal line, ignoring blanks and torn writes."""
+    line = line.strip()
+    if not line:
+        return None
+    try:
+        entry = json.loads(line)
+    except ValueError:
+        return None
+    return entry if isinstance(entry, dict) else None
+
+
+def _write_atomic(path: str, payload: bytes) -> None:
+    tmp_file = path + ".tmp"
+    with open(tmp_file, "wb") as f:
+        f.write(payload)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_file, path)
+
+
+def migrate_legacy_history(character_dir: str) -> bool:
+    """Convert a legacy JSON array history into a journal.
+
+    The journal is written to a temporary file and renamed into place, so a
+    crash mid-migration leaves the legacy file untouched. The legacy file is
+    kept with a ``.migrated`` suffix rather than deleted.
+    """
+    legacy_file = os.path.join(character_dir, LEGACY_HISTORY_FILENAME)
+    journal_file = os.path.join(character_dir, HISTORY_FILENAME)
+    if not os.path.exists(legacy_file) or os.path.exists(journal_file):
+        return False
+
+    try:
+        with open(legacy_file, "r", encoding="utf-8") as f:
+            entries = json.load(f)
+    except Exception as e:
+        logger.error(f"Error reading legacy chat history {legacy_file}: {e}")
+        return False
+    if not isinstance(entries, list):
+        entries = []
+
+    _write_atomic(
+        journal_file, encode_entries(e for e in entries if isinstance(e, dict))
+    )
+    os.replace(legacy_file, legacy_file + MIGRATED_SUFFIX)
+    logger.info(f"Migrated {len(entries)} chat history entries to {journal_file}")
+    return True
+
+
+def history_path(user: str, character_name: str, *, create: bool = False) -> str:
+    """Return the hot journal path for a character, migrating legacy history."""
+    character_dir = character_history_dir(user, character_name)
+    if create:
+        os.makedirs(character_dir, exist_ok=True)
+    journal_file = os.path.join(character_dir, HISTORY_FILENAME)
+    if not os.path.exists(journal_file):
+        migrate_legacy_history(character_dir)
+    return journal_file
+
+
+def _ensure_journal(user: str, character_name: str) -> str:
+    """Create an empty journal for a character if none exists."""
+    journal_file = history_path(user, character_name, create=True)
+    if not os.path.exists(journal_file):
+        open(journal_file, "ab").close()
+    return journal_file
+
+
+# ---------------------------------------------------------------------------
+# Manifest and segment rotation
+# ---------------------------------------------------------------------------
+
+
+def _empty_manifest() -> Dict[str, Any]:
+    return {"hot_base": 0, "hot_started": None, "segments": []}
+
+
+def _segment_filename(base: int, *, compressed: bool = True) -> str:
+    return f"{base:016x}.jsonl" + (".gz" if compressed else "")
+
+
+def load_manifest(character_dir: str) -> Dict[str, Any]:
+    """Return a character's segment manifest (empty if never rotated)."""
+    manifest_file = os.path.join(character_dir, MANIFEST_FILENAME)
+    try:
+        mtime_ns = os.stat(manifest_file).st_mtime_ns
+    except OSError:
+        mtime_ns = None
+    cached = _MANIFESTS.get(manifest_file)
+    if cached is not None and cached[0] == mtime_ns:
+        return cached[1]
+
+    manifest = _empty_manifest()
+    if mtime_ns is not None:
+        try:
+            with open(manifest_file, "r", encoding="utf-8") as f:
+                manifest.update(json.load(f))
+        except Exception as e:
+            logger.error(f"Error reading history manifest {manifest_file}: {e}")
+    _MANIFESTS[manifest_file] = (mtime_ns, manifest)
+    return manifest
+
+
+def _write_manifest(character_dir: str, manifest: Dict[str, Any]) -> None:
+    manifest_file = os.path.join(character_dir, MANIFEST_FILENAME)
+    _write_atomic(manifest_file, json.dumps(manifest, indent=2).encode("utf-8"))
+    _MANIFESTS.pop(manifest_file, None)
+
+
+def _recover_sealed_segments(character_dir: str) -> None:
+    """Finish rotations interrupted after the hot segment was sealed."""
+    if character_dir in _RECOVERED:
+        return
+    _RECOVERED.add(character_dir)
+    segments_dir = os.path.join(character_dir, SEGMENTS_DIRNAME)
+    if not os.path.isdir(segments_dir):
+        return
+    manifest = load_manifest(character_dir)
+    manifest = dict(manifest, segments=list(manifest["segments"]))
+    known = {segment["base"] for segment in manifest["segments"]}
+    for name in sorted(os.listdir(segments_dir)):
+        if not name.endswith(".jsonl"):
+            continue
+        sealed_file = os.path.join(segments_dir, name)
+        base = int(name[: -len(".jsonl")], 16)
+        if base not in known:
+            _compress_sealed(character_dir, manifest, sealed_file, base)
+        os.remove(sealed_file)
+
+
+def _compress_sealed(
+    character_dir: str, manifest: Dict[str, Any], sealed_file: str, base: int
+) -> None:
+    with open(sealed_file, "rb") as f:
+        data = f.read()
+    entries = 0
+    first_timestamp = last_timestamp = None
+    for line in data.split(b"\n"):
+        entry = decode_line(line)
+        if entry is None:
+            continue
+        entries += 1
+        first_timestamp = first_timestamp or entry.get("timestamp")
+        last_timestamp = entry.get("timestamp") or last_timestamp
+
+    name = _segment_filename(base)
+    _write_atomic(
+        os.path.join(character_dir, SEGMENTS_DIRNAME, name), gzip.compress(data)
+    )
+    manifest["segments"].append(
+        {
+            "file": name,
+            "base": base,
+            "bytes": len(data),
+            "entries": entries,
+            "first_timestamp": first_timestamp,
+            "last_timestamp": last_timestamp,
+        }
+    )
+    manifest["segments"].sort(key=lambda segment: segment["base"])
+    manifest["hot_base"] = max(manifest["hot_base"], base + len(data))
+    manifest["hot_started"] = None
+    _write_manifest(character_dir, manifest)
+
+
+def rotate_segment(character_dir: str) -> Optional[Dict[str, Any]]:
+    """Seal and compress the hot segment, returning its manifest record.
+
+    The hot file is renamed into ``segments/`` first, so new appends start a
+    fresh hot segment immediately. Compression and the manifest update are
+    each atomic, and a crash between the steps is repaired by the next
+    append to that character.
+    """
+    with character_lock(character_dir):
+        return _rotate_segment(character_dir)
+
+
+def _rotate_segment(character_dir: str) -> Optional[Dict[str, Any]]:
+    journal_file = os.path.join(character_dir, HISTORY_FILENAME)
+    try:
+        if os.path.getsize(journal_file) == 0:
+            return None
+    except OSError:
+        return None
+    manifest = load_manifest(character_dir)
+    base = manifest["hot_base"]
+    segments_dir = os.path.join(character_dir, SEGMENTS_DIRNAME)
+    os.makedirs(segments_dir, exist_ok=True)
+    sealed_file = os.path.join(segments_dir, _segment_filename(base, compressed=False))
+    os.replace(journal_file, sealed_file)
+    _LINE_COUNTS.pop(journal_file, None)
+    manifest = dict(manifest, segments=list(manifest["segments"]))
+    _compress_sealed(character_dir, manifest, sealed_file, base)
+    os.remove(sealed_file)
+    logger.info(f"Rotated chat history segment at offset {base} in {character_dir}")
+    return manifest["segments"][-1]
+
+
+def _hot_segment_expired(manifest: Dict[str, Any]) -> bool:
+    started = manifest.get("hot_started")
+    max_age = settings.HISTORY_SEGMENT_MAX_AGE_HOURS * 3600
+    return bool(started) and max_age > 0 and time.time() - started >= max_age
+
+
+def _append_journal(
+    user: str, character_name: str, entries: List[Dict[str, Any]]
+) -> int:
+    """Append entries to a character journal and return the bytes written.
+
+    The hot segment is rotated first if it is too old, and afterwards if the
+    append pushed it past the size limit.
+    """
+    if not entries:
+        return 0
+    payload = encode_entries(entries)
+    with character_lock(character_history_dir(user, character_name)):
+        return _append_journal_locked(user, character_name, payload, len(entries))
+
+
+def _append_journal_locked(
+    user: str, character_name: str, payload: bytes, count: int
+) -> int:
+    journal_file = history_path(user, character_name, create=True)
+    character_dir = os.path.dirname(journal_file)
+    _recover_sealed_segments(character_dir)
+    manifest = load_manifest(character_dir)
+    if _hot_segment_expired(manifest):
+        rotate_segment(character_dir)
+        manifest = load_manifest(character_dir)
+
+    # A single O_APPEND write keeps concurrent appenders from interleaving.
+    with open(journal_file, "ab") as f:
+        start = f.tell()
+        f.write(payload)
+    cached = _LINE_COUNTS.get(journal_file)
+    if cached is not None and cached[0] == start:
+        _LINE_COUNTS[journal_file] = (start + len(payload), cached[1] + count)
+
+    if start == 0 and not manifest.get("hot_started"):
+        _write_manifest(character_dir, dict(manifest, hot_started=time.time()))
+    max_bytes = settings.HISTORY_SEGMENT_MAX_BYTES
+    if max_bytes > 0 and start + len(payload) >= max_bytes:
+        rotate_segment(character_dir)
+    return len(payload)
+
+
+# ---------------------------------------------------------------------------
+# Readers
+# ---------------------------------------------------------------------------
+
+
+def _segment_file(character_dir: str, segment: Dict[str, Any]) -> str:
+    return os.path.join(character_dir, SEGMENTS_DIRNAME, segment["file"])
+
+
+def _read_segment(character_dir: str, segment: Dict[str, Any]) -> bytes:
+    try:
+        with gzip.open(_segment_file(character_dir, segment), "rb") as f:
+            return f.read()
+    except FileNotFoundError:
+        # Pruned after the caller loaded the manifest.
+        return b""
+
+
+def _locate_lines(lines: List[bytes], offset: int) -> List[Tuple[int, bytes]]:
+    located = []
+    for line in lines:
+        located.append((offset, line))
+        offset += len(line) + 1
+    return located
+
+
+def _iter_hot_reversed(
+    journal_file: str, base: int, end: Optional[int], block_size: int
+) -> Iterator[LocatedEntry]:
+    if not os.path.exists(journal_file):
+        return
+    with open(journal_file, "rb") as f:
+        size = f.seek(0, os.SEEK_END)
+        position = size if end is None else max(0, min(end - base, size))
+        fragment = b""
+        while position > 0:
+            read_size = min(block_size, position)
+            position -= read_size
+            f.seek(position)
+            lines = (f.read(read_size) + fragment).split(b"\n")
+            # The first piece may be the tail of a line that starts earlier.
+            fragment = lines.pop(0)
+            located = _locate_lines(lines, base + position + len(fragment) + 1)
+            for line_offset, line in reversed(located):
+                entry = decode_line(line)
+                if entry is not None:
+                    yield line_offset, entry
+        entry = decode_line(fragment)
+        if entry is not None:
+            yield base, entry
+
+
+def _iter_reversed_with_ids(
+    character_dir: str, *, end: Optional[int] = None, block_size: int = TAIL_BLOCK_SIZE
+) -> Iterator[LocatedEntry]:
+    """Yield ``(id, entry)`` pairs newest first for entries before ``end``."""
+    manifest = load_manifest(character_dir)
+    hot_base = manifest["hot_base"]
+    if end is None or end > hot_base:
+        yield from _iter_hot_reversed(
+            os.path.join(character_dir, HISTORY_FILENAME), hot_base, end, block_size
+        )
+    for segment in reversed(manifest["segments"]):
+        if end is not None and segment["base"] >= end:
+            continue
+        data = _read_segment(character_dir, segment)
+        located = _locate_lines(data.split(b"\n"), segment["base"])
+        for line_offset, line in reversed(located):
+            if end is not None and line_offset >= end:
+                continue
+            entry = decode_line(line)
+            if entry is not None:
+                yield line_offset, entry
+
+
+def _iter_forward_with_ids(
+    character_dir: str, *, after: Optional[int] = None
+) -> Iterator[LocatedEntry]:
+    """Yield ``(id, entry)`` pairs oldest first for entries after ``after``."""
+    manifest = load_manifest(character_dir)
+    for segment in manifest["segments"]:
+        if after is not None and segment["base"] + segment["bytes"] <= after:
+            continue
+        data = _read_segment(character_dir, segment)
+        for line_offset, line in _locate_lines(data.split(b"\n"), segment["base"]):
+            if after is not None and line_offset <= after:
+                continue
+            entry = decode_line(line)
+            if entry is not None:
+                yield line_offset, entry
+
+    journal_file = os.path.join(character_dir, HISTORY_FILENAME)
+    if not os.path.exists(journal_file):
+        return
+    hot_base = manifest["hot_base"]
+    with open(journal_file, "rb") as f:
+        if after is not None and after >= hot_base:
+            f.seek(after - hot_base)
+            # Skip the line the cursor points at; it was already delivered.
+            f.readline()
+        offset = hot_base + f.tell()
+        for line in f:
+            entry = decode_line(line)
+            if entry is not None:
+                yield offset, entry
+            offset += len(line)
+
+
+def _character_dir(user: str, character_name: str) -> str:
+    return os.path.dirname(history_path(user, character_name))
+
+
+def _journal_entries_between(
+    user: str,
+    character_name: str,
+    *,
+    since: Optional[str] = None,
+    until: Optional[str] = None,
+) -> List[Dict[str, Any]]:
+    character_dir = _character_dir(user, character_name)
+    manifest = load_manifest(character_dir)
+
+    def in_window(entry: Dict[str, Any]) -> bool:
+        timestamp = entry.get("timestamp") or ""
+        return (since is None or timestamp >= since) and (
+            until is None or timestamp <= until
+        )
+
+    entries = []
+    for segment in manifest["segments"]:
+        # Skip cold segments whose time range lies outside the window without
+        # decompressing them.
+        if since is not None and (segment.get("last_timestamp") or "") < since:
+            continue
+        if until is not None and (segment.get("first_timestamp") or "") > until:
+            continue
+        for line in _read_segment(character_dir, segment).split(b"\n"):
+            entry = decode_line(line)
+            if entry is not None and in_window(entry):
+                entries.append(entry)
+
+    journal_file = os.path.join(character_dir, HISTORY_FILENAME)
+    if os.path.exists(journal_file):
+        with open(journal_file, "rb") as f:
+            for line in f:
+                entry = decode_line(line)
+                if entry is not None and in_window(entry):
+                    entries.append(entry)
+    return entries
+
+
+def _hot_line_count(journal_file: str) -> int:
+    try:
+        size = os.path.getsize(journal_file)
+    except OSError:
+        return 0
+    cached = _LINE_COUNTS.get(journal_file)
+    if cached is not None and cached[0] == size:
+        return cached[1]
+    count = 0
+    with open(journal_file, "rb") as f:
+        for chunk in iter(lambda: f.read(COUNT_CHUNK_SIZE), b""):
+            count += chunk.count(b"\n")
+    _LINE_COUNTS[journal_file] = (size, count)
+    return count
+
+
+def _journal_entry_count(user: str, character_name: str) -> int:
+    # Cold segment counts come from the manifest. The hot segment count is
+    # cached against its size and advanced by appends, so the file is only
+    # rescanned if it changed some other way.
+    journal_file = history_path(user, character_name)
+    manifest = load_manifest(os.path.dirname(journal_file))
+    cold = sum(segment["entries"] for segment in manifest["segments"])
+    return cold + _hot_line_count(journal_file)
+
+
+def _journal_version(user: str, character_name: str) -> str:
+    journal_file = history_path(user, character_name)
+    manifest = load_manifest(os.path.dirname(journal_file))
+    # Rotation moves hot_base; pruning drops segments or lowers their entry
+    # counts, so the cold part is summarised by its first base and size.
+    segments = manifest["segments"]
+    cold = (
+        f"{manifest['hot_base']:x}-{segments[0]['base'] if segments else 0:x}"
+        f"-{sum(segment['entries'] for segment in segments):x}"
+    )
+    try:
+        stat = os.stat(journal_file)
+    except OSError:
+        return f"{cold}-0"
+    return f"{cold}-{stat.st_ino:x}-{stat.st_size:x}-{stat.st_mtime_ns:x}"
+
+
+def _segment_size(character_dir: str, segment: Dict[str, Any]) -> int:
+    try:
+        return os.path.getsize(_segment_file(character_dir, segment))
+    except OSError:
+        return 0
+
+
+def _remove_segments(
+    character_dir: str,
+    manifest: Dict[str, Any],
+    kept: List[Dict[str, Any]],
+    dropped: List[Dict[str, Any]],
+) -> None:
+    # Publish the new manifest before deleting files, so readers never look
+    # for a segment the current manifest still lists.
+    _write_manifest(character_dir, dict(manifest, segments=kept))
+    for segment in dropped:
+        try:
+            os.remove(_segment_file(character_dir, segment))
+        except FileNotFoundError:
+            pass
+
+
+def _journal_prune(
+    user: str,
+    character_name: str,
+    *,
+    older_than: Optional[str] = None,
+    drop_senders: Iterable[str] = (),
+    drop_senders_older_than: Optional[str] = None,
+    max_entries: int = 0,
+) -> Tuple[int, int]:
+    """Remove expired entries from cold segments; return (entries, bytes).
+
+    The hot segment is never touched, so pruning doesn't contend with
+    appends. Whole segments are deleted when possible. Otherwise the
+    removed lines are blanked rather than cut out, so the offsets (and ids)
+    of the remaining entries don't move, and the segment is recompressed.
+    """
+    character_dir = _character_dir(user, character_name)
+    manifest = load_manifest(character_dir)
+    excess = 0
+    if max_entries > 0:
+        excess = max(0, _journal_entry_count(user, character_name) - max_entries)
+    drop_senders = set(drop_senders)
+    if not drop_senders:
+        drop_senders_older_than = None
+
+    def expired(entry: Dict[str, Any]) -> bool:
+        timestamp = entry.get("timestamp") or ""
+        if older_than is not None and timestamp < older_than:
+            return True
+        return (
+            drop_senders_older_than is not None
+            and entry.get("sender") in drop_senders
+            and timestamp < drop_senders_older_than
+        )
+
+    kept: List[Dict[str, Any]] = []
+    dropped: List[Dict[str, Any]] = []
+    removed = reclaimed = 0
+    for segment in manifest["segments"]:
+        first = segment.get("first_timestamp") or ""
+        last = segment.get("last_timestamp") or ""
+        if excess >= segment["entries"] or (
+            older_than is not None and last < older_than
+        ):
+            dropped.append(segment)
+            removed += segment["entries"]
+            reclaimed += _segment_size(character_dir, segment)
+            excess = max(0, excess - segment["entries"])
+            continue
+        may_expire = (
+            excess > 0
+            or (older_than is not None and first < older_than)
+            or (drop_senders_older_than is not None and first < drop_senders_older_than)
+        )
+        if not may_expire:
+            kept.append(segment)
+            continue
+
+        lines = _read_segment(character_dir, segment).split(b"\n")
+        segment_removed = 0
+        first_timestamp = last_timestamp = None
+        for index, line in enumerate(lines):
+            entry = decode_line(line)
+            if entry is None:
+                continue
+            if excess > 0 or expired(entry):
+                lines[index] = b" " * len(line)
+                segment_removed += 1
+                excess = max(0, excess - 1)
+                continue
+            first_timestamp = first_timestamp or entry.get("timestamp")
+            last_timestamp = entry.get("timestamp") or last_timestamp
+        if not segment_removed:
+            kept.append(segment)
+            continue
+        removed += segment_removed
+        old_size = _segment_size(character_dir, segment)
+        if segment_removed >= segment["entries"]:
+            dropped.append(segment)
+            reclaimed += old_size
+            continue
+        _write_atomic(
+            _segment_file(character_dir, segment), gzip.compress(b"\n".join(lines))
+        )
+        reclaimed += old_size - _segment_size(character_dir, segment)
+        kept.append(
+            dict(
+                segment,
+                entries=segment["entries"] - segment_removed,
+                first_timestamp=first_timestamp,
+                last_timestamp=last_timestamp,
+            )
+        )
+    if removed:
+        _remove_segments(character_dir, manifest, kept, dropped)
+    return removed, reclaimed
+
+
+def _journal_drop_oldest(
+    user: str, character_name: str, bytes_to_free: int
+) -> Tuple[int, int]:
+    """Delete the oldest cold segments until ``bytes_to_free`` is reclaimed."""
+    character_dir = _character_dir(user, character_name)
+    manifest = load_manifest(character_dir)
+    segments = list(manifest["segments"])
+    dropped: List[Dict[str, Any]] = []
+    removed = reclaimed = 0
+    while segments and reclaimed < bytes_to_free:
+        segment = segments.pop(0)
+        dropped.append(segment)
+        removed += segment["entries"]
+        reclaimed += _segment_size(character_dir, segment)
+    if dropped:
+        _remove_segments(character_dir, manifest, segments, dropped)
+    return removed, reclaimed
+
+
+def _journal_user_bytes(user: str) -> int:
+    # Only the journals and sealed segments count against the budget: the
+    # pruner cannot reclaim anything else (manifests, ``.migrated`` backups).
+    total = 0
+    user_dir = os.path.join(settings.CHAT_HISTORY_DIR, user)
+    for root, _, files in os.walk(user_dir):
+        in_segments = os.path.basename(root) == SEGMENTS_DIRNAME
+        for name in files:
+            if not (in_segments or name == HISTORY_FILENAME):
+                continue
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+
+def _journal_characters() -> List[Tuple[str, str]]:
+    characters = []
+    root = settings.CHAT_HISTORY_DIR
+    if not os.path.isdir(root):
+        return characters
+    for user in sorted(os.listdir(root)):
+        user_dir = os.path.join(root, user)
+        if not os.path.isdir(user_dir):
+            continue
+        for name in sorted(os.listdir(user_dir)):
+            if os.path.isdir(os.path.join(user_dir, name)):
+                characters.append((user, name))
+    return characters
+
+
+# ---------------------------------------------------------------------------
+# Store interface
+# ---------------------------------------------------------------------------
+
+
+class HistoryStore(Protocol):
+    """Operations a history backend provides.
+
+    Entry ids are integers that increase with insertion order and never
+    change, so they can be used as paging cursors. ``namespace`` identifies
+    the underlying data (backend and location) for in-memory caches.
+    """
+
+    namespace: str
+
+    def append_entries(
+        self, user: str, character_name: str, entries: List[Dict[str, Any]]
+    ) -> int: ...
+
+    def ensure(self, user: str, character_name: str) -> str: ...
+
+    def iter_reversed(
+        self,
+        user: str,
+        character_name: str,
+        *,
+        end: Optional[int] = None,
+        senders: Optional[Iterable[str]] = None,
+    ) -> Iterator[LocatedEntry]: ...
+
+    def iter_forward(
+        self, user: str, character_name: str, *, after: Optional[int] = None
+    ) -> Iterator[LocatedEntry]: ...
+
+    def entries_between(
+        self,
+        user: str,
+        character_name: str,
+        *,
+        since: Optional[str] = None,
+        until: Optional[str] = None,
+    ) -> List[Dict[str, Any]]: ...
+
+    def entry_count(self, user: str, character_name: str) -> int: ...
+
+    def search(
+        self, user: str, character_name: str, query: str, *, limit: int
+    ) -> List[Dict[str, Any]]: ...
+
+    def version(self, user: str, character_name: str) -> str: ...
+
+    def characters(self) -> List[Tuple[str, str]]: ...
+
+    def prune(
+        self,
+        user: str,
+        character_name: str,
+        *,
+        older_than: Optional[str] = None,
+        drop_senders: Iterable[str] = (),
+        drop_senders_older_than: Optional[str] = None,
+        max_entries: int = 0,
+    ) -> Tuple[int, int]: ...
+
+    def user_bytes(self, user: str) -> int: ...
+
+    def oldest_timestamp(self, user: str, character_name: str) -> Optional[str]: ...
+
+    def drop_oldest(
+        self, user: str, character_name: str, bytes_to_free: int
+    ) -> Tuple[int, int]: ...
+
+
+class JsonlHistoryStore:
+    """History backend over per-character JSONL journals and segments."""
+
+    def __init__(self, *, block_size: int = TAIL_BLOCK_SIZE) -> None:
+        self.block_size = block_size
+
+    @property
+    def namespace(self) -> str:
+        return f"jsonl:{settings.CHAT_HISTORY_DIR}"
+
+    def append_entries(
+        self, user: str, character_name: str, entries: List[Dict[str, Any]]
+    ) -> int:
+        return _append_journal(user, character_name, entries)
+
+    def ensure(self, user: str, character_name: str) -> str:
+        return _ensure_journal(user, character_name)
+
+    def iter_reversed(
+        self,
+        user: str,
+        character_name: str,
+        *,
+        end: Optional[int] = None,
+        senders: Optional[Iterable[str]] = None,
+    ) -> Iterator[LocatedEntry]:
+        wanted = set(senders) if senders is not None else None
+        located = _iter_reversed_with_ids(
+            _character_dir(user, character_name), end=end, block_size=self.block_size
+        )
+        for entry_id, entry in located:
+            if wanted is None or entry.get("sender") in wanted:
+                yield entry_id, entry
+
+    def iter_forward(
+        self, user: str, character_name: str, *, after: Optional[int] = None
+    ) -> Iterator[LocatedEntry]:
+        return _iter_forward_with_ids(_character_dir(user, character_name), after=after)
+
+    def entries_between(
+        self,
+        user: str,
+        character_name: str,
+        *,
+        since: Optional[str] = None,
+        until: Optional[str] = None,
+    ) -> List[Dict[str, Any]]:
+        return _journal_entries_between(user, character_name, since=since, until=until)
+
+    def entry_count(self, user: str, character_name: str) -> int:
+        return _journal_entry_count(user, character_name)
+
+    def search(
+        self, user: str, character_name: str, query: str, *, limit: int
+    ) -> List[Dict[str, Any]]:
+        return SEARCH_INDEX.search(
+            self.namespace,
+            user,
+            character_name,
+            query,
+            limit=limit,
+            read_forward=lambda after: self.iter_forward(
+                user, character_name, after=after
+            ),
+        )
+
+    def version(self, user: str, character_name: str) -> str:
+        return _journal_version(user, character_name)
+
+    def characters(self) -> List[Tuple[str, str]]:
+        return _journal_characters()
+
+    def prune(
+        self,
+        user: str,
+        character_name: str,
+        *,
+        older_than: Optional[str] = None,
+        drop_senders: Iterable[str] = (),
+        drop_senders_older_than: Optional[str] = None,
+        max_entries: int = 0,
+    ) -> Tuple[int, int]:
+        with character_lock(character_history_dir(user, character_name)):
+            return _journal_prune(
+                user,
+                character_name,
+                older_than=older_than,
+                drop_senders=drop_senders,
+                drop_senders_older_than=drop_senders_older_than,
+                max_entries=max_entries,
+            )
+
+    def user_bytes(self, user: str) -> int:
+        return _journal_user_bytes(user)
+
+    def oldest_timestamp(self, user: str, character_name: str) -> Optional[str]:
+        # Only cold segments can be pruned, so the hot segment doesn't count.
+        segments = load_manifest(_character_dir(user, character_name))["segments"]
+        return segments[0].get("first_timestamp") or "" if segments else None
+
+    def drop_oldest(
+        self, user: str, character_name: str, bytes_to_free: int
+    ) -> Tuple[int, int]:
+        with character_lock(character_history_dir(user, character_name)):
+            return _journal_drop_oldest(user, character_name, bytes_to_free)
+
+
+_JSONL_STORE = JsonlHistoryStore()
+
+
+def get_store() -> HistoryStore:
+    """Return the history backend selected by ``STORAGE_BACKEND``."""
+    return storage.get_sqlite_store() or _JSONL_STORE
+
+
+# ---------------------------------------------------------------------------
+# Public API
+# ---------------------------------------------------------------------------
+
+
+def append_entries(
+    user: str, character_name: str, entries: List[Dict[str, Any]]
+) -> int:
+    """Append entries to a character's history and return the bytes written."""
+    if not entries:
+        return 0
+    store = get_store()
+    written = store.append_entries(user, character_name, entries)
+    HISTORY_CACHE.mark_dirty(store, user, character_name)
+    return written
+
+
+def ensure_history(user: str, character_name: str) -> str:
+    """Prepare storage for a character and return where it lives."""
+    return get_store().ensure(user, character_name)
+
+
+def load_entries(user: str, character_name: str) -> List[Dict[str, Any]]:
+    """Load every entry of a character's history, oldest first."""
+    located = HISTORY_CACHE.iter_forward(get_store(), user, character_name)
+    return [entry for _, entry in located]
+
+
+def iter_entries_reversed(user: str, character_name: str) -> Iterator[Dict[str, Any]]:
+    """Yield history entries newest first.
+
+    Recent entries come from the history cache and older ones are read
+    lazily, so taking the last few messages costs the same for any history
+    length.
+    """
+    for _, entry in HISTORY_CACHE.iter_reversed(get_store(), user, character_name):
+        yield entry
+
+
+def tail_entries(
+    user: str,
+    character_name: str,
+    limit: int,
+    *,
+    senders: Optional[Iterable[str]] = None,
+) -> List[Dict[str, Any]]:
+    """Return up to ``limit`` newest entries, oldest first.
+
+    ``senders`` restricts the result to entries from those senders.
+    """
+    entries = []
+    if limit <= 0:
+        return entries
+    located = HISTORY_CACHE.iter_reversed(
+        get_store(), user, character_name, senders=senders
+    )
+    for _, entry in located:
+        entries.append(entry)
+        if len(entries) >= limit:
+            break
+    entries.reverse()
+    return entries
+
+
+def entries_between(
+    user: str,
+    character_name: str,
+    *,
+    since: Optional[str] = None,
+    until: Optional[str] = None,
+) -> List[Dict[str, Any]]:
+    """Return entries whose timestamp falls in ``[since, until]``, oldest first."""
+    return get_store().entries_between(user, character_name, since=since, until=until)
+
+
+def entry_count(user: str, character_name: str) -> int:
+    """Return the number of stored entries for a character."""
+    return get_store().entry_count(user, character_name)
+
+
+def search_entries(
+    user: str, character_name: str, query: str, *, limit: int
+) -> List[Dict[str, Any]]:
+    """Return up to ``limit`` entries matching every word of ``query``.
+
+    Hits are ranked by BM25 relevance and include a ``snippet`` with the
+    matched words wrapped in ``**``.
+    """
+    return get_store().search(user, character_name, query, limit=limit)
+
+
+def read_page(
+    user: str,
+    character_name: str,
+    *,
+    limit: int,
+    before: Optional[int] = None,
+    after: Optional[int] = None,
+) -> Dict[str, Any]:
+    """Return one page of history entries, oldest first, with cursors.
+
+    Each entry carries a stable ``id``. ``after`` pages forward from an id for
+    deltas; otherwise the page holds the newest entries older than ``before``
+    (or the newest overall).
+    """
+    store = get_store()
+    if after is not None:
+        source = HISTORY_CACHE.iter_forward(store, user, character_name, after=after)
+    else:
+        source = HISTORY_CACHE.iter_reversed(store, user, character_name, end=before)
+    located = []
+    for located_entry in source:
+        located.append(located_entry)
+        if len(located) > limit:
+            break
+    has_more = len(located) > limit
+    located = located[:limit]
+    if after is None:
+        located.reverse()
+
+    entries = [dict(entry, id=entry_id) for entry_id, entry in located]
+    return {
+        "entries": entries,
+        "before": entries[0]["id"] if entries else before,
+        "after": entries[-1]["id"] if entries else after,
+        "has_more": has_more,
+    }
+
+
+def history_version(user: str, character_name: str) -> str:
+    """Return a token that changes whenever a character's history changes."""
+    return get_store().version(user, character_name)
@@ -0,0 +1,236 @@
+"""Process-wide LRU cache of recent parsed history.
+
+Each cached character keeps its newest ``HISTORY_CACHE_WINDOW`` entries
+(with ids), so recent-context, tail and latest-page reads are served from
+memory. The write path marks a character dirty after every append. The
+next read then fetches only the entries after the newest cached id, rather
+than re-reading the history. Characters are evicted least recently used
+first once the cache holds more than ``HISTORY_CACHE_MAX_ENTRIES`` entries
+in total.
+
+Appends made by another app process (``SOCKETIO_MESSAGE_QUEUE`` set) do not
+mark this process's entries dirty, so in that mode every hit is checked
+against the store's version and reloaded if the history changed.
+
+Cached entry dicts are shared between readers and must not be mutated.
+"""
+
+import threading
+from collections import OrderedDict
+from typing import TYPE_CHECKING, Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from . import settings
+
+if TYPE_CHECKING:
+    from .history import HistoryStore
+
+LocatedEntry = Tuple[int, Dict[str, Any]]
+CacheKey = Tuple[str, str, str]
+
+
+class CachedHistory:
+    """The newest entries of one character, oldest first."""
+
+    __slots__ = ("entries", "complete", "dirty", "version")
+
+    def __init__(self, entries: List[LocatedEntry], complete: bool) -> None:
+        self.entries = entries
+        # True when ``entries`` reaches back to the very first entry.
+        self.complete = complete
+        self.dirty = False
+        # The store's version of the history these entries were read from.
+        self.version: Optional[str] = None
+
+
+class HistoryCache:
+    """Bounded LRU of recent history entries keyed by (user, character)."""
+
+    def __init__(
+        self, *, window: Optional[int] = None, max_entries: Optional[int] = None
+    ) -> None:
+        self.window = window
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[CacheKey, CachedHistory]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._counters = {
+            "hits": 0,
+            "misses": 0,
+            "evictions": 0,
+            "catch_ups": 0,
+            "invalidations": 0,
+        }
+
+    def _window(self) -> int:
+        return self.window if self.window is not None else settings.HISTORY_CACHE_WINDOW
+
+    def _max_entries(self) -> int:
+        if self.max_entries is not None:
+            return self.max_entries
+        return settings.HISTORY_CACHE_MAX_ENTRIES
+
+    @staticmethod
+    def _key(store: "HistoryStore", user: str, character_name: str) -> CacheKey:
+        return store.namespace, user, character_name.replace(" ", "_")
+
+    def mark_dirty(self, store: "HistoryStore", user: str, character_name: str) -> None:
+        """Record that entries were appended for a character."""
+        with self._lock:
+            cached = self._entries.get(self._key(store, user, character_name))
+            if cached is not None:
+                cached.dirty = True
+
+    def invalidate(self, user: str, character_name: str) -> None:
+        """Drop a character from the cache, e.g. after entries were removed."""
+        user_key = (user, character_name.replace(" ", "_"))
+        with self._lock:
+            for key in [k for k in self._entries if k[1:] == user_key]:
+                del self._entries[key]
+                self._counters["invalidations"] += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def _load(
+        self, store: "HistoryStore", user: str, character_name: str
+    ) -> CachedHistory:
+        window = self._window()
+        newest = []
+        for located in store.iter_reversed(user, character_name):
+            newest.append(located)
+            if len(newest) > window:
+                break
+        complete = len(newest) <= window
+        newest = newest[:window]
+        newest.reverse()
+        return CachedHistory(newest, complete)
+
+    def _catch_up(
+        self,
+        store: "HistoryStore",
+        user: str,
+        character_name: str,
+        cached: CachedHistory,
+    ) -> Optional[CachedHistory]:
+        window = self._window()
+        after = cached.entries[-1][0] if cached.entries else None
+        appended = []
+        for located in store.iter_forward(user, character_name, after=after):
+            appended.append(located)
+            if len(appended) > window:
+                # Too much to merge; reload the newest window instead.
+                return None
+        entries = cached.entries + appended
+        complete = cached.complete and len(entries) <= window
+        return CachedHistory(entries[-window:], complete)
+
+    def get(
+        self, store: "HistoryStore", user: str, character_name: str
+    ) -> CachedHistory:
+        """Return the cached recent entries, loading or refreshing them.
+
+        Loads run outside the lock, so one slow read does not hold up reads
+        of other characters. The result is only cached if the character's
+        version did not change during the load (an append, rotation or
+        prune); otherwise it is returned uncached and the next read loads
+        again.
+        """
+        key = self._key(store, user, character_name)
+        if settings.SOCKETIO_MESSAGE_QUEUE:
+            with self._lock:
+                cached = self._entries.get(key)
+            if (
+                cached is not None
+                and not cached.dirty
+                and store.version(user, character_name) != cached.version
+            ):
+                # Written by another process, possibly pruned too: reload.
+                self.invalidate(user, character_name)
+        with self._lock:
+            cached = self._entries.get(key)
+            if cached is not None and not cached.dirty:
+                self._entries.move_to_end(key)
+                self._counters["hits"] += 1
+                return cached
+            self._counters["misses" if cached is None else "catch_ups"] += 1
+        version = store.version(user, character_name)
+        fresh = None
+        if cached is not None:
+            fresh = self._catch_up(store, user, character_name, cached)
+        if fresh is None:
+            fresh = self._load(store, user, character_name)
+        if store.version(user, character_name) != version:
+            return fresh
+        fresh.version = version
+        with self._lock:
+            if self._entries.get(key) is cached:
+                self._entries[key] = fresh
+                self._entries.move_to_end(key)
+                self._evict()
+        return fresh
+
+    def _evict(self) -> None:
+        limit = self._max_entries()
+        total = sum(len(cached.entries) for cached in self._entries.values())
+        while total > limit and len(self._entries) > 1:
+            _, evicted = self._entries.popitem(last=False)
+            total -= len(evicted.entries)
+            self._counters["evictions"] += 1
+
+    def iter_reversed(
+        self,
+        store: "HistoryStore",
+        user: str,
+        character_name: str,
+        *,
+        end: Optional[int] = None,
+        senders: Optional[Iterable[str]] = None,
+    ) -> Iterator[LocatedEntry]:
+        """Yield ``(id, entry)`` newest first, from memory where possible."""
+        cached = self.get(store, user, character_name)
+        wanted = set(senders) if senders is not None else None
+        oldest = cached.entries[0][0] if cached.entries else None
+        for entry_id, entry in reversed(cached.entries):
+            if end is not None and entry_id >= end:
+                continue
+            if wanted is None or entry.get("sender") in wanted:
+                yield entry_id, entry
+        if cached.complete or oldest is None:
+            return
+        end = oldest if end is None else min(end, oldest)
+        yield from store.iter_reversed(user, character_name, end=end, senders=senders)
+
+    def iter_forward(
+        self,
+        store: "HistoryStore",
+        user: str,
+        character_name: str,
+        *,
+        after: Optional[int] = None,
+    ) -> Iterator[LocatedEntry]:
+        """Yield ``(id, entry)`` oldest first, from memory where possible."""
+        cached = self.get(store, user, character_name)
+        covered = cached.complete or (
+            after is not None and cached.entries and after >= cached.entries[0][0]
+        )
+        if not covered:
+            yield from store.iter_forward(user, character_name, after=after)
+            return
+        for entry_id, entry in cached.entries:
+            if after is None or entry_id > after:
+                yield entry_id, entry
+
+    def stats(self) -> Dict[str, Any]:
+        """Return hit/miss/eviction counters and the cache's current size."""
+        with self._lock:
+            counters: Dict[str, Any] = dict(self._counters)
+            counters["characters"] = len(self._entries)
+            counters["entries"] = sum(
+                len(cached.entries) for cached in self._entries.values()
+            )
+        lookups = counters["hits"] + counters["misses"] + counters["catch_ups"]
+        counters["hit_ratio"] = counters["hits"] / lookups if lookups else 0.0
+        return counters
+
+
+HISTORY_CACHE = HistoryCache()
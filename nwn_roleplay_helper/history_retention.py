@@ -0,0 +1,232 @@
+"""History retention policy and background pruning.
+
+The policy comes from settings (all limits are off when zero):
+
+- ``HISTORY_RETENTION_MAX_AGE_DAYS``: drop entries older than this.
+- ``HISTORY_RETENTION_MAX_ENTRIES``: keep at most this many per character.
+- ``HISTORY_RETENTION_AI_SYSTEM_DAYS``: drop ``ai``/``system`` entries older
+  than this.
+- ``HISTORY_RETENTION_USER_MAX_BYTES``: per-user disk budget. The oldest
+  history across a user's characters goes first.
+
+:data:`HISTORY_PRUNER` enforces the policy every
+``HISTORY_PRUNE_INTERVAL_SECONDS``. It works one character at a time,
+holding only that character's writer lock, so ingestion for everyone else
+carries on. The JSONL backend only prunes sealed segments and never touches
+the hot journal that appends go to.
+"""
+
+import datetime
+import logging
+import threading
+import time
+from typing import Any, Dict, Optional, Tuple
+
+from . import history, settings
+from .history_cache import HISTORY_CACHE
+from .history_search import SEARCH_INDEX
+from .history_writer import HISTORY_WRITER
+
+logger = logging.getLogger(__name__)
+
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+AI_SYSTEM_SENDERS = ("ai", "system")
+
+
+class RetentionPolicy:
+    """Limits the pruner enforces; zero disables a limit."""
+
+    def __init__(
+        self,
+        *,
+        max_age_days: float = 0,
+        max_entries: int = 0,
+        user_max_bytes: int = 0,
+        ai_system_days: float = 0,
+    ) -> None:
+        self.max_age_days = max_age_days
+        self.max_entries = max_entries
+        self.user_max_bytes = user_max_bytes
+        self.ai_system_days = ai_system_days
+
+    @classmethod
+    def from_settings(cls) -> "RetentionPolicy":
+        return cls(
+            max_age_days=settings.HISTORY_RETENTION_MAX_AGE_DAYS,
+            max_entries=settings.HISTORY_RETENTION_MAX_ENTRIES,
+            user_max_bytes=settings.HISTORY_RETENTION_USER_MAX_BYTES,
+            ai_system_days=settings.HISTORY_RETENTION_AI_SYSTEM_DAYS,
+        )
+
+    @property
+    def enabled(self) -> bool:
+        return any(
+            limit > 0
+            for limit in (
+                self.max_age_days,
+                self.max_entries,
+                self.user_max_bytes,
+                self.ai_system_days,
+            )
+        )
+
+
+def _cutoff(now: datetime.datetime, days: float) -> Optional[str]:
+    if days <= 0:
+        return None
+    return (now - datetime.timedelta(days=days)).strftime(TIMESTAMP_FORMAT)
+
+
+def _forget(user: str, character_name: str) -> None:
+    HISTORY_CACHE.invalidate(user, character_name)
+    SEARCH_INDEX.invalidate(user, character_name)
+
+
+def prune_history(
+    policy: RetentionPolicy,
+    *,
+    store: Optional[history.HistoryStore] = None,
+    now: Optional[datetime.datetime] = None,
+) -> Dict[str, Any]:
+    """Enforce ``policy`` once and report what was removed."""
+    store = store or history.get_store()
+    now = now or datetime.datetime.now()
+    started = time.perf_counter()
+    report: Dict[str, Any] = {
+        "started_at": now.isoformat(timespec="seconds"),
+        "characters": 0,
+        "entries_removed": 0,
+        "bytes_reclaimed": 0,
+    }
+    older_than = _cutoff(now, policy.max_age_days)
+    ai_older_than = _cutoff(now, policy.ai_system_days)
+    characters = store.characters()
+
+    for user, character_name in characters:
+        with HISTORY_WRITER.writer_lock(user, character_name):
+            removed, reclaimed = store.prune(
+                user,
+                character_name,
+                older_than=older_than,
+                drop_senders=AI_SYSTEM_SENDERS,
+                drop_senders_older_than=ai_older_than,
+                max_entries=policy.max_entries,
+            )
+        report["characters"] += 1
+        if removed:
+            _forget(user, character_name)
+            report["entries_removed"] += removed
+            report["bytes_reclaimed"] += reclaimed
+        # Let request handlers run between characters.
+        time.sleep(0)
+
+    if policy.user_max_bytes > 0:
+        for user in sorted({user for user, _ in characters}):
+            removed, reclaimed = _enforce_user_budget(store, user, policy)
+            report["entries_removed"] += removed
+            report["bytes_reclaimed"] += reclaimed
+
+    report["duration_ms"] = round((time.perf_counter() - started) * 1000, 2)
+    return report
+
+
+def _enforce_user_budget(
+    store: history.HistoryStore, user: str, policy: RetentionPolicy
+) -> Tuple[int, int]:
+    removed_total = reclaimed_total = 0
+    names = [name for owner, name in store.characters() if owner == user]
+    while True:
+        excess = store.user_bytes(user) - policy.user_max_bytes
+        if excess <= 0:
+            break
+        oldest = [
+            (timestamp, name)
+            for name in names
+            if (timestamp := store.oldest_timestamp(user, name)) is not None
+        ]
+        if not oldest:
+            logger.warning(
+                f"History for {user} is over its budget by {excess} bytes but "
+                "has nothing left that can be pruned"
+            )
+            break
+        _, name = min(oldest)
+        with HISTORY_WRITER.writer_lock(user, name):
+            removed, reclaimed = store.drop_oldest(user, name, excess)
+        if not removed:
+            break
+        _forget(user, name)
+        removed_total += removed
+        reclaimed_total += reclaimed
+        time.sleep(0)
+    return removed_total, reclaimed_total
+
+
+class HistoryPruner:
+    """Background thread that applies the retention policy periodically."""
+
+    def __init__(self, *, interval: Optional[float] = None) -> None:
+        self.interval = interval
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._stats: Dict[str, Any] = {
+            "runs": 0,
+            "errors": 0,
+            "entries_removed": 0,
+            "bytes_reclaimed": 0,
+            "last_run": None,
+        }
+
+    def start(self) -> bool:
+        """Start pruning in the background if any retention limit is set."""
+        if not RetentionPolicy.from_settings().enabled:
+            return False
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name="history-pruner", daemon=True
+                )
+                self._thread.start()
+        return True
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def run_once(self) -> Dict[str, Any]:
+        """Prune now with the current settings and record the report."""
+        report = prune_history(RetentionPolicy.from_settings())
+        with self._lock:
+            self._stats["runs"] += 1
+            self._stats["entries_removed"] += report["entries_removed"]
+            self._stats["bytes_reclaimed"] += report["bytes_reclaimed"]
+            self._stats["last_run"] = report
+        if report["entries_removed"]:
+            logger.info(
+                f"Pruned {report['entries_removed']} history entries "
+                f"({report['bytes_reclaimed']} bytes) from "
+                f"{report['characters']} characters in {report['duration_ms']} ms"
+            )
+        return report
+
+    def stats(self) -> Dict[str, Any]:
+        """Return run counts, totals and the last run's report."""
+        with self._lock:
+            stats = dict(self._stats)
+        stats["enabled"] = RetentionPolicy.from_settings().enabled
+        stats["running"] = self._thread is not None
+        return stats
+
+    def _run(self) -> None:
+        interval = self.interval or settings.HISTORY_PRUNE_INTERVAL_SECONDS
+        while not self._stop.is_set():
+            try:
+                self.run_once()
+            except Exception as e:
+                logger.error(f"History pruning failed: {e}")
+                with self._lock:
+                    self._stats["errors"] += 1
+            self._stop.wait(interval)
+
+
+HISTORY_PRUNER = HistoryPruner()
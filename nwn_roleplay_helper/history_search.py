@@ -0,0 +1,187 @@
+"""In-process full-text index over chat history.
+
+Used for the JSONL backend, and for SQLite builds without FTS5. Each
+character gets an inverted index (term -> {entry id: term frequency}) that
+is built on its first search. Later searches index only the entries whose
+ids come after the last indexed one, so keeping the index current costs one
+read of the journal tail. Results are ranked with BM25 and carry a short
+snippet with the matched terms wrapped in ``**``.
+
+Indexes are kept for the most recently searched characters only
+(``HISTORY_SEARCH_MAX_INDEXES``).
+"""
+
+import math
+import re
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from . import settings
+
+TOKEN_PATTERN = re.compile(r"\w+", re.UNICODE)
+SNIPPET_CONTEXT_CHARS = 60
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+LocatedEntry = Tuple[int, Dict[str, Any]]
+ForwardReader = Callable[[Optional[int]], Iterator[LocatedEntry]]
+
+
+def tokenize(text: str) -> List[str]:
+    """Split text into lowercase word tokens."""
+    return TOKEN_PATTERN.findall(text.lower())
+
+
+def make_snippet(message: str, terms: Iterable[str]) -> str:
+    """Return a window of ``message`` around the first match, terms in ``**``."""
+    wanted = set(terms)
+    matches = [
+        match
+        for match in TOKEN_PATTERN.finditer(message)
+        if match.group().lower() in wanted
+    ]
+    if not matches:
+        return message[: SNIPPET_CONTEXT_CHARS * 2]
+    start = max(0, matches[0].start() - SNIPPET_CONTEXT_CHARS)
+    end = min(len(message), matches[0].end() + SNIPPET_CONTEXT_CHARS)
+    parts = ["…" if start else ""]
+    position = start
+    for match in matches:
+        if match.end() > end:
+            break
+        parts.append(message[position : match.start()])
+        parts.append(f"**{match.group()}**")
+        position = match.end()
+    parts.append(message[position:end])
+    parts.append("…" if end < len(message) else "")
+    return "".join(parts)
+
+
+class CharacterIndex:
+    """Inverted index for one character's history."""
+
+    def __init__(self) -> None:
+        self.postings: Dict[str, Dict[int, int]] = {}
+        self.doc_lengths: Dict[int, int] = {}
+        self.entries: Dict[int, Tuple[str, str, str]] = {}
+        self.total_length = 0
+        self.indexed_until: Optional[int] = None
+        self.lock = threading.Lock()
+
+    def add(self, entry_id: int, entry: Dict[str, Any]) -> None:
+        message = entry.get("message") or ""
+        tokens = tokenize(message)
+        for token in tokens:
+            docs = self.postings.setdefault(token, {})
+            docs[entry_id] = docs.get(entry_id, 0) + 1
+        self.doc_lengths[entry_id] = len(tokens)
+        self.total_length += len(tokens)
+        self.entries[entry_id] = (
+            entry.get("timestamp") or "",
+            entry.get("sender") or "",
+            message,
+        )
+        self.indexed_until = entry_id
+
+    def catch_up(self, read_forward: ForwardReader) -> int:
+        """Index entries appended since the last catch-up; return how many."""
+        added = 0
+        for entry_id, entry in read_forward(self.indexed_until):
+            self.add(entry_id, entry)
+            added += 1
+        return added
+
+    def search(self, query: str, limit: int) -> List[Dict[str, Any]]:
+        """Return entries containing every query term, best BM25 score first."""
+        terms = list(dict.fromkeys(tokenize(query)))
+        if not terms or not self.doc_lengths:
+            return []
+        postings = [self.postings.get(term, {}) for term in terms]
+        if not all(postings):
+            return []
+        candidates = set.intersection(*(set(docs) for docs in postings))
+
+        count = len(self.doc_lengths)
+        average_length = self.total_length / count or 1.0
+        idf = [
+            math.log((count - len(docs) + 0.5) / (len(docs) + 0.5) + 1)
+            for docs in postings
+        ]
+        scored = []
+        for entry_id in candidates:
+            length_norm = (
+                1 - BM25_B + BM25_B * self.doc_lengths[entry_id] / average_length
+            )
+            score = 0.0
+            for term_idf, docs in zip(idf, postings):
+                tf = docs[entry_id]
+                score += term_idf * tf * (BM25_K1 + 1) / (tf + BM25_K1 * length_norm)
+            scored.append((score, entry_id))
+        # Ties go to the newest entry.
+        scored.sort(key=lambda item: (-item[0], -item[1]))
+
+        hits = []
+        for score, entry_id in scored[:limit]:
+            timestamp, sender, message = self.entries[entry_id]
+            hits.append(
+                {
+                    "id": entry_id,
+                    "timestamp": timestamp,
+                    "sender": sender,
+                    "message": message,
+                    "snippet": make_snippet(message, terms),
+                    "score": round(score, 4),
+                }
+            )
+        return hits
+
+
+class HistorySearchIndex:
+    """Per-character inverted indexes, most recently searched kept."""
+
+    def __init__(self) -> None:
+        self._indexes: "OrderedDict[Tuple[str, str, str], CharacterIndex]" = (
+            OrderedDict()
+        )
+        self._lock = threading.Lock()
+
+    def _index_for(self, key: Tuple[str, str, str]) -> CharacterIndex:
+        with self._lock:
+            index = self._indexes.get(key)
+            if index is None:
+                index = self._indexes[key] = CharacterIndex()
+            self._indexes.move_to_end(key)
+            while len(self._indexes) > max(settings.HISTORY_SEARCH_MAX_INDEXES, 1):
+                self._indexes.popitem(last=False)
+            return index
+
+    def search(
+        self,
+        namespace: str,
+        user: str,
+        character_name: str,
+        query: str,
+        *,
+        limit: int,
+        read_forward: ForwardReader,
+    ) -> List[Dict[str, Any]]:
+        """Catch the character's index up with ``read_forward`` and search it.
+
+        ``namespace`` separates indexes built from different backends.
+        """
+        key = (namespace, user, character_name.replace(" ", "_"))
+        index = self._index_for(key)
+        with index.lock:
+            index.catch_up(read_forward)
+            return index.search(query, limit)
+
+    def invalidate(self, user: str, character_name: str) -> None:
+        """Drop a character's indexes, e.g. after entries were removed."""
+        user_key = (user, character_name.replace(" ", "_"))
+        with self._lock:
+            for key in [k for k in self._indexes if k[1:] == user_key]:
+                del self._indexes[key]
+
+
+SEARCH_INDEX = HistorySearchIndex()
@@ -0,0 +1,241 @@
+"""Sharded write-behind buffer for chat history appends.
+
+Every history write (HTTP and Socket.IO log updates, AI replies,
+translations) goes through :data:`HISTORY_WRITER`, so nothing else does a
+read-modify-write on a character's history. Characters are spread over
+``HISTORY_WRITER_SHARDS`` shards by a stable hash. Each shard has its own
+lock and flusher thread and is the only writer for its characters, so
+batches for one character are written in the order they were accepted.
+Shards flush independently, so throughput grows with the number of active
+characters.
+
+Within a batch the journal append is a single ``O_APPEND`` write (or one
+SQLite transaction). Files that are rewritten instead (migrations,
+manifests, sealed segments) are written to a temporary file and renamed
+into place, so a crash never leaves a half-written file.
+
+Readers call :meth:`HistoryWriteBuffer.flush` for the character they are
+about to read so they always see every accepted entry.
+"""
+
+import atexit
+import logging
+import threading
+import time
+import zlib
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from . import history
+from .settings import (
+    HISTORY_FLUSH_INTERVAL_SECONDS,
+    HISTORY_FLUSH_MAX_ENTRIES,
+    HISTORY_WRITER_SHARDS,
+)
+
+logger = logging.getLogger(__name__)
+
+HistoryKey = Tuple[str, str]
+
+
+class _Shard:
+    """Pending batches and the flusher for a subset of characters."""
+
+    def __init__(self, index: int) -> None:
+        self.index = index
+        self.pending: Dict[HistoryKey, List[Dict[str, Any]]] = {}
+        self.depth = 0
+        # lock guards the pending map; flush_lock makes this shard the single
+        # writer for its characters, so their batches land in order.
+        self.lock = threading.Lock()
+        self.flush_lock = threading.Lock()
+        self.wake = threading.Event()
+        self.thread: Optional[threading.Thread] = None
+
+
+class HistoryWriteBuffer:
+    """Buffer history entries per character and flush them in batches."""
+
+    def __init__(
+        self,
+        *,
+        max_entries: int = HISTORY_FLUSH_MAX_ENTRIES,
+        interval: float = HISTORY_FLUSH_INTERVAL_SECONDS,
+        shards: int = HISTORY_WRITER_SHARDS,
+        append_func: Optional[Callable[[str, str, List[Dict[str, Any]]], int]] = None,
+    ) -> None:
+        self.max_entries = max_entries
+        self.interval = interval
+        self._append = append_func or history.append_entries
+        self._shards = [_Shard(index) for index in range(max(shards, 1))]
+        self._start_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._closed = False
+        self._counters = {
+            "entries_enqueued": 0,
+            "entries_written": 0,
+            "bytes_written": 0,
+            "flushes": 0,
+            "flush_errors": 0,
+            "max_buffer_depth": 0,
+            "last_flush_ms": 0.0,
+            "max_flush_ms": 0.0,
+            "total_flush_ms": 0.0,
+        }
+
+    @staticmethod
+    def _key(user: str, character_name: str) -> HistoryKey:
+        # Key by the name as it maps to storage, so both spellings of a
+        # character share one writer and one pending buffer.
+        return user, character_name.replace(" ", "_")
+
+    def shard_for(self, user: str, character_name: str) -> int:
+        """Return the shard index that owns a character."""
+        name = "\0".join(self._key(user, character_name))
+        return zlib.crc32(name.encode("utf-8")) % len(self._shards)
+
+    def writer_lock(self, user: str, character_name: str) -> threading.Lock:
+        """Return the lock that makes a shard the single writer for a character.
+
+        Maintenance jobs that rewrite a character's history hold it so their
+        changes never interleave with a flush.
+        """
+        return self._shards[self.shard_for(user, character_name)].flush_lock
+
+    def start(self) -> None:
+        """Start the shard flushers that are not running."""
+        with self._start_lock:
+            if self._closed:
+                return
+            for shard in self._shards:
+                if shard.thread is None:
+                    shard.thread = threading.Thread(
+                        target=self._run,
+                        args=(shard,),
+                        name=f"history-writer-{shard.index}",
+                        daemon=True,
+                    )
+                    shard.thread.start()
+
+    def enqueue(
+        self, user: str, character_name: str, entries: List[Dict[str, Any]]
+    ) -> None:
+        """Queue entries for a character's history."""
+        if not entries:
+            return
+        key = self._key(user, character_name)
+        shard = self._shards[self.shard_for(user, character_name)]
+        if self._closed:
+            # Late writers after shutdown go straight to disk, still through
+            # the shard's single-writer lock.
+            with shard.flush_lock:
+                self._write(key, list(entries))
+            return
+        if shard.thread is None:
+            self.start()
+        with shard.lock:
+            pending = shard.pending.setdefault(key, [])
+            pending.extend(entries)
+            shard.depth += len(entries)
+            full = len(pending) >= self.max_entries
+        with self._stats_lock:
+            self._counters["entries_enqueued"] += len(entries)
+            self._counters["max_buffer_depth"] = max(
+                self._counters["max_buffer_depth"],
+                sum(s.depth for s in self._shards),
+            )
+        if full:
+            shard.wake.set()
+
+    def flush(
+        self, user: Optional[str] = None, character_name: Optional[str] = None
+    ) -> int:
+        """Write pending entries to disk and return the bytes written.
+
+        With a user and character only that character is flushed; otherwise
+        every pending character is.
+        """
+        if user is not None and character_name is not None:
+            shard = self._shards[self.shard_for(user, character_name)]
+            return self._flush_shard(shard, self._key(user, character_name))
+        return sum(self._flush_shard(shard) for shard in self._shards)
+
+    def _flush_shard(self, shard: _Shard, key: Optional[HistoryKey] = None) -> int:
+        written = 0
+        with shard.flush_lock:
+            with shard.lock:
+                if key is not None:
+                    batches = (
+                        [(key, shard.pending.pop(key))] if key in shard.pending else []
+                    )
+                else:
+                    batches = list(shard.pending.items())
+                    shard.pending.clear()
+                shard.depth -= sum(len(entries) for _, entries in batches)
+            for batch_key, entries in batches:
+                written += self._write(batch_key, entries)
+        return written
+
+    def close(self) -> None:
+        """Stop the flushers and write everything still buffered."""
+        self._closed = True
+        for shard in self._shards:
+            shard.wake.set()
+        for shard in self._shards:
+            thread = shard.thread
+            if thread is not None and thread is not threading.current_thread():
+                thread.join(timeout=max(self.interval, 1.0) * 5)
+        self.flush()
+
+    def stats(self) -> Dict[str, Any]:
+        """Return flush latency, buffer depth and write counters."""
+        with self._stats_lock:
+            counters: Dict[str, Any] = dict(self._counters)
+        shard_depths = []
+        buffered_characters = 0
+        for shard in self._shards:
+            with shard.lock:
+                shard_depths.append(shard.depth)
+                buffered_characters += len(shard.pending)
+        counters["buffer_depth"] = sum(shard_depths)
+        counters["buffered_characters"] = buffered_characters
+        counters["shards"] = len(self._shards)
+        counters["shard_depths"] = shard_depths
+        flushes = counters["flushes"]
+        counters["avg_flush_ms"] = (
+            counters["total_flush_ms"] / flushes if flushes else 0.0
+        )
+        return counters
+
+    def _write(self, key: HistoryKey, entries: List[Dict[str, Any]]) -> int:
+        started = time.perf_counter()
+        try:
+            written = self._append(key[0], key[1], entries)
+        except Exception as e:
+            logger.error(f"Error flushing chat history for {key[0]}/{key[1]}: {e}")
+            with self._stats_lock:
+                self._counters["flush_errors"] += 1
+            return 0
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        with self._stats_lock:
+            self._counters["flushes"] += 1
+            self._counters["entries_written"] += len(entries)
+            self._counters["bytes_written"] += written
+            self._counters["last_flush_ms"] = elapsed_ms
+            self._counters["total_flush_ms"] += elapsed_ms
+            self._counters["max_flush_ms"] = max(
+                self._counters["max_flush_ms"], elapsed_ms
+            )
+        return written
+
+    def _run(self, shard: _Shard) -> None:
+        while not self._closed:
+            shard.wake.wait(self.interval)
+            shard.wake.clear()
+            try:
+                self._flush_shard(shard)
+            except Exception as e:
+                logger.error(f"History flusher {shard.index} error: {e}")
+
+
+HISTORY_WRITER = HistoryWriteBuffer()
+atexit.register(HISTORY_WRITER.close)
@@ -0,0 +1,312 @@
+"""Streaming bulk ingestion for the log client.
+
+``POST /api/log_update/bulk`` takes a large backlog of log lines, e.g. after
+the client reconnects. The body is either plain text (one log line per
+line) or NDJSON (``application/x-ndjson``), optionally gzip-compressed
+(``Content-Encoding: gzip``). Each NDJSON record is a JSON string, or an
+object with a ``line`` field.
+
+The body is decompressed and split into lines as it is read, and the lines
+are processed in batches of ``INGEST_BULK_BATCH_LINES``, so the payload is
+never held in memory as a whole.
+
+Resent lines are dropped by :data:`INGESTION_TRACKER`. Clients number their
+lines: ``seq`` is the number of the first line of an update (or a ``seq``
+field on each NDJSON record), and ``stream`` names the numbering, e.g. one
+per client run. The tracker keeps each client's highest accepted number and
+skips anything at or below it. Queued updates go through
+:meth:`IngestionTracker.accepting`, which moves the mark only after the
+lines have been processed, so an update whose processing failed can be
+resent. Lines without numbers are kept, unless the lossy content check is
+turned on with ``INGEST_DEDUP_WINDOW``: then a line is skipped when the same
+text arrived in the client's last ``INGEST_DEDUP_WINDOW`` lines within
+``INGEST_DEDUP_WINDOW_SECONDS``.
+"""
+
+import gzip
+import hashlib
+import io
+import json
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from itertools import islice
+from typing import (
+    IO,
+    Any,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Tuple,
+)
+
+from . import settings
+
+NumberedLine = Tuple[Optional[int], str]
+MAX_TRACKED_CLIENTS = 1024
+
+NDJSON_CONTENT_TYPES = ("application/x-ndjson", "application/jsonl")
+
+
+class BulkPayloadError(ValueError):
+    """The bulk body could not be read."""
+
+
+class PayloadTooLarge(BulkPayloadError):
+    """The decompressed body exceeded ``INGEST_BULK_MAX_BYTES``."""
+
+
+class _CappedReader(io.RawIOBase):
+    """Read from ``stream`` but fail once more than ``limit`` bytes come out."""
+
+    def __init__(self, stream: IO[bytes], limit: int) -> None:
+        self._stream = stream
+        self._remaining = limit
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer: Any) -> int:
+        data = self._stream.read(len(buffer))
+        if self._remaining >= 0:
+            self._remaining -= len(data)
+            if self._remaining < 0:
+                raise PayloadTooLarge("Bulk payload is too large")
+        buffer[: len(data)] = data
+        return len(data)
+
+
+def _record_line(record: Any) -> NumberedLine:
+    if isinstance(record, str):
+        return None, record
+    if isinstance(record, dict) and isinstance(record.get("line"), str):
+        seq = record.get("seq")
+        if seq is not None and (isinstance(seq, bool) or not isinstance(seq, int)):
+            raise BulkPayloadError("NDJSON seq must be an integer")
+        return seq, record["line"]
+    raise BulkPayloadError("NDJSON records must be strings or objects with a line")
+
+
+def iter_bulk_lines(
+    stream: IO[bytes],
+    *,
+    content_type: str = "",
+    content_encoding: str = "",
+    seq: Optional[int] = None,
+) -> Iterator[NumberedLine]:
+    """Yield ``(seq, line)`` from a bulk request body as it is read.
+
+    Plain-text lines are numbered from ``seq`` when it is given; NDJSON
+    records carry their own numbers.
+    """
+    if content_encoding.strip().lower() in ("gzip", "x-gzip"):
+        stream = gzip.GzipFile(fileobj=stream, mode="rb")
+    elif content_encoding.strip().lower() not in ("", "identity"):
+        raise BulkPayloadError(f"Unsupported content encoding: {content_encoding}")
+    limit = settings.INGEST_BULK_MAX_BYTES
+    reader = io.BufferedReader(_CappedReader(stream, limit if limit > 0 else -1))
+    text = io.TextIOWrapper(reader, encoding="utf-8", errors="replace", newline="")
+    ndjson = content_type.split(";")[0].strip().lower() in NDJSON_CONTENT_TYPES
+    try:
+        for raw in text:
+            raw = raw.rstrip("\r\n")
+            if not raw.strip():
+                continue
+            if not ndjson:
+                yield seq, raw
+                if seq is not None:
+                    seq += 1
+                continue
+            try:
+                record = json.loads(raw)
+            except json.JSONDecodeError as e:
+                raise BulkPayloadError(f"Invalid NDJSON record: {e}") from e
+            yield _record_line(record)
+    except (OSError, EOFError) as e:
+        # gzip reports corrupt or truncated bodies this way.
+        raise BulkPayloadError(f"Could not decompress bulk payload: {e}") from e
+
+
+def parse_seq(value: Any) -> Optional[int]:
+    """Return a client-supplied sequence number, or ``None`` if absent."""
+    if value is None or value == "":
+        return None
+    if isinstance(value, bool):
+        raise ValueError("seq must be an integer")
+    seq = int(value)
+    if seq < 0:
+        raise ValueError("seq must not be negative")
+    return seq
+
+
+def check_lines(lines: Any) -> List[str]:
+    """Return ``lines`` if it is a list of strings, else raise ``ValueError``.
+
+    Updates are checked before they are queued, so a malformed one is
+    refused up front instead of failing in an ingestion worker.
+    """
+    if not isinstance(lines, list):
+        raise ValueError("lines must be a string or a list of strings")
+    if not all(isinstance(line, str) for line in lines):
+        raise ValueError("lines must be strings")
+    return lines
+
+
+def numbered(lines: Iterable[str], seq: Optional[int]) -> Iterator[NumberedLine]:
+    """Pair ``lines`` with consecutive numbers from ``seq`` (or ``None``)."""
+    if seq is None:
+        return ((None, line) for line in lines)
+    return enumerate(lines, seq)
+
+
+def _digest(line: str) -> bytes:
+    return hashlib.blake2b(line.encode("utf-8"), digest_size=16).digest()
+
+
+class _ClientProgress:
+    __slots__ = ("stream", "high_water", "recent")
+
+    def __init__(self, stream: Optional[str]) -> None:
+        self.stream = stream
+        self.high_water: Optional[int] = None
+        # Digest -> arrival time of recent unnumbered lines, oldest first.
+        self.recent: "OrderedDict[bytes, float]" = OrderedDict()
+
+
+class IngestionTracker:
+    """Drop log lines a client has already delivered."""
+
+    def __init__(self) -> None:
+        self._clients: "OrderedDict[str, _ClientProgress]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._counters = {
+            "accepted": 0,
+            "skipped_seq": 0,
+            "skipped_hash": 0,
+            "stream_resets": 0,
+        }
+
+    def _progress(self, client: str, stream: Optional[str]) -> _ClientProgress:
+        progress = self._clients.get(client)
+        if progress is None or progress.stream != stream:
+            if progress is not None:
+                self._counters["stream_resets"] += 1
+            progress = self._clients[client] = _ClientProgress(stream)
+        self._clients.move_to_end(client)
+        while len(self._clients) > MAX_TRACKED_CLIENTS:
+            self._clients.popitem(last=False)
+        return progress
+
+    @contextmanager
+    def accepting(
+        self,
+        client: str,
+        lines: Iterable[NumberedLine],
+        *,
+        stream: Optional[str] = None,
+    ) -> Iterator[List[str]]:
+        """Yield the unseen lines of ``(seq, line)`` pairs as a list.
+
+        The lines are only recorded as delivered when the ``with`` block
+        finishes without raising. If processing fails, the client can resend
+        the update and it is processed again.
+
+        An update numbered consecutively (as :func:`numbered` and plain-text
+        bulk bodies are) is cut against the high-water mark in one slice.
+        Unnumbered lines are only compared with earlier updates, so a line
+        repeated within one update is kept.
+        """
+        pairs = list(lines)
+        first = pairs[0][0] if pairs else None
+        consecutive = first is not None and [seq for seq, _ in pairs] == list(
+            range(first, first + len(pairs))
+        )
+        window = settings.INGEST_DEDUP_WINDOW
+        digests: List[Optional[bytes]] = []
+        if not consecutive and window > 0:
+            digests = [
+                None if seq is not None else _digest(line) for seq, line in pairs
+            ]
+        seen_now: List[bytes] = []
+        with self._lock:
+            progress = self._progress(client, stream)
+            last = progress.high_water
+            if consecutive:
+                skip = 0 if last is None else min(max(last - first + 1, 0), len(pairs))
+                selected = [line for _, line in pairs[skip:]]
+                if selected:
+                    last = first + len(pairs) - 1
+                self._counters["skipped_seq"] += skip
+            else:
+                selected = []
+                cutoff = time.monotonic() - settings.INGEST_DEDUP_WINDOW_SECONDS
+                for index, (seq, line) in enumerate(pairs):
+                    if seq is not None:
+                        if last is not None and seq <= last:
+                            self._counters["skipped_seq"] += 1
+                            continue
+                        last = seq
+                    elif digests:
+                        digest = digests[index]
+                        arrived = progress.recent.get(digest)
+                        if arrived is not None and arrived >= cutoff:
+                            self._counters["skipped_hash"] += 1
+                            continue
+                        seen_now.append(digest)
+                    selected.append(line)
+            self._counters["accepted"] += len(selected)
+        yield selected
+        if last is not None:
+            with self._lock:
+                progress = self._progress(client, stream)
+                if progress.high_water is None or last > progress.high_water:
+                    progress.high_water = last
+        self._remember(client, stream, seen_now)
+
+    def _remember(
+        self, client: str, stream: Optional[str], digests: List[bytes]
+    ) -> None:
+        window = settings.INGEST_DEDUP_WINDOW
+        if not digests or window <= 0:
+            return
+        now = time.monotonic()
+        with self._lock:
+            recent = self._progress(client, stream).recent
+            for digest in digests[-window:]:
+                recent[digest] = now
+                recent.move_to_end(digest)
+            while len(recent) > window:
+                recent.popitem(last=False)
+
+    def high_water(self, client: str) -> Optional[int]:
+        """Return the highest sequence number accepted from ``client``."""
+        with self._lock:
+            progress = self._clients.get(client)
+            return progress.high_water if progress else None
+
+    def reset(self) -> None:
+        with self._lock:
+            self._clients.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """Return accepted/skipped line counters and tracked clients."""
+        with self._lock:
+            counters: Dict[str, Any] = dict(self._counters)
+            counters["clients"] = {
+                client: progress.high_water
+                for client, progress in self._clients.items()
+            }
+        return counters
+
+
+INGESTION_TRACKER = IngestionTracker()
+
+
+def batched(lines: Iterable[str], size: int) -> Iterator[List[str]]:
+    """Group ``lines`` into lists of at most ``size``."""
+    iterator = iter(lines)
+    while batch := list(islice(iterator, max(size, 1))):
+        yield batch
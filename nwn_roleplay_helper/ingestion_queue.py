@@ -0,0 +1,195 @@
+"""Bounded queue between the log_update handlers and the chat pipeline.
+
+The HTTP and Socket.IO ``log_update`` handlers only validate an update and
+queue it, then acknowledge straight away. Worker threads (greenlets under
+eventlet) then do the parsing, history writes and Socket.IO fan-out.
+Clients are spread over ``INGEST_WORKERS`` workers by a stable hash. Each
+worker has its own queue, so a client's updates are processed in the order
+they arrived.
+
+Each worker queue holds at most ``INGEST_QUEUE_MAX_DEPTH`` updates. When a
+client's queue is full, :meth:`IngestionQueue.submit` refuses the update,
+and the handler tells the client to retry after
+``INGEST_RETRY_AFTER_SECONDS`` (HTTP 503 with ``Retry-After``, or a negative
+Socket.IO ack). Queue depth and lag are reported by
+:meth:`IngestionQueue.stats`.
+"""
+
+import atexit
+import logging
+import queue
+import threading
+import time
+import zlib
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from . import settings
+
+logger = logging.getLogger(__name__)
+
+Job = Callable[[], Any]
+
+
+class _Worker:
+    """One queue and the thread that drains it."""
+
+    def __init__(self, index: int, max_depth: int) -> None:
+        self.index = index
+        self.queue: "queue.Queue[Optional[Tuple[float, Job]]]" = queue.Queue(
+            maxsize=max(max_depth, 1)
+        )
+        self.thread: Optional[threading.Thread] = None
+
+
+class IngestionQueue:
+    """Per-client FIFO queues drained by a fixed pool of workers."""
+
+    def __init__(
+        self, *, workers: Optional[int] = None, max_depth: Optional[int] = None
+    ) -> None:
+        workers = workers if workers is not None else settings.INGEST_WORKERS
+        if max_depth is None:
+            max_depth = settings.INGEST_QUEUE_MAX_DEPTH
+        self.max_depth = max_depth
+        self._workers = [_Worker(index, max_depth) for index in range(max(workers, 1))]
+        self._start_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._closed = False
+        self._counters = {
+            "submitted": 0,
+            "processed": 0,
+            "rejected": 0,
+            "errors": 0,
+            "last_lag_ms": 0.0,
+            "max_lag_ms": 0.0,
+            "last_job_ms": 0.0,
+            "max_job_ms": 0.0,
+        }
+
+    def worker_for(self, client: str) -> int:
+        """Return the index of the worker that owns a client."""
+        return zlib.crc32(client.encode("utf-8")) % len(self._workers)
+
+    def start(self) -> None:
+        """Start the workers that are not running."""
+        with self._start_lock:
+            if self._closed:
+                return
+            for worker in self._workers:
+                if worker.thread is None:
+                    worker.thread = threading.Thread(
+                        target=self._run,
+                        args=(worker,),
+                        name=f"ingestion-worker-{worker.index}",
+                        daemon=True,
+                    )
+                    worker.thread.start()
+
+    def submit(self, client: str, job: Job, *, timeout: Optional[float] = None) -> bool:
+        """Queue ``job`` for ``client``; return False if its queue stays full.
+
+        Without a timeout a full queue is refused immediately.
+        """
+        worker = self._workers[self.worker_for(client)]
+        if self._closed:
+            self._execute(time.monotonic(), job)
+            return True
+        if worker.thread is None:
+            self.start()
+        try:
+            worker.queue.put(
+                (time.monotonic(), job), block=timeout is not None, timeout=timeout
+            )
+        except queue.Full:
+            with self._stats_lock:
+                self._counters["rejected"] += 1
+            return False
+        with self._stats_lock:
+            self._counters["submitted"] += 1
+        return True
+
+    def drain(self) -> None:
+        """Block until every queued job has been processed."""
+        for worker in self._workers:
+            if worker.thread is None:
+                self._process_pending(worker)
+            else:
+                worker.queue.join()
+
+    def close(self) -> None:
+        """Stop the workers after they finish what is already queued."""
+        with self._start_lock:
+            self._closed = True
+        for worker in self._workers:
+            if worker.thread is not None:
+                try:
+                    worker.queue.put_nowait(None)
+                except queue.Full:
+                    # The worker sees the closed flag after its current job;
+                    # what is left is processed below.
+                    pass
+        for worker in self._workers:
+            thread = worker.thread
+            if thread is not None and thread is not threading.current_thread():
+                thread.join(timeout=5)
+            self._process_pending(worker)
+
+    def retry_after(self) -> int:
+        """Seconds a refused client should wait before resending."""
+        return max(int(settings.INGEST_RETRY_AFTER_SECONDS), 1)
+
+    def stats(self) -> Dict[str, Any]:
+        """Return queue depths, lag and job counters."""
+        with self._stats_lock:
+            counters: Dict[str, Any] = dict(self._counters)
+        depths: List[int] = [worker.queue.qsize() for worker in self._workers]
+        counters["depth"] = sum(depths)
+        counters["worker_depths"] = depths
+        counters["workers"] = len(self._workers)
+        counters["max_depth"] = self.max_depth
+        return counters
+
+    def _process_pending(self, worker: _Worker) -> None:
+        while True:
+            try:
+                item = worker.queue.get_nowait()
+            except queue.Empty:
+                return
+            try:
+                if item is not None:
+                    self._execute(*item)
+            finally:
+                worker.queue.task_done()
+
+    def _execute(self, enqueued_at: float, job: Job) -> None:
+        started = time.monotonic()
+        try:
+            job()
+        except Exception as e:
+            logger.error(f"Error processing queued log update: {e}")
+            with self._stats_lock:
+                self._counters["errors"] += 1
+        lag_ms = (started - enqueued_at) * 1000
+        job_ms = (time.monotonic() - started) * 1000
+        with self._stats_lock:
+            self._counters["processed"] += 1
+            self._counters["last_lag_ms"] = lag_ms
+            self._counters["max_lag_ms"] = max(self._counters["max_lag_ms"], lag_ms)
+            self._counters["last_job_ms"] = job_ms
+            self._counters["max_job_ms"] = max(self._counters["max_job_ms"], job_ms)
+
+    def _run(self, worker: _Worker) -> None:
+        while True:
+            item = worker.queue.get()
+            try:
+                if item is None:
+                    return
+                self._execute(*item)
+            finally:
+                worker.queue.task_done()
+            if self._closed:
+                return
+
+
+INGESTION_QUEUE = IngestionQueue()
+atexit.register(INGESTION_QUEUE.close)
@@ -0,0 +1,62 @@
+"""Socket.IO message queue for running several app processes.
+
+With ``SOCKETIO_MESSAGE_QUEUE`` set, every process publishes its emits to
+the queue and delivers the ones for its own sockets, so an event emitted
+in one process reaches users connected to another. Any URL Flask-SocketIO
+supports works (``redis://``, ``amqp://`` and other kombu URLs; the client
+library has to be installed). ``local://`` selects
+:class:`LocalPubSubManager`, an in-process stand-in used by the tests and
+for trying a multi-server setup without a broker.
+"""
+
+import queue
+import threading
+from typing import Any, Dict, List
+
+import socketio
+
+LOCAL_SCHEME = "local://"
+
+
+class LocalPubSubManager(socketio.PubSubManager):
+    """Pub/sub client manager whose "broker" is shared memory.
+
+    Servers in the same process that use the same channel see each other's
+    emits, room changes and disconnects exactly as they would through Redis.
+    """
+
+    name = "local"
+    _channels: Dict[str, List["queue.Queue[Any]"]] = {}
+    _channels_lock = threading.Lock()
+
+    def __init__(
+        self, channel: str = "socketio", write_only: bool = False, logger=None
+    ):
+        super().__init__(channel=channel, write_only=write_only, logger=logger)
+        self._inbox: "queue.Queue[Any]" = queue.Queue()
+        if not write_only:
+            with self._channels_lock:
+                self._channels.setdefault(channel, []).append(self._inbox)
+
+    def _publish(self, data: Any) -> None:
+        with self._channels_lock:
+            inboxes = list(self._channels.get(self.channel, ()))
+        for inbox in inboxes:
+            inbox.put(data)
+
+    def _listen(self):
+        while True:
+            yield self._inbox.get()
+
+
+def socketio_queue_options(url: str, channel: str) -> Dict[str, Any]:
+    """Return the ``SocketIO(...)`` keyword arguments for a message queue URL."""
+    if not url:
+        return {}
+    if url.startswith(LOCAL_SCHEME):
+        return {
+            "client_manager": LocalPubSubManager(
+                channel=url[len(LOCAL_SCHEME) :] or channel
+            )
+        }
+    return {"message_queue": url, "channel": channel}
@@ -0,0 +1,128 @@
+"""Import the JSON data directories into the SQLite backend.
+
+Usage::
+
+    python -m nwn_roleplay_helper.migrate_sqlite [--db nwn_persona.db]
+
+Users, chat history (legacy JSON arrays, journals and compressed segments)
+and feedback entries are copied into the database. For each character the
+rows already in the database are taken to be the first ones of its source
+files, and the import resumes after them, so re-running the command after
+an interrupted import only fills in what is missing. Run it before the app
+writes to the database. The source files stay in
+place (legacy ``chat_history.json`` arrays are converted to journals first,
+as the app itself would do). Entry ids change, so clients start paging from
+the newest entries again.
+"""
+
+import argparse
+import glob
+import json
+import logging
+import os
+from itertools import islice
+from typing import Dict, List, Optional
+
+from . import history, settings
+from .sqlite_store import SqliteStore
+from .storage import load_users_file
+
+logger = logging.getLogger(__name__)
+
+IMPORT_BATCH_SIZE = 5000
+
+
+def _subdirs(path: str) -> List[str]:
+    if not os.path.isdir(path):
+        return []
+    return sorted(
+        name for name in os.listdir(path) if os.path.isdir(os.path.join(path, name))
+    )
+
+
+def import_users(store: SqliteStore) -> int:
+    """Merge ``users.json`` into the users table."""
+    users = store.load_users()
+    imported = 0
+    for username, password in load_users_file().items():
+        if username not in users:
+            users[username] = password
+            imported += 1
+    store.save_users(users)
+    return imported
+
+
+def import_history(store: SqliteStore) -> int:
+    """Copy every character journal into the history table."""
+    imported = 0
+    for user in _subdirs(settings.CHAT_HISTORY_DIR):
+        for character_key in _subdirs(os.path.join(settings.CHAT_HISTORY_DIR, user)):
+            done = store.entry_count(user, character_key)
+            if done:
+                logger.info(f"Resuming {user}/{character_key} after {done} entries")
+            source = history.JsonlHistoryStore().iter_forward(user, character_key)
+            batch = []
+            for _, entry in islice(source, done, None):
+                batch.append(entry)
+                if len(batch) >= IMPORT_BATCH_SIZE:
+                    store.append_entries(user, character_key, batch)
+                    imported += len(batch)
+                    batch = []
+            store.append_entries(user, character_key, batch)
+            imported += len(batch)
+    return imported
+
+
+def import_feedback(store: SqliteStore) -> int:
+    """Copy the per-response feedback files into the feedback table."""
+    imported = 0
+    for user in _subdirs(settings.FEEDBACK_DIR):
+        for character_key in _subdirs(os.path.join(settings.FEEDBACK_DIR, user)):
+            done = store.feedback_summary(user, character_key)["total_responses"]
+            pattern = os.path.join(
+                settings.FEEDBACK_DIR, user, character_key, "feedback_*.json"
+            )
+            for feedback_file in sorted(glob.glob(pattern)):
+                try:
+                    with open(feedback_file, "r", encoding="utf-8") as f:
+                        entry = json.load(f)
+                except Exception as e:
+                    logger.error(f"Error reading feedback {feedback_file}: {e}")
+                    continue
+                if done:
+                    done -= 1
+                    continue
+                store.add_feedback(user, character_key, entry)
+                imported += 1
+    return imported
+
+
+def migrate(db_path: str) -> Dict[str, int]:
+    """Import users, history and feedback into ``db_path``."""
+    store = SqliteStore(db_path)
+    return {
+        "users": import_users(store),
+        "history_entries": import_history(store),
+        "feedback_entries": import_feedback(store),
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--db",
+        default=settings.SQLITE_DB_PATH,
+        help="SQLite database to create or extend (default: %(default)s)",
+    )
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s %(message)s")
+
+    counts = migrate(args.db)
+    logger.info(
+        f"Imported {counts['users']} users, {counts['history_entries']} history "
+        f"entries and {counts['feedback_entries']} feedback entries into {args.db}"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+"""Per-mode routing of incoming chat lines.
+
+Every parsed line is routed by its chat mode (``Talk``, ``Party``,
+``Whisper``, ``Tell``, ``Shout``, ``DM``, any other bracketed mode as ``*``,
+and lines outside the chat format as ``unparsed``). The route decides
+whether the line is persisted to the character's history, broadcast to
+browsers, or dropped before any of that work is done.
+
+Routes default to :data:`DEFAULT_ROUTES` and can be overridden with
+``INGEST_MODE_ROUTES``, e.g. ``Shout=drop;Party=persist+broadcast``. The
+setting is parsed once, when :data:`MODE_ROUTER` is created, so an invalid
+value stops the app at startup instead of failing every ingested batch.
+"""
+
+import threading
+from collections import Counter
+from dataclasses import dataclass
+from typing import Any, Dict, Optional, Tuple
+
+from . import settings
+from .chat_parser import ParsedLine
+
+UNPARSED = "unparsed"
+OTHER = "*"
+
+DEFAULT_ROUTES = {
+    "Talk": "persist+broadcast",
+    "Party": "persist",
+    "Whisper": "persist",
+    "Tell": "persist",
+    "Shout": "persist",
+    "DM": "persist",
+    OTHER: "persist",
+    # Combat rolls, skill checks and other game feedback.
+    UNPARSED: "drop",
+}
+
+
+@dataclass(frozen=True, slots=True)
+class ModeRoute:
+    persist: bool
+    broadcast: bool
+
+    @property
+    def dropped(self) -> bool:
+        return not (self.persist or self.broadcast)
+
+
+def parse_route(spec: str) -> ModeRoute:
+    """Parse ``persist``, ``broadcast``, ``persist+broadcast`` or ``drop``."""
+    actions = {action.strip().lower() for action in spec.split("+")}
+    unknown = actions - {"persist", "broadcast", "drop"}
+    if unknown or ("drop" in actions and len(actions) > 1):
+        raise ValueError(f"Invalid mode route: {spec!r}")
+    return ModeRoute(persist="persist" in actions, broadcast="broadcast" in actions)
+
+
+def parse_routes(overrides: str) -> Dict[str, ModeRoute]:
+    """Return the default routes with ``Mode=route;...`` overrides applied."""
+    specs = dict(DEFAULT_ROUTES)
+    for item in overrides.replace(",", ";").split(";"):
+        if not item.strip():
+            continue
+        mode, sep, spec = item.partition("=")
+        if not sep:
+            raise ValueError(f"Invalid mode route: {item!r}")
+        specs[mode.strip()] = spec
+    return {mode: parse_route(spec) for mode, spec in specs.items()}
+
+
+class ModeRouter:
+    """Look up a line's route and count what happened to each mode."""
+
+    def __init__(self, overrides: Optional[str] = None) -> None:
+        """Parse ``overrides`` (default ``INGEST_MODE_ROUTES``); raise ValueError."""
+        if overrides is None:
+            overrides = settings.INGEST_MODE_ROUTES
+        self._routes = parse_routes(overrides)
+        self._lock = threading.Lock()
+        self._counts: Dict[str, Counter] = {}
+
+    def routes(self) -> Dict[str, ModeRoute]:
+        return self._routes
+
+    @staticmethod
+    def mode_of(parsed: ParsedLine) -> str:
+        return parsed.mode if parsed.mode is not None else UNPARSED
+
+    def route(self, mode: str) -> ModeRoute:
+        routes = self.routes()
+        return routes.get(mode) or routes[OTHER]
+
+    def record(self, counts: Dict[Tuple[str, str], int]) -> None:
+        """Add a batch's ``{(mode, outcome): count}`` to the totals."""
+        with self._lock:
+            for (mode, outcome), count in counts.items():
+                self._counts.setdefault(mode, Counter())[outcome] += count
+
+    def stats(self) -> Dict[str, Any]:
+        """Return the configured routes and per-mode line counters."""
+        routes = self.routes()
+        with self._lock:
+            counts = {mode: dict(counter) for mode, counter in self._counts.items()}
+        return {
+            "routes": {
+                mode: {"persist": route.persist, "broadcast": route.broadcast}
+                for mode, route in routes.items()
+            },
+            "counts": counts,
+        }
+
+
+MODE_ROUTER = ModeRouter()
@@ -0,0 +1,223 @@
+"""Who is online, counted per socket.
+
+Each connected socket is tracked by its id, and a user stays online while
+any of their sockets (tabs, devices) is connected. The per-user counts live
+in the shared state store, so every app process sees the same list.
+
+Each process also keeps its own share of the counts under its server id and
+records a heartbeat every ``PRESENCE_HEARTBEAT_SECONDS``. When a process
+stops beating (it crashed or was killed), the next live process takes its
+share back out of the counts and reports its users as left; a process that
+exits normally does the same for itself.
+
+Changes are not broadcast one by one. Joins and leaves are collected for
+``PRESENCE_DEBOUNCE_SECONDS`` and sent as a single ``active_users_delta``
+event; a user who leaves and comes back within that window (a reconnect)
+produces no event at all. A newly connected socket gets the full list once,
+addressed to it alone.
+"""
+
+import atexit
+import threading
+import time
+import uuid
+from collections import Counter
+from typing import Any, Callable, Dict, List, Optional, Set
+
+from . import settings
+from .shared_state import SHARED_STATE
+
+Emit = Callable[[str, Any], None]
+
+# Heartbeats a process may miss before its sockets are written off.
+HEARTBEAT_MISSES = 3
+
+
+class PresenceTracker:
+    """Reference-counted presence with debounced joined/left deltas."""
+
+    def __init__(
+        self, store, *, key: str = "presence", server_id: Optional[str] = None
+    ) -> None:
+        self._store = store
+        self._key = key
+        self._server_id = server_id or uuid.uuid4().hex
+        self._servers_key = f"{key}:servers"
+        self._heartbeat_timer: Optional[threading.Timer] = None
+        self._beating = False
+        self._lock = threading.Lock()
+        self._sockets: Dict[str, str] = {}
+        self._joined: Set[str] = set()
+        self._left: Set[str] = set()
+        self._timer: Optional[threading.Timer] = None
+        self._emit: Optional[Emit] = None
+        self._counters = {"connects": 0, "disconnects": 0, "deltas_sent": 0}
+
+    def bind(self, emit: Emit) -> None:
+        """Set the function that broadcasts deltas, e.g. ``socketio.emit``."""
+        self._emit = emit
+        self._beat()
+
+    def connect(self, sid: str, username: str) -> bool:
+        """Track a socket for ``username``; return True if the user came online."""
+        with self._lock:
+            if sid in self._sockets:
+                return False
+            self._sockets[sid] = username
+            self._counters["connects"] += 1
+        self._store.hash_incr(self._server_key(self._server_id), username, 1)
+        if self._store.hash_incr(self._key, username, 1) != 1:
+            return False
+        self._changed(joined=username)
+        return True
+
+    def disconnect(self, sid: str) -> Optional[str]:
+        """Forget a socket; return its user if that was their last socket."""
+        with self._lock:
+            username = self._sockets.pop(sid, None)
+            if username is not None:
+                self._counters["disconnects"] += 1
+        if username is None:
+            return None
+        server_key = self._server_key(self._server_id)
+        if self._store.hash_incr(server_key, username, -1) < 0:
+            # Another process wrote this one off and already took the socket
+            # out of the counts.
+            self._store.hash_delete(server_key, username)
+            return None
+        if self._store.hash_incr(self._key, username, -1) > 0:
+            return None
+        self._changed(left=username)
+        return username
+
+    def online(self) -> List[str]:
+        """Return the users with at least one connected socket."""
+        counts = self._store.hash_get_all(self._key)
+        return sorted(user for user, count in counts.items() if int(count) > 0)
+
+    def heartbeat(self) -> List[str]:
+        """Record that this process is alive and release dead processes' sockets.
+
+        Returns the users who went offline with them.
+        """
+        now = time.time()
+        beats = self._store.hash_get_all(self._servers_key)
+        self._store.hash_update(self._servers_key, {self._server_id: repr(now)})
+        if self._beating and self._server_id not in beats:
+            self._rejoin()
+        self._beating = True
+        cutoff = now - HEARTBEAT_MISSES * settings.PRESENCE_HEARTBEAT_SECONDS
+        left: List[str] = []
+        for server_id, beat in beats.items():
+            if server_id != self._server_id and float(beat) < cutoff:
+                left += self._release(server_id)
+        return left
+
+    def close(self) -> None:
+        """Take this process's sockets out of the shared counts (at exit)."""
+        with self._lock:
+            if self._heartbeat_timer is not None:
+                self._heartbeat_timer.cancel()
+                self._heartbeat_timer = None
+            self._sockets.clear()
+        self._release(self._server_id)
+        try:
+            self.flush()
+        except Exception:
+            pass  # The message queue may already be gone.
+
+    def _server_key(self, server_id: str) -> str:
+        return f"{self._key}:server:{server_id}"
+
+    def _release(self, server_id: str) -> List[str]:
+        # Whoever removes the server's heartbeat owns its counts, so two
+        # processes never subtract them twice.
+        released = self._store.hash_delete(self._servers_key, server_id)
+        if not released and server_id != self._server_id:
+            return []
+        server_key = self._server_key(server_id)
+        left = []
+        for username, count in self._store.hash_get_all(server_key).items():
+            if int(count) > 0 and (
+                self._store.hash_incr(self._key, username, -int(count)) <= 0
+            ):
+                left.append(username)
+                self._changed(left=username)
+        self._store.delete(server_key)
+        return left
+
+    def _rejoin(self) -> None:
+        # This process missed its heartbeats and was written off: add its
+        # sockets back to the counts.
+        with self._lock:
+            local = Counter(self._sockets.values())
+        server_key = self._server_key(self._server_id)
+        counted = self._store.hash_get_all(server_key)
+        for username, count in local.items():
+            missing = count - int(counted.get(username, 0))
+            if missing <= 0:
+                continue
+            self._store.hash_incr(server_key, username, missing)
+            if self._store.hash_incr(self._key, username, missing) == missing:
+                self._changed(joined=username)
+
+    def _beat(self) -> None:
+        interval = settings.PRESENCE_HEARTBEAT_SECONDS
+        if not self._store.shared or interval <= 0:
+            return
+        self.heartbeat()
+        with self._lock:
+            if self._heartbeat_timer is not None:
+                self._heartbeat_timer.cancel()
+            self._heartbeat_timer = threading.Timer(interval, self._beat)
+            self._heartbeat_timer.daemon = True
+            self._heartbeat_timer.start()
+
+    def _changed(
+        self, *, joined: Optional[str] = None, left: Optional[str] = None
+    ) -> None:
+        with self._lock:
+            # A join and a leave of the same user within one window cancel out.
+            if joined:
+                if joined in self._left:
+                    self._left.discard(joined)
+                else:
+                    self._joined.add(joined)
+            if left:
+                if left in self._joined:
+                    self._joined.discard(left)
+                else:
+                    self._left.add(left)
+            delay = settings.PRESENCE_DEBOUNCE_SECONDS
+            if delay > 0 and self._timer is None:
+                self._timer = threading.Timer(delay, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+        if delay <= 0:
+            self.flush()
+
+    def flush(self) -> Optional[Dict[str, List[str]]]:
+        """Broadcast and return the pending delta, if anything changed."""
+        with self._lock:
+            joined, left = sorted(self._joined), sorted(self._left)
+            self._joined.clear()
+            self._left.clear()
+            self._timer = None
+            if not joined and not left:
+                return None
+            self._counters["deltas_sent"] += 1
+        delta = {"joined": joined, "left": left}
+        if self._emit is not None:
+            self._emit("active_users_delta", delta)
+        return delta
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            counters: Dict[str, Any] = dict(self._counters)
+            counters["local_sockets"] = len(self._sockets)
+        counters["online"] = len(self.online())
+        return counters
+
+
+PRESENCE = PresenceTracker(SHARED_STATE)
+atexit.register(PRESENCE.close)
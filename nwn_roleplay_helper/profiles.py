@@ -0,0 +1,111 @@
+"""In-memory character profiles with an owner index.
+
+:class:`ProfileStore` is the ``character_profiles`` map the app and the
+Socket.IO handlers share. It behaves like a plain ``{name: profile}``
+mapping and also keeps ``{owner: {name: profile}}`` in step with every
+change, so looking up a user's characters does not scan every loaded
+profile.
+"""
+
+import threading
+from collections.abc import MutableMapping
+from typing import Any, Dict, Iterator, Mapping, Optional
+
+Profile = Dict[str, Any]
+OwnerIndex = Dict[Optional[str], Dict[str, Profile]]
+
+
+def _build_index(profiles: Mapping[str, Profile]) -> OwnerIndex:
+    index: OwnerIndex = {}
+    for name, profile in profiles.items():
+        index.setdefault(profile.get("owner"), {})[name] = profile
+    return index
+
+
+class ProfileStore(MutableMapping):
+    """``{name: profile}`` mapping that also indexes profiles by owner.
+
+    The profiles live in a wrapped dict, so every mutation (including the
+    ``setdefault``, ``popitem``, ``update`` and ``|=`` built on
+    ``__setitem__``/``__delitem__``) goes through the index.
+    """
+
+    def __init__(self, profiles: Optional[Mapping[str, Profile]] = None) -> None:
+        self._profiles: Dict[str, Profile] = dict(profiles or {})
+        self._by_owner: OwnerIndex = _build_index(self._profiles)
+        self._lock = threading.RLock()
+
+    def _unindex(self, name: str) -> None:
+        previous = self._profiles.get(name)
+        if previous is None:
+            return
+        owner = previous.get("owner")
+        owned = self._by_owner.get(owner)
+        if owned is not None:
+            owned.pop(name, None)
+            if not owned:
+                del self._by_owner[owner]
+
+    def __getitem__(self, name: str) -> Profile:
+        return self._profiles[name]
+
+    def __setitem__(self, name: str, profile: Profile) -> None:
+        with self._lock:
+            self._unindex(name)
+            self._by_owner.setdefault(profile.get("owner"), {})[name] = profile
+            self._profiles[name] = profile
+
+    def __delitem__(self, name: str) -> None:
+        with self._lock:
+            self._unindex(name)
+            del self._profiles[name]
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._profiles)
+
+    def __len__(self) -> int:
+        return len(self._profiles)
+
+    def __contains__(self, name: object) -> bool:
+        return name in self._profiles
+
+    def __ior__(self, profiles: Mapping[str, Profile]) -> "ProfileStore":
+        self.update(profiles)
+        return self
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}({self._profiles!r})"
+
+    def clear(self) -> None:
+        with self._lock:
+            self._profiles, self._by_owner = {}, {}
+
+    def replace(self, profiles: Mapping[str, Profile]) -> None:
+        """Swap in a freshly loaded set of profiles.
+
+        The new mapping and its index are built first and then swapped in,
+        so readers see either the old profiles or the new ones, never an
+        empty store.
+        """
+        fresh = dict(profiles)
+        index = _build_index(fresh)
+        with self._lock:
+            self._profiles, self._by_owner = fresh, index
+
+    def owned_by(self, owner: Optional[str]) -> Dict[str, Profile]:
+        """Return ``{name: profile}`` for the owner's characters."""
+        with self._lock:
+            return dict(self._by_owner.get(owner, {}))
+
+
+def owned_by(
+    profiles: Mapping[str, Profile], owner: Optional[str]
+) -> Dict[str, Profile]:
+    """Return the owner's characters, from the index when ``profiles`` has one."""
+    if isinstance(profiles, ProfileStore):
+        return profiles.owned_by(owner)
+    return {
+        name: profile
+        for name, profile in profiles.items()
+        if profile.get("owner") == owner
+    }
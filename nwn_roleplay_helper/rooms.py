@@ -0,0 +1,21 @@
+"""Per-user Socket.IO rooms.
+
+A logged-in browser's socket joins its user's room when it connects, so
+events that concern one user (their chat lines, character switches) reach
+only that user's sessions instead of every connected socket.
+"""
+
+from typing import Any, Optional
+
+
+def user_room(username: str) -> str:
+    """Return the room name that holds a user's sockets."""
+    return f"user:{username}"
+
+
+def emit_to_user(socketio, event: str, payload: Any, username: Optional[str]) -> None:
+    """Emit ``event`` to ``username``'s sockets, or to everyone if unknown."""
+    if username:
+        socketio.emit(event, payload, to=user_room(username))
+    else:
+        socketio.emit(event, payload)
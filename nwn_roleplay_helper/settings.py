@@ -20,6 +20,148 @@ def env_flag(name: str, default: bool = False) -> bool:
     return raw_value.strip().lower() in {"1", "true", "yes", "on"}
 
 
+def env_int(name: str, default: int) -> int:
+    """Return an integer setting from the environment."""
+    raw_value = os.getenv(name)
+    if raw_value is None or not raw_value.strip():
+        return default
+    return int(raw_value)
+
+
+def env_float(name: str, default: float) -> float:
+    """Return a float setting from the environment."""
+    raw_value = os.getenv(name)
+    if raw_value is None or not raw_value.strip():
+        return default
+    return float(raw_value)
+
+
+# Write-behind history buffer: flush a character's pending entries once this
+# many are queued, and flush everything at least this often.
+HISTORY_FLUSH_MAX_ENTRIES = env_int("HISTORY_FLUSH_MAX_ENTRIES", 200)
+HISTORY_FLUSH_INTERVAL_SECONDS = env_float("HISTORY_FLUSH_INTERVAL_SECONDS", 1.0)
+# Characters are spread over this many independent single-writer shards.
+HISTORY_WRITER_SHARDS = env_int("HISTORY_WRITER_SHARDS", 4)
+
+# /api/history/<character> page sizes when a limit or cursor is requested.
+HISTORY_PAGE_DEFAULT_LIMIT = env_int("HISTORY_PAGE_DEFAULT_LIMIT", 50)
+HISTORY_PAGE_MAX_LIMIT = env_int("HISTORY_PAGE_MAX_LIMIT", 500)
+
+# Seal and gzip a character's hot history segment once it reaches this size
+# or age. Zero disables that trigger.
+HISTORY_SEGMENT_MAX_BYTES = env_int("HISTORY_SEGMENT_MAX_BYTES", 1024 * 1024)
+HISTORY_SEGMENT_MAX_AGE_HOURS = env_float("HISTORY_SEGMENT_MAX_AGE_HOURS", 24.0)
+
+# Full-text history search: hits per query by default, and how many
+# characters keep an in-process index (JSONL backend) in memory.
+HISTORY_SEARCH_DEFAULT_LIMIT = env_int("HISTORY_SEARCH_DEFAULT_LIMIT", 20)
+HISTORY_SEARCH_MAX_INDEXES = env_int("HISTORY_SEARCH_MAX_INDEXES", 32)
+
+# In-memory history cache: newest entries kept per character, and the total
+# entries kept across all characters before the least recently used go.
+HISTORY_CACHE_WINDOW = env_int("HISTORY_CACHE_WINDOW", 500)
+HISTORY_CACHE_MAX_ENTRIES = env_int("HISTORY_CACHE_MAX_ENTRIES", 50000)
+
+# History retention (zero disables a limit): maximum entry age, entries kept
+# per character, a per-user disk budget (journals and segments; migrated
+# legacy backups are not counted), and how long ai/system entries are kept.
+# The pruner applies them every HISTORY_PRUNE_INTERVAL_SECONDS.
+HISTORY_RETENTION_MAX_AGE_DAYS = env_float("HISTORY_RETENTION_MAX_AGE_DAYS", 0)
+HISTORY_RETENTION_MAX_ENTRIES = env_int("HISTORY_RETENTION_MAX_ENTRIES", 0)
+HISTORY_RETENTION_USER_MAX_BYTES = env_int("HISTORY_RETENTION_USER_MAX_BYTES", 0)
+HISTORY_RETENTION_AI_SYSTEM_DAYS = env_float("HISTORY_RETENTION_AI_SYSTEM_DAYS", 0)
+HISTORY_PRUNE_INTERVAL_SECONDS = env_float("HISTORY_PRUNE_INTERVAL_SECONDS", 3600)
+
+# Bulk log ingestion (/api/log_update/bulk): lines handed to the chat
+# pipeline per batch, and the most decompressed bytes one request may carry
+# (zero for no limit).
+INGEST_BULK_BATCH_LINES = env_int("INGEST_BULK_BATCH_LINES", 500)
+INGEST_BULK_MAX_BYTES = env_int("INGEST_BULK_MAX_BYTES", 64 * 1024 * 1024)
+
+# Optional content check for resent lines from clients that do not number
+# them: a line is dropped if the same text arrived in one of the last
+# INGEST_DEDUP_WINDOW lines from that client within the window's seconds.
+# A genuinely repeated line inside the window (a second "*nods*") is dropped
+# too, so it is off by default; numbered lines are deduplicated by seq.
+INGEST_DEDUP_WINDOW = env_int("INGEST_DEDUP_WINDOW", 0)
+INGEST_DEDUP_WINDOW_SECONDS = env_float("INGEST_DEDUP_WINDOW_SECONDS", 30.0)
+
+# log_update processing queue: worker count, updates each worker may hold
+# before clients are asked to retry, the Retry-After they are given, and how
+# long a bulk upload waits for room before giving up.
+INGEST_WORKERS = env_int("INGEST_WORKERS", 4)
+INGEST_QUEUE_MAX_DEPTH = env_int("INGEST_QUEUE_MAX_DEPTH", 256)
+INGEST_RETRY_AFTER_SECONDS = env_int("INGEST_RETRY_AFTER_SECONDS", 2)
+INGEST_BULK_QUEUE_TIMEOUT_SECONDS = env_float("INGEST_BULK_QUEUE_TIMEOUT_SECONDS", 30)
+
+# Per-mode routing of incoming lines, overriding the defaults in
+# mode_router.DEFAULT_ROUTES: "Mode=persist|broadcast|persist+broadcast|drop"
+# pairs separated by ";". Modes are Talk, Party, Whisper, Tell, Shout, DM,
+# "*" (any other mode) and "unparsed" (lines outside the chat format). Parsed
+# once at startup; an invalid value stops the app.
+INGEST_MODE_ROUTES = os.getenv("INGEST_MODE_ROUTES", "")
+
+# Chat lines reach browsers as one batched new_messages event per update.
+# Enable this only for older clients that predate the batched event: it also
+# sends the legacy per-line new_message/player_message events, which the
+# bundled page ignores once it has seen a batch.
+SOCKETIO_PER_LINE_MESSAGE_EVENTS = env_flag("SOCKETIO_PER_LINE_MESSAGE_EVENTS")
+
+# Per-line ingestion logging: "sampled" counts events such as skipped system
+# lines and logs a summary every LOG_SAMPLE_INTERVAL_SECONDS; "verbose" logs
+# each one. The last DIAG_RECENT_LINES raw lines are kept in memory for
+# /debug_recent_lines either way. SOCKETIO_DEBUG_LOGGING turns on the very
+# chatty Socket.IO/Engine.IO packet logs.
+LOG_HOT_PATH = os.getenv("LOG_HOT_PATH", "sampled").strip().lower()
+LOG_SAMPLE_INTERVAL_SECONDS = env_float("LOG_SAMPLE_INTERVAL_SECONDS", 10.0)
+DIAG_RECENT_LINES = env_int("DIAG_RECENT_LINES", 500)
+SOCKETIO_DEBUG_LOGGING = env_flag("SOCKETIO_DEBUG_LOGGING")
+
+# Running several app processes: SOCKETIO_MESSAGE_QUEUE (e.g.
+# redis://localhost:6379/0) relays Socket.IO emits between them, and
+# SHARED_STATE_URL holds the online users, last log_update preview and
+# profile version; it defaults to the message queue when that is Redis.
+SOCKETIO_MESSAGE_QUEUE = os.getenv("SOCKETIO_MESSAGE_QUEUE", "").strip()
+SOCKETIO_CHANNEL = os.getenv("SOCKETIO_CHANNEL", "nwn-persona")
+SHARED_STATE_URL = os.getenv("SHARED_STATE_URL", "").strip() or (
+    SOCKETIO_MESSAGE_QUEUE
+    if SOCKETIO_MESSAGE_QUEUE.startswith(("redis://", "rediss://", "unix://"))
+    else ""
+)
+
+# Browsers identify their Socket.IO connection with a signed token from
+# /api/socket_token that is valid for this long, and connect over WebSocket
+# first, falling back to long-polling (which may then upgrade unless
+# SOCKETIO_ALLOW_UPGRADES is off).
+SOCKET_TOKEN_MAX_AGE_SECONDS = env_int("SOCKET_TOKEN_MAX_AGE_SECONDS", 300)
+SOCKETIO_ALLOW_UPGRADES = env_flag("SOCKETIO_ALLOW_UPGRADES", True)
+
+# new_messages batches are sent as compact rows of parsed fields that the
+# browser formats; "full" sends one pre-formatted object per message instead.
+# SOCKETIO_SERIALIZER=msgpack switches Socket.IO to binary MessagePack frames
+# (needs the msgpack package, and every client must use the msgpack parser;
+# the browser's copy is served from static/vendor/ and must be downloaded
+# there first, see WEBSOCKET_TROUBLESHOOTING.md).
+SOCKETIO_MESSAGE_FORMAT = (
+    os.getenv("SOCKETIO_MESSAGE_FORMAT", "compact").strip().lower()
+)
+SOCKETIO_SERIALIZER = os.getenv("SOCKETIO_SERIALIZER", "default").strip().lower()
+
+# Online-list changes are collected for this long and broadcast as one
+# active_users_delta event (0 sends each change immediately).
+PRESENCE_DEBOUNCE_SECONDS = env_float("PRESENCE_DEBOUNCE_SECONDS", 1.0)
+# With shared state, each process renews its share of the online counts this
+# often; a process silent for three intervals is taken to have died and its
+# users are dropped from the list (0 turns the heartbeat off).
+PRESENCE_HEARTBEAT_SECONDS = env_float("PRESENCE_HEARTBEAT_SECONDS", 10.0)
+
+# "json" keeps the JSON/JSONL files above; "sqlite" stores history, users and
+# feedback in SQLITE_DB_PATH instead (import existing data with
+# ``python -m nwn_roleplay_helper.migrate_sqlite``).
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "json").strip().lower()
+SQLITE_DB_PATH = os.getenv("SQLITE_DB_PATH", "nwn_persona.db")
+
+
 def ensure_runtime_dirs() -> None:
     """Ensure runtime directories exist."""
     os.makedirs(CHAT_HISTORY_DIR, exist_ok=True)
@@ -0,0 +1,141 @@
+"""State shared by every app process.
+
+A single process keeps its state in memory (:class:`MemoryStateStore`).
+With ``SHARED_STATE_URL`` pointing at Redis, the per-user socket counts
+behind the online list, the last log_update preview and the
+character-profile version live there instead (:class:`RedisStateStore`,
+which needs the ``redis`` package), so all processes behind the load
+balancer agree on them.
+
+:class:`SharedDict` wraps a store key with the small part of the dict API
+the app already used on its module global.
+"""
+
+import json
+import threading
+from typing import Any, Dict, Mapping
+
+from . import settings
+
+REDIS_SCHEMES = ("redis://", "rediss://", "unix://")
+
+
+class MemoryStateStore:
+    """Process-local store; the default when only one process runs."""
+
+    shared = False
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._hashes: Dict[str, Dict[str, str]] = {}
+        self._counters: Dict[str, int] = {}
+
+    def hash_update(self, key: str, mapping: Mapping[str, str]) -> None:
+        with self._lock:
+            self._hashes.setdefault(key, {}).update(mapping)
+
+    def hash_get_all(self, key: str) -> Dict[str, str]:
+        with self._lock:
+            return dict(self._hashes.get(key, {}))
+
+    def hash_incr(self, key: str, field: str, amount: int = 1) -> int:
+        with self._lock:
+            fields = self._hashes.setdefault(key, {})
+            value = int(fields.get(field, 0)) + amount
+            fields[field] = str(value)
+            return value
+
+    def hash_delete(self, key: str, *fields: str) -> int:
+        with self._lock:
+            values = self._hashes.get(key, {})
+            return sum(values.pop(field, None) is not None for field in fields)
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._hashes.pop(key, None)
+            self._counters.pop(key, None)
+
+    def incr(self, key: str) -> int:
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + 1
+            return self._counters[key]
+
+    def get_int(self, key: str) -> int:
+        with self._lock:
+            return self._counters.get(key, 0)
+
+
+class RedisStateStore:
+    """Store backed by Redis, shared by every process using the same URL."""
+
+    shared = True
+
+    def __init__(self, url: str, prefix: str = "nwn-persona:") -> None:
+        try:
+            import redis
+        except ImportError as e:
+            raise RuntimeError(
+                "SHARED_STATE_URL points at Redis but the redis package is not "
+                "installed (pip install redis)"
+            ) from e
+        self._redis = redis.Redis.from_url(url, decode_responses=True)
+        self._prefix = prefix
+
+    def hash_update(self, key: str, mapping: Mapping[str, str]) -> None:
+        if mapping:
+            self._redis.hset(self._prefix + key, mapping=dict(mapping))
+
+    def hash_get_all(self, key: str) -> Dict[str, str]:
+        return self._redis.hgetall(self._prefix + key)
+
+    def hash_incr(self, key: str, field: str, amount: int = 1) -> int:
+        return int(self._redis.hincrby(self._prefix + key, field, amount))
+
+    def hash_delete(self, key: str, *fields: str) -> int:
+        if not fields:
+            return 0
+        return int(self._redis.hdel(self._prefix + key, *fields))
+
+    def delete(self, key: str) -> None:
+        self._redis.delete(self._prefix + key)
+
+    def incr(self, key: str) -> int:
+        return int(self._redis.incr(self._prefix + key))
+
+    def get_int(self, key: str) -> int:
+        return int(self._redis.get(self._prefix + key) or 0)
+
+
+def create_state_store(url: str):
+    """Return the store for ``url`` ("" or ``memory://`` keeps it in process)."""
+    if not url or url.startswith("memory://"):
+        return MemoryStateStore()
+    if url.startswith(REDIS_SCHEMES):
+        return RedisStateStore(url)
+    raise ValueError(f"Unsupported SHARED_STATE_URL: {url}")
+
+
+class SharedDict:
+    """JSON-valued mapping stored under one key."""
+
+    def __init__(self, store, key: str, defaults: Mapping[str, Any]) -> None:
+        self._store = store
+        self._key = key
+        self._defaults = dict(defaults)
+
+    def update(self, values: Mapping[str, Any]) -> None:
+        self._store.hash_update(
+            self._key, {field: json.dumps(value) for field, value in values.items()}
+        )
+
+    def to_dict(self) -> Dict[str, Any]:
+        values = dict(self._defaults)
+        for field, raw in self._store.hash_get_all(self._key).items():
+            values[field] = json.loads(raw)
+        return values
+
+    def __getitem__(self, field: str) -> Any:
+        return self.to_dict()[field]
+
+
+SHARED_STATE = create_state_store(settings.SHARED_STATE_URL)
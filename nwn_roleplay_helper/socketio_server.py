@@ -1,24 +1,33 @@
 """Socket.IO event handlers."""
 
 import datetime
+import time
 from typing import Callable, Dict
 
-from flask import request, session
+from flask import current_app, request, session
 from flask_socketio import emit, join_room
 
+from .auth import verify_socket_token
+from .diagnostics import HOT_PATH_LOG, SOCKET_LATENCY
+from .ingestion import INGESTION_TRACKER, check_lines, numbered, parse_seq
+from .ingestion_queue import INGESTION_QUEUE
+from .profiles import owned_by
+from .rooms import user_room
+
 
 def register_socketio_handlers(
     socketio,
     *,
     logger,
     get_character_profiles: Callable[[], Dict],
-    online_users: set,
+    presence,
     chat_processing,
     get_openai_api_key,
     save_feedback,
     last_log_update: Dict,
 ) -> None:
     """Register all Socket.IO handlers."""
+    presence.bind(socketio.emit)
 
     @socketio.on("translate_message")
     def handle_translate_message(data):
@@ -69,14 +78,27 @@ def register_socketio_handlers(
             join_room(room_name)
             logger.info(f"Client {socket_id} joined room {room_name}")
 
-            # Check if user credentials are provided in auth param
+            # Browsers prove who they are with a signed token from
+            # /api/socket_token, so the connection does not depend on the
+            # cookie session (or on which transport carried the handshake).
+            # Only a verified user joins the per-user room.
             username = None
-            if auth and isinstance(auth, dict) and "username" in auth:
-                username = auth["username"]
-                logger.info(f"User identified as: {username}")
+            if auth and isinstance(auth, dict):
+                username = verify_socket_token(
+                    current_app.config["SECRET_KEY"], auth.get("token")
+                )
                 if username:
-                    online_users.add(username)
-                    socketio.emit("active_users", list(online_users))
+                    join_room(user_room(username))
+                elif "username" in auth:
+                    # Log clients only name themselves; that is enough for
+                    # the online list but not for receiving a user's events.
+                    username = auth["username"]
+            if username:
+                logger.info(f"User identified as: {username}")
+                # Other sockets learn about the join from the next debounced
+                # active_users_delta; this one gets the full list once.
+                presence.connect(socket_id, username)
+                emit("active_users", presence.online())
 
             # Always emit connection status to this specific client
             emit(
@@ -92,6 +114,11 @@ def register_socketio_handlers(
             # If there's session data, try to use it as fallback
             # But don't rely on it for core functionality
             try:
+                # Events for one user (chat lines, character switches) go to
+                # this room. Only the logged-in session user is trusted here,
+                # never the username a client claims in ``auth``.
+                if session.get("user"):
+                    join_room(user_room(session["user"]))
                 if "user" in session and session.get("active_character"):
                     emit(
                         "character_change",
@@ -109,9 +136,8 @@ def register_socketio_handlers(
     @socketio.on("disconnect")
     def disconnect():
         """Handle client disconnection"""
-        if "user" in session:
-            online_users.discard(session["user"])
-            socketio.emit("active_users", list(online_users))
+        # The user stays online while any other tab or device is connected.
+        presence.disconnect(request.sid)
 
     @socketio.on("activate_character")
     def handle_activate_character(data):
@@ -209,7 +235,7 @@ def register_socketio_handlers(
     def handle_log_update_socket(data):
         """Receive log updates over Socket.IO from NWN Log Client."""
         try:
-            logger.info("Received log_update via Socket.IO: %s", data)
+            logger.debug("Received log_update via Socket.IO: %s", data)
             if not isinstance(data, dict):
                 logger.warning("log_update payload is not a dict: %s", type(data))
                 return
@@ -225,19 +251,25 @@ def register_socketio_handlers(
                 logger.warning("log_update payload missing 'lines'")
                 return
 
-            if isinstance(lines, str):
-                lines_list = lines.splitlines()
-            elif isinstance(lines, list):
-                lines_list = lines
-            else:
-                logger.warning(
-                    "log_update 'lines' has unexpected type: %s", type(lines)
-                )
+            try:
+                seq = parse_seq(data.get("seq"))
+            except (TypeError, ValueError) as e:
+                logger.warning("log_update has an invalid seq: %s", e)
                 return
 
+            if isinstance(lines, str):
+                lines = lines.splitlines()
+            try:
+                lines_list = check_lines(lines)
+            except ValueError as e:
+                logger.warning("log_update has invalid lines: %s", e)
+                return {"success": False, "error": str(e)}
+
             if lines_list:
-                logger.info(
-                    "log_update (socket) lines preview (up to 5): %s", lines_list[:5]
+                HOT_PATH_LOG.event(
+                    logger,
+                    "log_update (socket) lines preview (up to 5)",
+                    lines_list[:5],
                 )
                 last_log_update.update(
                     {
@@ -247,22 +279,49 @@ def register_socketio_handlers(
                         "lines_preview": lines_list[:5],
                     }
                 )
-                log_text = "\n".join(lines_list)
-                user_characters = {
-                    name: profile
-                    for name, profile in get_character_profiles().items()
-                    if profile.get("owner") == client
-                }
-                chat_processing.process_new_messages(
-                    log_text,
-                    client=client,
-                    user_characters=user_characters,
-                    character_profiles=get_character_profiles(),
-                    socketio=socketio,
-                    logger=logger,
-                )
+                stream = data.get("stream")
+
+                def process():
+                    profiles = get_character_profiles()
+                    # The lines count as delivered only once processed, so
+                    # an update that fails here can be resent.
+                    with INGESTION_TRACKER.accepting(
+                        client, numbered(lines_list, seq), stream=stream
+                    ) as new_lines:
+                        chat_processing.process_new_messages(
+                            new_lines,
+                            client=client,
+                            user_characters=owned_by(profiles, client),
+                            character_profiles=profiles,
+                            socketio=socketio,
+                            logger=logger,
+                        )
+
+                # The return value is the client's ack, if it asked for one.
+                if not INGESTION_QUEUE.submit(client, process):
+                    return {
+                        "success": False,
+                        "error": "Ingestion queue is full",
+                        "retry_after": INGESTION_QUEUE.retry_after(),
+                    }
+                return {"success": True, "queued": True}
+            return {"success": True}
         except Exception as e:
             logger.error("Error processing Socket.IO log_update: %s", e)
+            return {"success": False, "error": str(e)}
+
+    @socketio.on("latency_probe")
+    def handle_latency_probe(data=None):
+        """Ack a browser's probe and record the round trip it last measured."""
+        rtt_ms = data.get("rtt_ms") if isinstance(data, dict) else None
+        if isinstance(rtt_ms, (int, float)) and 0 <= rtt_ms < 60000:
+            try:
+                eio_sid = socketio.server.manager.eio_sid_from_sid(request.sid, "/")
+                transport = socketio.server.eio.transport(eio_sid)
+            except Exception:
+                transport = "unknown"
+            SOCKET_LATENCY.record(transport, float(rtt_ms))
+        return {"server_time": time.time() * 1000}
 
     @socketio.on("socket_ping")
     def handle_socket_ping():
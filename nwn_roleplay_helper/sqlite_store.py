@@ -0,0 +1,498 @@
+"""SQLite storage backend for history, users and feedback.
+
+Enabled with ``STORAGE_BACKEND=sqlite``. The database runs in WAL mode so
+readers never block the writer, and history is indexed by
+(user, character, timestamp) and by sender for range and filter queries.
+All statements are fixed parameterized SQL, which ``sqlite3`` keeps in its
+per-connection statement cache. Batches are inserted with ``executemany``
+in a single transaction.
+"""
+
+import json
+import logging
+import sqlite3
+import threading
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from .history_search import SEARCH_INDEX, tokenize
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS history (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user TEXT NOT NULL,
+    character TEXT NOT NULL,
+    timestamp TEXT NOT NULL,
+    sender TEXT NOT NULL,
+    message TEXT NOT NULL
+);
+-- Index entries are ordered by rowid within (user, character), which is what
+-- cursor paging walks.
+CREATE INDEX IF NOT EXISTS idx_history_character ON history (user, character);
+CREATE INDEX IF NOT EXISTS idx_history_timestamp
+    ON history (user, character, timestamp);
+CREATE INDEX IF NOT EXISTS idx_history_sender ON history (user, character, sender);
+
+CREATE TABLE IF NOT EXISTS users (
+    username TEXT PRIMARY KEY,
+    password TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS feedback (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user TEXT NOT NULL,
+    character TEXT NOT NULL,
+    timestamp TEXT NOT NULL,
+    rating INTEGER NOT NULL,
+    entry TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_feedback_character ON feedback (user, character);
+"""
+
+INSERT_HISTORY = (
+    "INSERT INTO history (user, character, timestamp, sender, message) "
+    "VALUES (?, ?, ?, ?, ?)"
+)
+SELECT_HISTORY = "SELECT id, timestamp, sender, message FROM history"
+# Rows deleted per transaction while pruning, so writers are never blocked
+# for long.
+PRUNE_BATCH_SIZE = 1000
+
+# Full-text index over history messages, kept in sync by triggers. Skipped
+# (falling back to the in-process index) if SQLite was built without FTS5.
+FTS_SCHEMA = """
+CREATE VIRTUAL TABLE history_fts USING fts5(
+    message, content='history', content_rowid='id'
+);
+CREATE TRIGGER history_fts_insert AFTER INSERT ON history BEGIN
+    INSERT INTO history_fts (rowid, message) VALUES (new.id, new.message);
+END;
+CREATE TRIGGER history_fts_delete AFTER DELETE ON history BEGIN
+    INSERT INTO history_fts (history_fts, rowid, message)
+    VALUES ('delete', old.id, old.message);
+END;
+INSERT INTO history_fts (history_fts) VALUES ('rebuild');
+"""
+SEARCH_HISTORY = (
+    "SELECT h.id, h.timestamp, h.sender, h.message,"
+    " snippet(history_fts, 0, '**', '**', '…', 16) AS snippet,"
+    " bm25(history_fts) AS rank"
+    " FROM history_fts JOIN history AS h ON h.id = history_fts.rowid"
+    " WHERE history_fts MATCH ? AND h.user = ? AND h.character = ?"
+    " ORDER BY rank, h.id DESC LIMIT ?"
+)
+
+LocatedEntry = Tuple[int, Dict[str, Any]]
+
+
+def character_key(character_name: str) -> str:
+    """Normalize a character name the way history directories are named."""
+    return character_name.replace(" ", "_")
+
+
+def _row_entry(row: sqlite3.Row) -> LocatedEntry:
+    return row["id"], {
+        "timestamp": row["timestamp"],
+        "sender": row["sender"],
+        "message": row["message"],
+    }
+
+
+class SqliteStore:
+    """History, user and feedback storage in one SQLite database."""
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        # One connection per thread (green thread under eventlet); sqlite3
+        # connections must not be shared between threads.
+        self._local = threading.local()
+        with self._connection() as conn:
+            conn.executescript(SCHEMA)
+            self.fts_enabled = self._ensure_fts(conn)
+
+    @staticmethod
+    def _ensure_fts(conn: sqlite3.Connection) -> bool:
+        exists = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE name = 'history_fts'"
+        ).fetchone()
+        if exists:
+            return True
+        try:
+            # Creating the index also backfills rows written before it existed.
+            conn.executescript(f"BEGIN; {FTS_SCHEMA} COMMIT;")
+        except sqlite3.OperationalError as e:
+            conn.rollback()
+            logger.warning(f"SQLite FTS5 unavailable, using in-process search: {e}")
+            return False
+        return True
+
+    @property
+    def namespace(self) -> str:
+        return f"sqlite:{self.path}"
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    # -- history -----------------------------------------------------------
+
+    def append_entries(
+        self, user: str, character_name: str, entries: List[Dict[str, Any]]
+    ) -> int:
+        """Insert a batch of history entries in one transaction."""
+        if not entries:
+            return 0
+        key = character_key(character_name)
+        rows = [
+            (
+                user,
+                key,
+                entry.get("timestamp") or "",
+                entry.get("sender") or "",
+                entry.get("message") or "",
+            )
+            for entry in entries
+        ]
+        with self._connection() as conn:
+            conn.executemany(INSERT_HISTORY, rows)
+        return sum(len(row[4].encode("utf-8")) for row in rows)
+
+    def ensure(self, user: str, character_name: str) -> str:
+        """History rows need no per-character setup; return the database."""
+        return self.path
+
+    def iter_reversed(
+        self,
+        user: str,
+        character_name: str,
+        *,
+        end: Optional[int] = None,
+        senders: Optional[Iterable[str]] = None,
+    ) -> Iterator[LocatedEntry]:
+        """Yield ``(id, entry)`` pairs newest first for ids below ``end``."""
+        sql = SELECT_HISTORY + " WHERE user = ? AND character = ?"
+        params: List[Any] = [user, character_key(character_name)]
+        if end is not None:
+            sql += " AND id < ?"
+            params.append(end)
+        if senders is not None:
+            wanted = list(senders)
+            sql += f" AND sender IN ({', '.join('?' * len(wanted))})"
+            params.extend(wanted)
+        for row in self._connection().execute(sql + " ORDER BY id DESC", params):
+            yield _row_entry(row)
+
+    def iter_forward(
+        self, user: str, character_name: str, *, after: Optional[int] = None
+    ) -> Iterator[LocatedEntry]:
+        """Yield ``(id, entry)`` pairs oldest first for ids above ``after``."""
+        rows = self._connection().execute(
+            SELECT_HISTORY + " WHERE user = ? AND character = ? AND id > ? ORDER BY id",
+            (user, character_key(character_name), -1 if after is None else after),
+        )
+        for row in rows:
+            yield _row_entry(row)
+
+    def entries_between(
+        self,
+        user: str,
+        character_name: str,
+        *,
+        since: Optional[str] = None,
+        until: Optional[str] = None,
+    ) -> List[Dict[str, Any]]:
+        """Return entries in a timestamp range using the timestamp index."""
+        sql = SELECT_HISTORY + " WHERE user = ? AND character = ?"
+        params: List[Any] = [user, character_key(character_name)]
+        if since is not None:
+            sql += " AND timestamp >= ?"
+            params.append(since)
+        if until is not None:
+            sql += " AND timestamp <= ?"
+            params.append(until)
+        rows = self._connection().execute(sql + " ORDER BY timestamp, id", params)
+        return [_row_entry(row)[1] for row in rows]
+
+    def entry_count(self, user: str, character_name: str) -> int:
+        """Return the number of stored entries for a character."""
+        row = (
+            self._connection()
+            .execute(
+                "SELECT COUNT(*) FROM history WHERE user = ? AND character = ?",
+                (user, character_key(character_name)),
+            )
+            .fetchone()
+        )
+        return row[0]
+
+    def search(
+        self, user: str, character_name: str, query: str, *, limit: int
+    ) -> List[Dict[str, Any]]:
+        """Return ranked entries matching every word of ``query``."""
+        terms = tokenize(query)
+        if not terms:
+            return []
+        if not self.fts_enabled:
+            return SEARCH_INDEX.search(
+                self.namespace,
+                user,
+                character_name,
+                query,
+                limit=limit,
+                read_forward=lambda after: self.iter_forward(
+                    user, character_name, after=after
+                ),
+            )
+        # Quote each word so user input is never parsed as FTS5 query syntax.
+        match = " ".join(f'"{term}"' for term in terms)
+        rows = self._connection().execute(
+            SEARCH_HISTORY, (match, user, character_key(character_name), limit)
+        )
+        return [
+            {
+                "id": row["id"],
+                "timestamp": row["timestamp"],
+                "sender": row["sender"],
+                "message": row["message"],
+                "snippet": row["snippet"],
+                "score": round(-row["rank"], 4),
+            }
+            for row in rows
+        ]
+
+    def version(self, user: str, character_name: str) -> str:
+        """Return a token that changes whenever a character's rows change."""
+        row = (
+            self._connection()
+            .execute(
+                "SELECT MIN(id), MAX(id), COUNT(*) FROM history"
+                " WHERE user = ? AND character = ?",
+                (user, character_key(character_name)),
+            )
+            .fetchone()
+        )
+        if row[1] is None:
+            return "sqlite-empty"
+        # The count changes when retention deletes rows between the ends.
+        return f"sqlite-{row[0]:x}-{row[1]:x}-{row[2]:x}"
+
+    # -- retention ---------------------------------------------------------
+
+    def characters(self) -> List[Tuple[str, str]]:
+        """Return every (user, character) with stored history."""
+        rows = self._connection().execute(
+            "SELECT DISTINCT user, character FROM history ORDER BY user, character"
+        )
+        return [(row["user"], row["character"]) for row in rows]
+
+    def _delete_batches(self, where: str, params: List[Any]) -> Tuple[int, int]:
+        """Delete matching rows oldest first in short transactions."""
+        removed = reclaimed = 0
+        conn = self._connection()
+        select = (
+            "SELECT id, LENGTH(CAST(message AS BLOB)) AS size FROM history"
+            f" WHERE {where} ORDER BY id LIMIT ?"
+        )
+        while True:
+            rows = conn.execute(select, [*params, PRUNE_BATCH_SIZE]).fetchall()
+            if not rows:
+                return removed, reclaimed
+            with conn:
+                conn.executemany(
+                    "DELETE FROM history WHERE id = ?", [(row["id"],) for row in rows]
+                )
+            removed += len(rows)
+            reclaimed += sum(row["size"] for row in rows)
+            if len(rows) < PRUNE_BATCH_SIZE:
+                return removed, reclaimed
+
+    def prune(
+        self,
+        user: str,
+        character_name: str,
+        *,
+        older_than: Optional[str] = None,
+        drop_senders: Iterable[str] = (),
+        drop_senders_older_than: Optional[str] = None,
+        max_entries: int = 0,
+    ) -> Tuple[int, int]:
+        """Delete expired rows for a character; return (entries, bytes)."""
+        key = character_key(character_name)
+        base = "user = ? AND character = ?"
+        removed = reclaimed = 0
+
+        def delete(where: str, params: List[Any]) -> None:
+            nonlocal removed, reclaimed
+            batch_removed, batch_reclaimed = self._delete_batches(
+                f"{base} AND {where}", [user, key, *params]
+            )
+            removed += batch_removed
+            reclaimed += batch_reclaimed
+
+        if older_than is not None:
+            delete("timestamp < ?", [older_than])
+        senders = list(drop_senders)
+        if senders and drop_senders_older_than is not None:
+            placeholders = ", ".join("?" * len(senders))
+            delete(
+                f"sender IN ({placeholders}) AND timestamp < ?",
+                [*senders, drop_senders_older_than],
+            )
+        if max_entries > 0:
+            row = (
+                self._connection()
+                .execute(
+                    f"SELECT id FROM history WHERE {base} ORDER BY id DESC "
+                    "LIMIT 1 OFFSET ?",
+                    (user, key, max_entries - 1),
+                )
+                .fetchone()
+            )
+            if row is not None:
+                delete("id < ?", [row["id"]])
+        return removed, reclaimed
+
+    def user_bytes(self, user: str) -> int:
+        """Return the stored message bytes for a user."""
+        row = (
+            self._connection()
+            .execute(
+                "SELECT COALESCE(SUM(LENGTH(CAST(message AS BLOB))), 0) "
+                "FROM history WHERE user = ?",
+                (user,),
+            )
+            .fetchone()
+        )
+        return row[0]
+
+    def oldest_timestamp(self, user: str, character_name: str) -> Optional[str]:
+        """Return the timestamp of a character's oldest row."""
+        row = (
+            self._connection()
+            .execute(
+                "SELECT MIN(timestamp) FROM history WHERE user = ? AND character = ?",
+                (user, character_key(character_name)),
+            )
+            .fetchone()
+        )
+        return row[0]
+
+    def drop_oldest(
+        self, user: str, character_name: str, bytes_to_free: int
+    ) -> Tuple[int, int]:
+        """Delete a character's oldest rows until ``bytes_to_free`` is freed."""
+        conn = self._connection()
+        key = character_key(character_name)
+        removed = reclaimed = 0
+        while reclaimed < bytes_to_free:
+            rows = conn.execute(
+                "SELECT id, LENGTH(CAST(message AS BLOB)) AS size FROM history "
+                "WHERE user = ? AND character = ? ORDER BY id LIMIT ?",
+                (user, key, PRUNE_BATCH_SIZE),
+            ).fetchall()
+            if not rows:
+                break
+            batch = []
+            for row in rows:
+                batch.append((row["id"],))
+                reclaimed += row["size"]
+                if reclaimed >= bytes_to_free:
+                    break
+            with conn:
+                conn.executemany("DELETE FROM history WHERE id = ?", batch)
+            removed += len(batch)
+        return removed, reclaimed
+
+    # -- users -------------------------------------------------------------
+
+    def load_users(self) -> Dict[str, Any]:
+        """Return all user accounts as ``{username: password hash}``."""
+        rows = self._connection().execute("SELECT username, password FROM users")
+        return {row["username"]: row["password"] for row in rows}
+
+    def load_user(self, username: str) -> Optional[str]:
+        """Return one account's password hash, or None."""
+        row = (
+            self._connection()
+            .execute("SELECT password FROM users WHERE username = ?", (username,))
+            .fetchone()
+        )
+        return row["password"] if row is not None else None
+
+    def save_user(self, username: str, password: str) -> None:
+        """Insert or update one account."""
+        self.save_users({username: password})
+
+    def save_users(self, users: Dict[str, Any]) -> None:
+        """Insert or update the given accounts; other accounts are kept."""
+        with self._connection() as conn:
+            conn.executemany(
+                "INSERT INTO users (username, password) VALUES (?, ?) "
+                "ON CONFLICT(username) DO UPDATE SET password = excluded.password",
+                list(users.items()),
+            )
+
+    # -- feedback ----------------------------------------------------------
+
+    def add_feedback(
+        self, user: str, character_name: str, entry: Dict[str, Any]
+    ) -> int:
+        """Store one feedback entry and return its id."""
+        with self._connection() as conn:
+            cursor = conn.execute(
+                "INSERT INTO feedback (user, character, timestamp, rating, entry) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (
+                    user,
+                    character_key(character_name),
+                    entry.get("timestamp") or "",
+                    1 if entry.get("rating") == 1 else 0,
+                    json.dumps(entry, ensure_ascii=False),
+                ),
+            )
+        return cursor.lastrowid
+
+    def feedback_summary(
+        self, user: str, character_name: str, *, recent: int = 10
+    ) -> Dict[str, Any]:
+        """Aggregate feedback the way ``feedback_summary.json`` records it."""
+        conn = self._connection()
+        key = character_key(character_name)
+        total, positive = conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(rating), 0) FROM feedback "
+            "WHERE user = ? AND character = ?",
+            (user, key),
+        ).fetchone()
+        recent_rows = conn.execute(
+            "SELECT id, entry FROM feedback WHERE user = ? AND character = ? "
+            "ORDER BY id DESC LIMIT ?",
+            (user, key, recent),
+        )
+        recent_feedbacks = []
+        for row in recent_rows:
+            entry = json.loads(row["entry"])
+            message = entry.get("message", "")
+            recent_feedbacks.append(
+                {
+                    "timestamp": entry.get("timestamp"),
+                    "message_snippet": (
+                        message[:50] + "..." if len(message) > 50 else message
+                    ),
+                    "rating": entry.get("rating"),
+                    "id": row["id"],
+                }
+            )
+        return {
+            "total_responses": total,
+            "positive_feedback": positive,
+            "negative_feedback": total - positive,
+            "feedback_ratio": positive / total if total else 0.0,
+            "recent_feedbacks": recent_feedbacks,
+        }
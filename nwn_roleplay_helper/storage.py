@@ -3,15 +3,43 @@
 import json
 import logging
 import os
-from typing import Any, Dict
+from typing import Any, Dict, Optional
 
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+from . import settings
 from .settings import USERS_FILE
+from .sqlite_store import SqliteStore
 
 logger = logging.getLogger(__name__)
 
+_SQLITE_STORES: Dict[str, SqliteStore] = {}
+
+
+def get_sqlite_store() -> Optional[SqliteStore]:
+    """Return the shared SQLite store, or None unless STORAGE_BACKEND=sqlite."""
+    if settings.STORAGE_BACKEND != "sqlite":
+        return None
+    path = settings.SQLITE_DB_PATH
+    store = _SQLITE_STORES.get(path)
+    if store is None:
+        store = _SQLITE_STORES.setdefault(path, SqliteStore(path))
+    return store
+
 
 def load_users() -> Dict[str, Any]:
-    """Load user accounts from a JSON file."""
+    """Load user accounts from the configured backend."""
+    store = get_sqlite_store()
+    if store is not None:
+        return store.load_users()
+    return load_users_file()
+
+
+def load_users_file() -> Dict[str, Any]:
+    """Load user accounts from the JSON file."""
     if os.path.exists(USERS_FILE):
         try:
             with open(USERS_FILE, "r") as f:
@@ -22,8 +50,48 @@ def load_users() -> Dict[str, Any]:
     return {}
 
 
+def load_user(username: Optional[str]) -> Optional[str]:
+    """Return one account's stored password, read fresh from the backend.
+
+    Every app process reads accounts on demand, so a registration or a
+    password upgrade in one process is seen by the others.
+    """
+    if not username:
+        return None
+    store = get_sqlite_store()
+    if store is not None:
+        return store.load_user(username)
+    return load_users_file().get(username)
+
+
+def save_user(username: str, password: str) -> None:
+    """Insert or update one account, leaving the others untouched."""
+    store = get_sqlite_store()
+    if store is not None:
+        store.save_user(username, password)
+        return
+    try:
+        # Re-read the file under a lock so an account another process added
+        # since is not overwritten, then swap the new file in whole.
+        with open(f"{USERS_FILE}.lock", "a+b") as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+            users = load_users_file()
+            users[username] = password
+            tmp_path = f"{USERS_FILE}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(users, f, indent=2)
+            os.replace(tmp_path, USERS_FILE)
+    except Exception as e:
+        logger.error(f"Error saving user {username}: {e}")
+
+
 def save_users(users: Dict[str, Any]) -> None:
-    """Save user accounts to a JSON file."""
+    """Save user accounts to the configured backend."""
+    store = get_sqlite_store()
+    if store is not None:
+        store.save_users(users)
+        return
     try:
         with open(USERS_FILE, "w") as f:
             json.dump(users, f, indent=2)
@@ -1,15 +1,58 @@
+// With SOCKETIO_SERIALIZER=msgpack the default parser cannot talk to the
+// server, so a missing msgpack parser must not fall back to it silently.
+const socketParserMissing = Boolean(window.SOCKETIO_PARSER_REQUIRED && !window.SOCKETIO_PARSER);
+
 // Initialize the Socket.IO connection
 const socket = io({ 
     withCredentials: true, 
-    transports: ['websocket'],  // Forcing WebSocket transport to avoid xhr poll errors
+    autoConnect: !socketParserMissing,
+    // WebSocket first; connect_error below falls back to long-polling,
+    // which the server may then upgrade.
+    transports: ['websocket', 'polling'],
     reconnectionAttempts: 10,
     reconnectionDelay: 1000,
     timeout: 5000,  // Reduce timeout to 5 seconds
     forceNew: true,
-    upgrade: false,  // Prevent transport upgrades initially
-    rememberUpgrade: false
+    // The connection is identified by a signed token, fetched again on every
+    // (re)connect, instead of the cookie session.
+    auth: (cb) => {
+        fetch('/api/socket_token', { credentials: 'same-origin' })
+            .then((response) => (response.ok ? response.json() : {}))
+            .then((data) => cb({ token: data.token }))
+            .catch(() => cb({}));
+    },
+    // Set by the page when the server uses SOCKETIO_SERIALIZER=msgpack
+    ...(window.SOCKETIO_PARSER ? { parser: window.SOCKETIO_PARSER } : {})
 });
 
+// Round-trip time of a latency_probe ack; each probe reports the previous one
+// so the server can compare transports.
+const LATENCY_PROBE_INTERVAL_MS = 30000;
+let lastProbeRttMs = null;
+
+function sendLatencyProbe() {
+    if (!socket.connected) {
+        return;
+    }
+    const started = performance.now();
+    socket.emit('latency_probe', { rtt_ms: lastProbeRttMs }, () => {
+        lastProbeRttMs = Math.round((performance.now() - started) * 10) / 10;
+    });
+}
+
+setInterval(sendLatencyProbe, LATENCY_PROBE_INTERVAL_MS);
+
+if (socketParserMissing) {
+    console.error('Socket.IO msgpack parser (window.msgpackParser) did not load; not connecting.');
+    document.addEventListener('DOMContentLoaded', () => {
+        const statusBadge = document.getElementById('socket-status');
+        if (statusBadge) {
+            statusBadge.className = 'badge bg-danger';
+            statusBadge.textContent = 'Error: msgpack parser missing';
+        }
+    });
+}
+
 // DOM elements
 const characterNameElement = document.getElementById('character-name');
 const characterDetailsElement = document.getElementById('character-details');
@@ -55,6 +98,16 @@ let voiceBaseText = '';
 // Maximum number of messages to keep in chat history
 const MAX_CHAT_HISTORY = 20;
 
+// Server history page size and per-character cursors ({after, etag})
+const HISTORY_PAGE_SIZE = 50;
+let historyCursors = {};
+
+// Set once a new_messages batch arrives. The server then sends the legacy
+// per-line new_message/player_message events only for older clients
+// (SOCKETIO_PER_LINE_MESSAGE_EVENTS), and they repeat lines the batch already
+// rendered, so this page ignores them.
+let receivesMessageBatches = false;
+
 // Helper function to clean em dashes
 function cleanEmDashes(text) {
     return text ? text.replace(/—/g, '-') : text;
@@ -172,6 +225,9 @@ socket.on('connect', () => {
         // Show transport info
         const transport = socket.io.engine.transport.name;
         statusBadge.textContent = `Connected (${transport})`;
+        socket.io.engine.once('upgrade', (upgraded) => {
+            statusBadge.textContent = `Connected (${upgraded.name})`;
+        });
     }
     
     // Get current user from navbar
@@ -186,6 +242,7 @@ socket.on('connect', () => {
     
     // Request initial data
     fetchCharacters();
+    sendLatencyProbe();
 
     // Initialize voice input after connection
     setupVoiceInput();
@@ -205,6 +262,11 @@ socket.on('disconnect', () => {
 
 socket.on('connect_error', (error) => {
     console.error('Connection error:', error);
+
+    // WebSocket blocked (proxy, firewall): retry with long-polling first
+    if (socket.io.opts.transports[0] === 'websocket') {
+        socket.io.opts.transports = ['polling', 'websocket'];
+    }
     
     // Update connection status indicator
     const statusBadge = document.getElementById('socket-status');
@@ -226,6 +288,9 @@ socket.on('character_change', (data) => {
 // Listen for new chat messages
 socket.on('new_message', (data) => {
     console.log('[DEBUG] new_message event received:', data);
+    if (receivesMessageBatches) {
+        return;
+    }
     // Debug diagnostic information
     console.log('%c NEW MESSAGE RECEIVED', 'background: green; color: white; font-size: 16px;');
     console.log('Message data:', data);
@@ -352,6 +417,15 @@ socket.on('system_message', (data) => {
 // Listen for player messages that may need a response
 socket.on('player_message', (data) => {
     console.log('[DEBUG] player_message event received:', data);
+    if (receivesMessageBatches) {
+        return;
+    }
+    showPlayerMessage(data, true);
+});
+
+// Make a player's message the one to respond to, optionally recording it in
+// the chat history used for AI context
+function showPlayerMessage(data, recordHistory) {
     console.log('Player message:', data);
     
     // Check if this message is relevant to the current user
@@ -379,7 +453,7 @@ socket.on('player_message', (data) => {
     };
     
     // Add to chat history if relevant to this user
-    if (isRelevantToUser) {
+    if (recordHistory && isRelevantToUser) {
         addToChatHistory({
             speaker: data.player_name,
             text: data.message,
@@ -389,6 +463,89 @@ socket.on('player_message', (data) => {
             timestamp: new Date().toISOString()
         });
     }
+}
+
+// Listen for batched chat messages: every Talk line from one log update,
+// rendered in a single DOM pass
+// new_messages batches arrive either as full message objects or as compact
+// rows of parsed fields (see COMPACT_MESSAGE_FIELDS on the server); expand the
+// rows into the same objects so both formats render identically.
+function expandNewMessages(data) {
+    if (!data) {
+        return [];
+    }
+    if (!data.rows) {
+        return data.messages || [];
+    }
+    const fields = data.fields || [];
+    const languages = data.languages || {};
+    return data.rows.map((row) => {
+        const record = {};
+        fields.forEach((field, index) => {
+            record[field] = row[index];
+        });
+        const isOwn = Boolean(record.own);
+        return {
+            character: record.character,
+            message: `<strong>${record.speaker}:</strong> ${record.text}`,
+            is_own: isOwn,
+            original_message: isOwn ? null : record.text,
+            player_name: record.speaker,
+            mode: record.mode,
+            language_code: record.language || null,
+            language_name: record.language ? (languages[record.language] || null) : null
+        };
+    });
+}
+
+socket.on('new_messages', (data) => {
+    receivesMessageBatches = true;
+    const messages = expandNewMessages(data);
+    console.log(`[DEBUG] new_messages event received: ${messages.length} messages`);
+    if (!messages.length || !chatMessagesElement) {
+        return;
+    }
+    document.title = "New message!";
+
+    const isRelevantToUser = !data.client || data.client === currentUser;
+    const fragment = document.createDocumentFragment();
+    let latestFromPlayer = null;
+    messages.forEach((message) => {
+        fragment.appendChild(buildChatMessageElement(
+            message.message,
+            message.is_own,
+            message.original_message,
+            {
+                languageCode: message.language_code || null,
+                languageName: message.language_name || null
+            }
+        ));
+        if (!message.is_own) {
+            if (isRelevantToUser) {
+                addToChatHistory({
+                    speaker: message.player_name,
+                    text: message.original_message,
+                    languageCode: message.language_code || null,
+                    languageName: message.language_name || null,
+                    isSelf: false,
+                    timestamp: new Date().toISOString()
+                });
+            }
+            latestFromPlayer = message;
+        }
+    });
+    chatMessagesElement.appendChild(fragment);
+    chatMessagesElement.scrollTop = chatMessagesElement.scrollHeight;
+
+    if (latestFromPlayer) {
+        showPlayerMessage({
+            player_name: latestFromPlayer.player_name,
+            message: latestFromPlayer.original_message,
+            language_code: latestFromPlayer.language_code,
+            language_name: latestFromPlayer.language_name,
+            client: data.client
+        }, false);
+    }
 });
 
 // Listen for AI generated responses
@@ -858,6 +1015,25 @@ function appendChatMessage(message, isSelf, originalMessage, language = {}) {
         return null;
     }
     
+    const messageElement = buildChatMessageElement(message, isSelf, originalMessage, language);
+    
+    // Append the message
+    chatContainer.appendChild(messageElement);
+    console.log('Message element added to DOM', messageElement);
+    
+    // Force auto-scroll
+    chatContainer.scrollTop = chatContainer.scrollHeight;
+    
+    // Return the element for debugging
+    return messageElement;
+    } catch (error) {
+        console.error('Error appending message:', error);
+        return null;
+    }
+}
+
+// Build (but do not insert) the element for one chat message
+function buildChatMessageElement(message, isSelf, originalMessage, language = {}) {
         const messageElement = document.createElement('div');
         messageElement.className = isSelf ? 'message message-self' : 'message message-other';
         
@@ -964,19 +1140,7 @@ function appendChatMessage(message, isSelf, originalMessage, language = {}) {
         console.error('Error setting up clickable message:', error);
     }
     
-    // Append the message
-    chatContainer.appendChild(messageElement);
-    console.log('Message element added to DOM', messageElement);
-    
-    // Force auto-scroll
-    chatContainer.scrollTop = chatContainer.scrollHeight;
-    
-    // Return the element for debugging
     return messageElement;
-    } catch (error) {
-        console.error('Error appending message:', error);
-        return null;
-    }
 }
 
 function displayResponseOptions(responses) {
@@ -1324,9 +1488,40 @@ function buildConversationContext(playerName) {
  * @param {string} characterName - The name of the character
  */
 function loadChatHistory(characterName) {
-    fetch(`/api/history/${encodeURIComponent(characterName)}`)
-        .then(response => response.json())
-        .then(history => {
+    // Only the latest page is fetched the first time; afterwards only entries
+    // newer than the last one seen are requested, and an unchanged history
+    // answers 304 Not Modified.
+    const cursor = historyCursors[characterName];
+    const params = new URLSearchParams({ limit: HISTORY_PAGE_SIZE });
+    const headers = {};
+    if (cursor && cursor.after !== null && cursor.after !== undefined) {
+        params.set('after', cursor.after);
+    }
+    if (cursor && cursor.etag) {
+        headers['If-None-Match'] = cursor.etag;
+    }
+
+    fetch(`/api/history/${encodeURIComponent(characterName)}?${params}`, { headers })
+        .then(response => {
+            if (response.status === 304) {
+                return null;
+            }
+            const etag = response.headers.get('ETag');
+            return response.json().then(page => ({ page, etag }));
+        })
+        .then(result => {
+            if (!result) {
+                console.log(`Chat history for ${characterName} is up to date`);
+                return;
+            }
+            const { page, etag } = result;
+            const history = page.entries || [];
+            historyCursors[characterName] = {
+                after: page.after !== null && page.after !== undefined
+                    ? page.after
+                    : (cursor ? cursor.after : null),
+                etag: etag
+            };
             console.log(`Loaded ${history.length} chat history entries for ${characterName}`);
             
             // Ensure user chat history exists
@@ -2,3 +2,14 @@ import sys
 from pathlib import Path
 
 sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import pytest  # noqa: E402
+
+from nwn_roleplay_helper import settings  # noqa: E402
+
+
+@pytest.fixture(autouse=True)
+def _no_presence_broadcasts(monkeypatch):
+    # A debounced active_users_delta from one test's sockets must not land in
+    # the next test's clients; presence tests set their own window.
+    monkeypatch.setattr(settings, "PRESENCE_DEBOUNCE_SECONDS", 3600.0)
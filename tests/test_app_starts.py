@@ -1,3 +1,9 @@
+import sys
+import types
+
+import pytest
+
+import app as app_module
 from app import app
 
 
@@ -7,3 +13,17 @@ def test_health_endpoint():
     assert resp.status_code == 200
     data = resp.get_json()
     assert data["status"] == "ok"
+
+
+def test_msgpack_serializer_needs_the_vendored_browser_parser(tmp_path, monkeypatch):
+    monkeypatch.setitem(sys.modules, "msgpack", types.ModuleType("msgpack"))
+    monkeypatch.setattr(app_module, "SOCKETIO_SERIALIZER", "msgpack")
+    monkeypatch.setattr(app, "static_folder", str(tmp_path))
+
+    with pytest.raises(RuntimeError, match="browser parser"):
+        app_module._socketio_serializer_options()
+
+    parser = tmp_path / app_module.MSGPACK_PARSER_SCRIPT
+    parser.parent.mkdir(parents=True)
+    parser.write_text("window.msgpackParser = {};")
+    assert app_module._socketio_serializer_options() == {"serializer": "msgpack"}
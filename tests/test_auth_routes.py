@@ -16,7 +16,19 @@ def test_register_page_loads():
 def test_debug_routes_require_login():
     client = app.test_client()
 
-    for path in ("/debug", "/debug_last_log", "/debug_websocket", "/socket_test"):
+    for path in (
+        "/debug",
+        "/debug_last_log",
+        "/debug_ingestion",
+        "/debug_recent_lines",
+        "/debug_socket_latency",
+        "/debug_presence",
+        "/debug_history_writer",
+        "/debug_history_cache",
+        "/debug_history_retention",
+        "/debug_websocket",
+        "/socket_test",
+    ):
         resp = client.get(path)
         assert resp.status_code == 302
         assert "/login" in resp.headers["Location"]
@@ -29,7 +41,19 @@ def test_debug_routes_are_disabled_by_default_for_logged_in_users():
     with client.session_transaction() as sess:
         sess["user"] = "tester"
 
-    for path in ("/debug", "/debug_last_log", "/debug_websocket", "/socket_test"):
+    for path in (
+        "/debug",
+        "/debug_last_log",
+        "/debug_ingestion",
+        "/debug_recent_lines",
+        "/debug_socket_latency",
+        "/debug_presence",
+        "/debug_history_writer",
+        "/debug_history_cache",
+        "/debug_history_retention",
+        "/debug_websocket",
+        "/socket_test",
+    ):
         resp = client.get(path)
         assert resp.status_code == 404
 
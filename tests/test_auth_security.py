@@ -1,3 +1,7 @@
+import json
+
+import app as app_module
+from nwn_roleplay_helper import storage
 from nwn_roleplay_helper.auth import hash_password, is_password_hash, verify_password
 
 
@@ -13,3 +17,27 @@ def test_hash_password_does_not_store_plain_text():
 def test_verify_password_accepts_legacy_plain_text():
     assert verify_password("legacy-password", "legacy-password")
     assert not verify_password("legacy-password", "wrong")
+
+
+def test_accounts_written_by_another_process_are_seen(tmp_path, monkeypatch):
+    users_file = str(tmp_path / "users.json")
+    monkeypatch.setattr(storage, "USERS_FILE", users_file)
+    client = app_module.app.test_client()
+
+    # Another app process registers an account and keeps the legacy one.
+    storage.save_user("legacy", "plain-text")
+    storage.save_user("alice", hash_password("secret"))
+
+    resp = client.post("/login", data={"username": "alice", "password": "secret"})
+    assert resp.headers["Location"].endswith("/")
+    resp = client.post(
+        "/register",
+        data={"username": "alice", "password": "x", "confirm_password": "x"},
+    )
+    assert resp.headers["Location"].endswith("/register")
+
+    client.post("/login", data={"username": "legacy", "password": "plain-text"})
+    with open(users_file) as f:
+        users = json.load(f)
+    assert set(users) == {"legacy", "alice"}
+    assert is_password_hash(users["legacy"])
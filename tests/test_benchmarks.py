@@ -0,0 +1,32 @@
+from benchmarks import ingestion as bench
+from benchmarks.corpus import generate_corpus
+from nwn_roleplay_helper import chat_processing
+from nwn_roleplay_helper.chat_parser import parse_line
+
+
+def test_corpus_is_seeded_and_mixes_line_kinds():
+    lines = generate_corpus(500, seed=7, client="BenchClient")
+
+    assert lines == generate_corpus(500, seed=7, client="BenchClient")
+    assert lines != generate_corpus(500, seed=8, client="BenchClient")
+    parsed = [parse_line(line, "BenchClient") for line in lines]
+    assert any(p.mode == "Talk" and p.language for p in parsed)
+    assert any(p.mode not in (None, "Talk") for p in parsed)
+    assert any(p.is_system for p in parsed)
+    assert any(" attacks " in line for line in lines)
+
+
+def test_every_path_processes_the_corpus_without_touching_history():
+    writer = chat_processing.HISTORY_WRITER
+
+    results = bench.run(lines=300, seed=3, batch_size=50)
+
+    assert chat_processing.HISTORY_WRITER is writer
+    assert [result["path"] for result in results] == list(bench.PATHS)
+    entries = {result["history_entries"] for result in results}
+    assert len(entries) == 1 and entries.pop() > 0
+    for result in results:
+        assert result["lines"] == 300
+        assert result["lines_per_sec"] > 0
+        assert 0 < result["emits_per_line"] <= 1
+        assert result["latency_ms"]["p50"] <= result["latency_ms"]["p99"]
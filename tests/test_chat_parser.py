@@ -0,0 +1,73 @@
+from nwn_roleplay_helper import chat_parser
+from nwn_roleplay_helper.chat_parser import parse_line, speaker_index
+
+
+def test_talk_line_is_parsed_with_language():
+    parsed = parse_line(
+        "[Viper's Wit] Auguste Detourne: [Talk] <c>[HM]</c> Good day, Monsieur.",
+        "D6lab",
+    )
+
+    assert parsed.account == "Viper's Wit"
+    assert parsed.speaker == "Auguste Detourne"
+    assert parsed.mode == "Talk"
+    assert parsed.text == "Good day, Monsieur."
+    assert parsed.language == "HM"
+    assert parsed.language_name == "High Mordentish"
+    assert not parsed.is_own
+    assert not parsed.is_system
+
+
+def test_own_menu_line_is_system():
+    parsed = parse_line("[D6lab] Hero: [Talk] What would you like to do?", "D6lab")
+
+    assert parsed.is_own
+    assert parsed.is_system
+
+
+def test_other_modes_and_unstructured_lines():
+    whisper = parse_line("[acct] Someone: [Whisper] <c>psst</c>", "D6lab")
+    assert whisper.mode == "Whisper"
+    assert whisper.text == "psst"
+    assert whisper.language is None
+
+    plain = parse_line("You gained 10 experience.", "D6lab")
+    assert not plain.is_chat
+    assert plain.speaker is None
+    assert plain.language_name is None
+
+
+def test_speaker_index_resolves_own_characters_only():
+    index = speaker_index("D6lab", ["Hero", "Alt Two"])
+
+    assert index.resolve(parse_line("[D6lab] Alt Two: [Talk] hi", "D6lab")) == (
+        "Alt Two"
+    )
+    assert index.resolve(parse_line("[other] Hero: [Talk] hi", "D6lab")) is None
+    assert index.resolve(parse_line("[D6lab] Stranger: [Talk] hi", "D6lab")) is None
+    # Lines outside the chat format still match on the account prefix.
+    assert index.resolve(parse_line("[D6lab] Hero joined the party", "D6lab")) == (
+        "Hero"
+    )
+
+
+def test_speaker_index_is_rebuilt_when_characters_change():
+    first = speaker_index("rebuild-client", ["Hero"])
+    assert speaker_index("rebuild-client", ["Hero"]) is first
+
+    second = speaker_index("rebuild-client", ["Hero", "Alt"])
+    assert second is not first
+    assert second.resolve(parse_line("[rebuild-client] Alt: [Talk] x")) == "Alt"
+
+
+def test_speaker_indexes_keep_only_recent_clients(monkeypatch):
+    monkeypatch.setattr(chat_parser, "MAX_SPEAKER_INDEXES", 3)
+    kept = speaker_index("kept-client", ["Hero"])
+
+    for n in range(10):
+        speaker_index(f"spam-{n}", [])
+        # A client in use stays cached.
+        assert speaker_index("kept-client", ["Hero"]) is kept
+
+    assert len(chat_parser._SPEAKER_INDEXES) == 3
+    assert "spam-0" not in chat_parser._SPEAKER_INDEXES
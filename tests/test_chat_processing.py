@@ -1,15 +1,29 @@
+import pytest
+
+from nwn_roleplay_helper import chat_processing, settings
 from nwn_roleplay_helper.chat_processing import process_new_messages
 
 
 class FakeSocketIO:
     def __init__(self):
         self.events = []
+        self.rooms = []
 
-    def emit(self, event, payload):
+    def emit(self, event, payload, **kwargs):
         self.events.append((event, payload))
+        self.rooms.append(kwargs.get("to"))
+
+
+class FakeWriter:
+    def __init__(self):
+        self.entries = {}
+
+    def enqueue(self, user, character_name, entries):
+        self.entries.setdefault(character_name, []).extend(entries)
 
 
-def test_hm_chat_markup_is_preserved_as_player_message():
+def test_hm_chat_markup_is_preserved_as_player_message(monkeypatch):
+    monkeypatch.setattr(settings, "SOCKETIO_PER_LINE_MESSAGE_EVENTS", True)
     socketio = FakeSocketIO()
 
     process_new_messages(
@@ -37,3 +51,100 @@ def test_hm_chat_markup_is_preserved_as_player_message():
     assert player_messages[0]["message"] == "Good day, Monsieur."
     assert player_messages[0]["language_code"] == "HM"
     assert player_messages[0]["language_name"] == "High Mordentish"
+
+
+def test_lines_are_attributed_to_the_speaking_character(monkeypatch):
+    writer = FakeWriter()
+    monkeypatch.setattr(chat_processing, "HISTORY_WRITER", writer)
+    socketio = FakeSocketIO()
+
+    process_new_messages(
+        "[D6lab] Alt Two: [Talk] Hello there.\n[D6lab] Hero: [Talk] And hi.",
+        client="D6lab",
+        user_characters={"Hero": {}, "Alt Two": {}},
+        character_profiles={},
+        socketio=socketio,
+    )
+
+    [(event, payload)] = socketio.events
+    assert event == "new_messages"
+    column = payload["fields"].index("character")
+    assert [row[column] for row in payload["rows"]] == ["Alt Two", "Hero"]
+    assert sorted(writer.entries) == ["Alt Two", "Hero"]
+
+
+def test_batch_is_broadcast_as_one_event(monkeypatch):
+    monkeypatch.setattr(settings, "SOCKETIO_MESSAGE_FORMAT", "full")
+    monkeypatch.setattr(chat_processing, "HISTORY_WRITER", FakeWriter())
+    socketio = FakeSocketIO()
+
+    process_new_messages(
+        [
+            "[acct] Auguste: [Talk] <c>[HM]</c> Good day.",
+            "[acct] Auguste: [Party] not shown",
+            "[D6lab] Hero: [Talk] Hello.",
+        ],
+        client="D6lab",
+        user_characters={"Hero": {}},
+        character_profiles={},
+        socketio=socketio,
+    )
+
+    [(event, payload)] = socketio.events
+    assert event == "new_messages"
+    assert socketio.rooms == ["user:D6lab"]
+    assert payload["client"] == "D6lab"
+    first, second = payload["messages"]
+    assert first["player_name"] == "Auguste"
+    assert first["original_message"] == "Good day."
+    assert first["language_name"] == "High Mordentish"
+    assert not first["is_own"]
+    assert second["is_own"]
+    assert second["original_message"] is None
+
+
+def test_compact_batch_sends_parsed_fields_once(monkeypatch):
+    monkeypatch.setattr(chat_processing, "HISTORY_WRITER", FakeWriter())
+    socketio = FakeSocketIO()
+
+    process_new_messages(
+        [
+            "[acct] Auguste: [Talk] <c>[HM]</c> Good day.",
+            "[D6lab] Hero: [Talk] Hello.",
+        ],
+        client="D6lab",
+        user_characters={"Hero": {}},
+        character_profiles={},
+        socketio=socketio,
+    )
+
+    [(event, payload)] = socketio.events
+    assert event == "new_messages"
+    assert payload == {
+        "client": "D6lab",
+        "fields": ["character", "speaker", "text", "mode", "language", "own"],
+        "rows": [
+            ["Hero", "Auguste", "Good day.", "Talk", "HM", 0],
+            ["Hero", "Hero", "Hello.", "Talk", None, 1],
+        ],
+        "languages": {"HM": "High Mordentish"},
+    }
+
+
+def test_a_failed_batch_is_neither_broadcast_nor_stored(monkeypatch):
+    writer = FakeWriter()
+    monkeypatch.setattr(chat_processing, "HISTORY_WRITER", writer)
+    socketio = FakeSocketIO()
+
+    with pytest.raises(AttributeError):
+        process_new_messages(
+            ["[D6lab] Hero: [Talk] Hello.", 5],
+            client="D6lab",
+            user_characters={"Hero": {}},
+            character_profiles={},
+            socketio=socketio,
+        )
+
+    # The client resends the whole update, so a partial batch would repeat.
+    assert socketio.events == []
+    assert writer.entries == {}
@@ -0,0 +1,84 @@
+import logging
+
+from nwn_roleplay_helper import diagnostics, settings
+from nwn_roleplay_helper.chat_processing import process_new_messages
+
+
+class FakeSocketIO:
+    def emit(self, event, payload, **kwargs):
+        pass
+
+
+class FakeWriter:
+    def enqueue(self, user, character_name, entries):
+        pass
+
+
+def test_recent_lines_keeps_only_the_newest_lines():
+    recent = diagnostics.RecentLines(maxlen=3)
+
+    for i in range(5):
+        recent.record("a" if i % 2 else "b", f"line {i}")
+
+    assert [entry["line"] for entry in recent.snapshot()] == [
+        "line 2",
+        "line 3",
+        "line 4",
+    ]
+    assert [entry["line"] for entry in recent.snapshot(client="a")] == ["line 3"]
+    assert [entry["line"] for entry in recent.snapshot(limit=1)] == ["line 4"]
+
+
+def test_sampled_events_are_logged_as_a_periodic_summary(monkeypatch, caplog):
+    monkeypatch.setattr(settings, "LOG_HOT_PATH", "sampled")
+    monkeypatch.setattr(settings, "LOG_SAMPLE_INTERVAL_SECONDS", 3600)
+    hot_path = diagnostics.HotPathLog()
+    logger = logging.getLogger("test_diagnostics")
+
+    with caplog.at_level(logging.INFO, logger="test_diagnostics"):
+        for _ in range(3):
+            hot_path.event(logger, "skipped", "detail")
+        assert caplog.records == []
+
+        monkeypatch.setattr(settings, "LOG_SAMPLE_INTERVAL_SECONDS", 0)
+        hot_path.event(logger, "skipped", "detail")
+
+    [record] = caplog.records
+    assert "skipped=4" in record.getMessage()
+    assert hot_path.stats()["totals"] == {"skipped": 4}
+
+
+def test_verbose_mode_logs_every_event(monkeypatch, caplog):
+    monkeypatch.setattr(settings, "LOG_HOT_PATH", "verbose")
+    hot_path = diagnostics.HotPathLog()
+    logger = logging.getLogger("test_diagnostics")
+
+    with caplog.at_level(logging.INFO, logger="test_diagnostics"):
+        hot_path.event(logger, "skipped", "one")
+        hot_path.event(logger, "skipped", "two")
+
+    assert [record.getMessage() for record in caplog.records] == [
+        "skipped: one",
+        "skipped: two",
+    ]
+
+
+def test_processed_lines_are_kept_in_the_ring_buffer(monkeypatch):
+    recent = diagnostics.RecentLines(maxlen=10)
+    monkeypatch.setattr("nwn_roleplay_helper.chat_processing.RECENT_LINES", recent)
+    monkeypatch.setattr(
+        "nwn_roleplay_helper.chat_processing.HISTORY_WRITER", FakeWriter()
+    )
+
+    process_new_messages(
+        "[D6lab] Hero: [Talk] Hello.\n\nHero attacks Goblin",
+        client="D6lab",
+        user_characters={"Hero": {}},
+        character_profiles={},
+        socketio=FakeSocketIO(),
+    )
+
+    assert [entry["line"] for entry in recent.snapshot(client="D6lab")] == [
+        "[D6lab] Hero: [Talk] Hello.",
+        "Hero attacks Goblin",
+    ]
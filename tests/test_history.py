@@ -0,0 +1,214 @@
+import json
+import multiprocessing
+
+import pytest
+
+from nwn_roleplay_helper import history, settings
+
+
+def test_legacy_json_history_is_migrated_to_journal(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "CHAT_HISTORY_DIR", str(tmp_path))
+    character_dir = tmp_path / "tester" / "Elvith_Ma'for"
+    character_dir.mkdir(parents=True)
+    legacy = [
+        {"timestamp": "2025-01-01 10:00:00", "sender": "other", "message": "Hi"},
+        {"timestamp": "2025-01-01 10:00:05", "sender": "self", "message": "Hello"},
+    ]
+    (character_dir / "chat_history.json").write_text(
+        json.dumps(legacy, indent=2), encoding="utf-8"
+    )
+
+    assert history.load_entries("tester", "Elvith Ma'for") == legacy
+    assert (character_dir / "chat_history.jsonl").exists()
+    assert not (character_dir / "chat_history.json").exists()
+    assert (character_dir / "chat_history.json.migrated").exists()
+
+
+def test_append_entries_writes_one_line_per_entry(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "CHAT_HISTORY_DIR", str(tmp_path))
+    first = history.make_entry("2025-01-01 10:00:00", "other", "[A] B: [Talk] Hi")
+    second = history.make_entry("2025-01-01 10:00:01", "self", "[C] D: [Talk] Yo")
+
+    written = history.append_entries("tester", "Norfind", [first])
+    written += history.append_entries("tester", "Norfind", [second])
+
+    journal = tmp_path / "tester" / "Norfind" / "chat_history.jsonl"
+    assert written == journal.stat().st_size
+    assert len(journal.read_bytes().splitlines()) == 2
+    assert history.load_entries("tester", "Norfind") == [first, second]
+
+
+def test_torn_trailing_line_is_ignored(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "CHAT_HISTORY_DIR", str(tmp_path))
+    entry = history.make_entry("2025-01-01 10:00:00", "other", "Hi")
+    history.append_entries("tester", "Norfind", [entry])
+    journal = tmp_path / "tester" / "Norfind" / "chat_history.jsonl"
+    with open(journal, "ab") as f:
+        f.write(b'{"timestamp": "2025-01-01')
+
+    assert history.load_entries("tester", "Norfind") == [entry]
+
+
+def test_tail_reader_returns_newest_entries_across_blocks(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "CHAT_HISTORY_DIR", str(tmp_path))
+    entries = [
+        history.make_entry(
+            "2025-01-01 10:00:00", "ai" if i % 3 == 0 else "other", f"line {i}"
+        )
+        for i in range(200)
+    ]
+    history.append_entries("tester", "Norfind", entries)
+
+    store = history.JsonlHistoryStore(block_size=64)
+    reversed_entries = [entry for _, entry in store.iter_reversed("tester", "Norfind")]
+    assert reversed_entries == entries[::-1]
+
+    tail = history.tail_entries("tester", "Norfind", 5, senders={"other"})
+    assert [entry["message"] for entry in tail] == [
+        "line 193",
+        "line 194",
+        "line 196",
+        "line 197",
+        "line 199",
+    ]
+    assert history.entry_count("tester", "Norfind") == 200
+
+    history.append_entries("tester", "Norfind", entries[:3])
+    assert history.entry_count("tester", "Norfind") == 203
+
+
+def test_read_page_cursors_walk_backwards_and_forwards(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "CHAT_HISTORY_DIR", str(tmp_path))
+    entries = [
+        history.make_entry("2025-01-01 10:00:00", "other", f"line {i}")
+        for i in range(10)
+    ]
+    history.append_entries("tester", "Norfind", entries)
+
+    latest = history.read_page("tester", "Norfind", limit=4)
+    assert [e["message"] for e in latest["entries"]] == [
+        "line 6",
+        "line 7",
+        "line 8",
+        "line 9",
+    ]
+    assert latest["has_more"] is True
+
+    older = history.read_page("tester", "Norfind", limit=4, before=latest["before"])
+    assert [e["message"] for e in older["entries"]] == [
+        "line 2",
+        "line 3",
+        "line 4",
+        "line 5",
+    ]
+
+    history.append_entries(
+        "tester", "Norfind", [history.make_entry("2025-01-01", "other", "line 10")]
+    )
+    delta = history.read_page("tester", "Norfind", limit=4, after=latest["after"])
+    assert [e["message"] for e in delta["entries"]] == ["line 10"]
+    assert delta["has_more"] is False
+
+
+def _rotating_history(tmp_path, monkeypatch, count=32):
+    monkeypatch.setattr(settings, "CHAT_HISTORY_DIR", str(tmp_path))
+    monkeypatch.setattr(settings, "HISTORY_SEGMENT_MAX_BYTES", 400)
+    entries = [
+        history.make_entry(f"2025-01-{i // 10 + 1:02d} 10:00:00", "other", f"line {i}")
+        for i in range(count)
+    ]
+    for entry in entries:
+        history.append_entries("tester", "Norfind", [entry])
+    return entries, tmp_path / "tester" / "Norfind"
+
+
+def test_hot_segment_rotates_into_compressed_segments(tmp_path, monkeypatch):
+    entries, character_dir = _rotating_history(tmp_path, monkeypatch)
+
+    manifest = json.loads((character_dir / "manifest.json").read_text())
+    assert len(manifest["segments"]) >= 2
+    assert all(
+        (character_dir / "segments" / segment["file"]).exists()
+        for segment in manifest["segments"]
+    )
+    assert not list((character_dir / "segments").glob("*.jsonl"))
+    assert (character_dir / "chat_history.jsonl").stat().st_size < 400
+
+    assert history.load_entries("tester", "Norfind") == entries
+    assert list(history.iter_entries_reversed("tester", "Norfind")) == entries[::-1]
+    assert history.tail_entries("tester", "Norfind", 12) == entries[-12:]
+    assert history.entry_count("tester", "Norfind") == 32
+
+
+def test_entry_ids_are_stable_across_rotation(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "CHAT_HISTORY_DIR", str(tmp_path))
+    entries = [
+        history.make_entry("2025-01-01 10:00:00", "other", f"line {i}")
+        for i in range(10)
+    ]
+    history.append_entries("tester", "Norfind", entries)
+    before = history.read_page("tester", "Norfind", limit=10)
+
+    history.rotate_segment(str(tmp_path / "tester" / "Norfind"))
+    history.append_entries(
+        "tester", "Norfind", [history.make_entry("2025-01-02", "other", "line 10")]
+    )
+
+    after = history.read_page("tester", "Norfind", limit=10, before=None)
+    assert after["entries"][:-1] == before["entries"][1:]
+    delta = history.read_page("tester", "Norfind", limit=5, after=before["after"])
+    assert [e["message"] for e in delta["entries"]] == ["line 10"]
+
+    older = history.read_page("tester", "Norfind", limit=3, before=after["before"])
+    assert [e["message"] for e in older["entries"]] == ["line 0"]
+    assert older["has_more"] is False
+
+
+def test_entries_between_skips_segments_outside_window(tmp_path, monkeypatch):
+    entries, character_dir = _rotating_history(tmp_path, monkeypatch)
+    read = []
+    original = history._read_segment
+
+    def tracking_read(directory, segment):
+        read.append(segment["file"])
+        return original(directory, segment)
+
+    monkeypatch.setattr(history, "_read_segment", tracking_read)
+
+    window = history.entries_between(
+        "tester", "Norfind", since="2025-01-03", until="2025-01-03 23:59:59"
+    )
+
+    assert window == entries[20:30]
+    manifest = json.loads((character_dir / "manifest.json").read_text())
+    assert len(read) < len(manifest["segments"])
+
+
+def _append_lines(prefix, count):
+    for i in range(count):
+        history.append_entries(
+            "tester",
+            "Norfind",
+            [history.make_entry("2025-01-01", "other", f"{prefix}{i}")],
+        )
+
+
+@pytest.mark.skipif(history.fcntl is None, reason="needs fcntl")
+def test_processes_sharing_a_history_dir_do_not_lose_entries(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "CHAT_HISTORY_DIR", str(tmp_path))
+    monkeypatch.setattr(settings, "HISTORY_SEGMENT_MAX_BYTES", 400)
+    context = multiprocessing.get_context("fork")
+    workers = [
+        context.Process(target=_append_lines, args=(prefix, 60)) for prefix in "ab"
+    ]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join(30)
+
+    messages = [e["message"] for e in history.load_entries("tester", "Norfind")]
+    for prefix in "ab":
+        assert [m for m in messages if m[0] == prefix] == [
+            f"{prefix}{i}" for i in range(60)
+        ]
+    assert not list((tmp_path / "tester" / "Norfind" / "segments").glob("*.jsonl"))
@@ -0,0 +1,66 @@
+from app import app
+from nwn_roleplay_helper import history, settings
+
+
+def _logged_in_client():
+    client = app.test_client()
+    with client.session_transaction() as sess:
+        sess["user"] = "tester"
+    return client
+
+
+def test_history_page_supports_cursors_and_etags(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "CHAT_HISTORY_DIR", str(tmp_path))
+    history.append_entries(
+        "tester",
+        "Norfind",
+        [
+            history.make_entry("2025-01-01 10:00:00", "other", f"line {i}")
+            for i in range(5)
+        ],
+    )
+    client = _logged_in_client()
+
+    resp = client.get("/api/history/Norfind?limit=2")
+    assert resp.status_code == 200
+    page = resp.get_json()
+    assert [e["message"] for e in page["entries"]] == ["line 3", "line 4"]
+    assert page["has_more"] is True
+
+    delta_url = f"/api/history/Norfind?limit=2&after={page['after']}"
+    resp = client.get(delta_url)
+    assert resp.get_json()["entries"] == []
+    etag = resp.headers["ETag"]
+
+    resp = client.get(delta_url, headers={"If-None-Match": etag})
+    assert resp.status_code == 304
+
+    history.append_entries(
+        "tester", "Norfind", [history.make_entry("2025-01-01", "other", "line 5")]
+    )
+    resp = client.get(delta_url, headers={"If-None-Match": etag})
+    assert resp.status_code == 200
+    assert [e["message"] for e in resp.get_json()["entries"]] == ["line 5"]
+
+
+def test_history_without_arguments_returns_full_list(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "CHAT_HISTORY_DIR", str(tmp_path))
+    entry = history.make_entry("2025-01-01 10:00:00", "other", "line")
+    history.append_entries("tester", "Norfind", [entry])
+
+    resp = _logged_in_client().get("/api/history/Norfind")
+
+    assert resp.get_json() == [entry]
+
+
+def test_history_time_range_query(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "CHAT_HISTORY_DIR", str(tmp_path))
+    entries = [
+        history.make_entry(f"2025-01-0{day} 10:00:00", "other", f"day {day}")
+        for day in range(1, 4)
+    ]
+    history.append_entries("tester", "Norfind", entries)
+
+    resp = _logged_in_client().get("/api/history/Norfind?since=2025-01-02")
+
+    assert resp.get_json() == entries[1:]
@@ -0,0 +1,177 @@
+import threading
+from itertools import islice
+
+from nwn_roleplay_helper import history, settings
+from nwn_roleplay_helper.history_cache import HISTORY_CACHE, HistoryCache
+
+
+class CountingStore(history.JsonlHistoryStore):
+    def __init__(self):
+        super().__init__()
+        self.reads = 0
+
+    def iter_reversed(self, *args, **kwargs):
+        self.reads += 1
+        return super().iter_reversed(*args, **kwargs)
+
+    def iter_forward(self, *args, **kwargs):
+        self.reads += 1
+        return super().iter_forward(*args, **kwargs)
+
+
+def _entries(start, stop):
+    return [
+        history.make_entry("2025-01-01 10:00:00", "other", f"line {i}")
+        for i in range(start, stop)
+    ]
+
+
+def test_repeated_reads_are_served_from_memory(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "CHAT_HISTORY_DIR", str(tmp_path))
+    store = CountingStore()
+    cache = HistoryCache(window=5, max_entries=100)
+    store.append_entries("tester", "Norfind", _entries(0, 8))
+
+    everything = [e for _, e in cache.iter_reversed(store, "tester", "Norfind")]
+    assert everything == _entries(0, 8)[::-1]
+    reads = store.reads
+
+    recent = islice(cache.iter_reversed(store, "tester", "Norfind"), 5)
+    assert [e for _, e in recent] == _entries(3, 8)[::-1]
+    assert store.reads == reads
+    stats = cache.stats()
+    assert stats["misses"] == 1
+    assert stats["hits"] == 1
+
+
+def test_appends_catch_up_incrementally(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "CHAT_HISTORY_DIR", str(tmp_path))
+    store = CountingStore()
+    cache = HistoryCache(window=5, max_entries=100)
+    store.append_entries("tester", "Norfind", _entries(0, 3))
+    assert [e for _, e in cache.iter_forward(store, "tester", "Norfind")] == (
+        _entries(0, 3)
+    )
+
+    store.append_entries("tester", "Norfind", _entries(3, 4))
+    cache.mark_dirty(store, "tester", "Norfind")
+
+    assert [e for _, e in cache.iter_forward(store, "tester", "Norfind")] == (
+        _entries(0, 4)
+    )
+    assert cache.stats()["catch_ups"] == 1
+
+    store.append_entries("tester", "Norfind", _entries(4, 7))
+    cache.mark_dirty(store, "tester", "Norfind")
+    cached = cache.get(store, "tester", "Norfind")
+    assert [e for _, e in cached.entries] == _entries(2, 7)
+    assert cached.complete is False
+    assert [e for _, e in cache.iter_forward(store, "tester", "Norfind")] == (
+        _entries(0, 7)
+    )
+
+
+def test_least_recently_used_characters_are_evicted(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "CHAT_HISTORY_DIR", str(tmp_path))
+    store = history.JsonlHistoryStore()
+    cache = HistoryCache(window=5, max_entries=8)
+    for name in ("A", "B", "C"):
+        store.append_entries("tester", name, _entries(0, 4))
+
+    cache.get(store, "tester", "A")
+    cache.get(store, "tester", "B")
+    cache.get(store, "tester", "A")
+    cache.get(store, "tester", "C")
+
+    stats = cache.stats()
+    assert stats["evictions"] == 1
+    assert stats["characters"] == 2
+    cache.get(store, "tester", "A")
+    assert cache.stats()["hits"] == 2
+
+
+def test_history_module_updates_cache_on_append(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "CHAT_HISTORY_DIR", str(tmp_path))
+    history.append_entries("tester", "Norfind", _entries(0, 2))
+    assert history.tail_entries("tester", "Norfind", 5) == _entries(0, 2)
+
+    history.append_entries("tester", "Norfind", _entries(2, 3))
+
+    assert history.tail_entries("tester", "Norfind", 5) == _entries(0, 3)
+    HISTORY_CACHE.invalidate("tester", "Norfind")
+    assert history.load_entries("tester", "Norfind") == _entries(0, 3)
+
+
+def test_a_slow_load_does_not_block_other_characters(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "CHAT_HISTORY_DIR", str(tmp_path))
+    loading = threading.Event()
+    release = threading.Event()
+
+    class SlowStore(history.JsonlHistoryStore):
+        def iter_reversed(self, user, character_name, **kwargs):
+            if character_name == "Slow":
+                loading.set()
+                release.wait(5)
+            return super().iter_reversed(user, character_name, **kwargs)
+
+    store = SlowStore()
+    cache = HistoryCache(window=5, max_entries=100)
+    for name in ("Slow", "Fast"):
+        store.append_entries("tester", name, _entries(0, 2))
+    slow = threading.Thread(target=cache.get, args=(store, "tester", "Slow"))
+    slow.start()
+    assert loading.wait(5)
+
+    fast = []
+    reader = threading.Thread(
+        target=lambda: fast.append(cache.get(store, "tester", "Fast"))
+    )
+    reader.start()
+    reader.join(2)
+    release.set()
+
+    assert [e for _, e in fast[0].entries] == _entries(0, 2)
+    slow.join(5)
+    assert cache.stats()["characters"] == 2
+
+
+def test_a_load_that_races_a_write_is_not_cached(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "CHAT_HISTORY_DIR", str(tmp_path))
+
+    class RacingStore(CountingStore):
+        def iter_reversed(self, user, character_name, **kwargs):
+            located = list(super().iter_reversed(user, character_name, **kwargs))
+            if self.reads == 1:
+                self.append_entries(user, character_name, _entries(2, 3))
+            return iter(located)
+
+    store = RacingStore()
+    cache = HistoryCache(window=5, max_entries=100)
+    store.append_entries("tester", "Norfind", _entries(0, 2))
+
+    assert [e for _, e in cache.get(store, "tester", "Norfind").entries] == (
+        _entries(0, 2)
+    )
+    assert cache.stats()["characters"] == 0
+    assert [e for _, e in cache.get(store, "tester", "Norfind").entries] == (
+        _entries(0, 3)
+    )
+
+
+def test_appends_from_another_process_are_seen(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "CHAT_HISTORY_DIR", str(tmp_path))
+    monkeypatch.setattr(settings, "SOCKETIO_MESSAGE_QUEUE", "local://")
+    store = history.JsonlHistoryStore()
+    cache = HistoryCache(window=5, max_entries=100)
+    store.append_entries("tester", "Norfind", _entries(0, 2))
+    cache.get(store, "tester", "Norfind")
+
+    # Written by another process: this cache was never marked dirty.
+    store.append_entries("tester", "Norfind", _entries(2, 3))
+
+    assert [e for _, e in cache.get(store, "tester", "Norfind").entries] == (
+        _entries(0, 3)
+    )
+    assert cache.get(store, "tester", "Norfind") is cache.get(
+        store, "tester", "Norfind"
+    )
@@ -0,0 +1,143 @@
+import datetime
+import json
+
+import pytest
+
+from nwn_roleplay_helper import history, settings
+from nwn_roleplay_helper.history_retention import RetentionPolicy, prune_history
+
+NOW = datetime.datetime(2025, 3, 1, 12, 0, 0)
+
+
+def _day(day, sender="other", message="line"):
+    return history.make_entry(f"2025-02-{day:02d} 10:00:00", sender, message)
+
+
+def _write_days(user="tester", name="Norfind", days=range(1, 11)):
+    entries = []
+    for day in days:
+        batch = [
+            _day(day, "other", f"day {day} talk"),
+            _day(day, "ai", f"day {day} suggestion"),
+        ]
+        history.append_entries(user, name, batch)
+        entries.extend(batch)
+    return entries
+
+
+@pytest.fixture(params=["json", "sqlite"])
+def backend(request, tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "CHAT_HISTORY_DIR", str(tmp_path / "history"))
+    monkeypatch.setattr(settings, "STORAGE_BACKEND", request.param)
+    monkeypatch.setattr(settings, "SQLITE_DB_PATH", str(tmp_path / "test.db"))
+    # One sealed segment per day, so the JSONL backend has cold data to prune.
+    monkeypatch.setattr(settings, "HISTORY_SEGMENT_MAX_BYTES", 100)
+    return request.param
+
+
+def _ids(name="Norfind"):
+    page = history.read_page("tester", name, limit=1000)
+    return {entry["message"]: entry["id"] for entry in page["entries"]}
+
+
+def test_max_age_drops_old_entries_and_keeps_ids(backend):
+    _write_days()
+    ids_before = _ids()
+
+    report = prune_history(RetentionPolicy(max_age_days=25), now=NOW)
+
+    remaining = history.load_entries("tester", "Norfind")
+    assert {entry["timestamp"][:10] for entry in remaining} == {
+        f"2025-02-{day:02d}" for day in range(5, 11)
+    }
+    assert report["entries_removed"] == 8
+    assert report["bytes_reclaimed"] > 0
+    assert report["characters"] == 1
+    assert "duration_ms" in report
+    assert all(ids_before[message] == id_ for message, id_ in _ids().items())
+    assert history.entry_count("tester", "Norfind") == 12
+
+
+def test_ai_entries_expire_before_player_lines(backend):
+    _write_days()
+    version = history.history_version("tester", "Norfind")
+
+    report = prune_history(RetentionPolicy(ai_system_days=25), now=NOW)
+
+    senders = [
+        (entry["timestamp"][:10], entry["sender"])
+        for entry in history.load_entries("tester", "Norfind")
+    ]
+    assert ("2025-02-01", "other") in senders
+    assert ("2025-02-01", "ai") not in senders
+    assert ("2025-02-05", "ai") in senders
+    assert report["entries_removed"] == 4
+    # Rows removed between the oldest and newest still change the ETag.
+    assert history.history_version("tester", "Norfind") != version
+    assert (
+        history.search_entries("tester", "Norfind", "day 1", limit=5)[0]["sender"]
+        == "other"
+    )
+
+
+def test_max_entries_keeps_the_newest(backend):
+    entries = _write_days()
+
+    prune_history(RetentionPolicy(max_entries=6), now=NOW)
+
+    remaining = history.load_entries("tester", "Norfind")
+    if backend == "json":
+        # The hot journal is never pruned, so it may keep a few extra.
+        assert remaining[-6:] == entries[-6:]
+        assert len(remaining) < len(entries)
+    else:
+        assert remaining == entries[-6:]
+
+
+def test_user_budget_removes_oldest_history_across_characters(backend):
+    _write_days(name="Norfind", days=range(1, 6))
+    _write_days(name="Guthric", days=range(6, 11))
+    store = history.get_store()
+    budget = store.user_bytes("tester") // 2
+
+    report = prune_history(RetentionPolicy(user_max_bytes=budget), now=NOW)
+
+    assert store.user_bytes("tester") <= budget
+    assert report["entries_removed"] > 0
+    norfind = history.load_entries("tester", "Norfind")
+    guthric = history.load_entries("tester", "Guthric")
+    assert len(norfind) < 10
+    assert guthric[0]["timestamp"].startswith("2025-02-06") or len(norfind) == 0
+
+
+def test_user_budget_ignores_migrated_legacy_backups(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "CHAT_HISTORY_DIR", str(tmp_path / "history"))
+    monkeypatch.setattr(settings, "HISTORY_SEGMENT_MAX_BYTES", 100)
+    character_dir = tmp_path / "history" / "tester" / "Norfind"
+    character_dir.mkdir(parents=True)
+    legacy = [_day(1, "other", f"legacy {i}") for i in range(400)]
+    (character_dir / "chat_history.json").write_text(json.dumps(legacy))
+    entries = _write_days()
+    store = history.get_store()
+    assert (character_dir / "chat_history.json.migrated").exists()
+    # Room for the journal and segments, not for the backup as well.
+    budget = sum(
+        path.stat().st_size
+        for path in character_dir.rglob("*")
+        if path.name == "chat_history.jsonl" or path.parent.name == "segments"
+    )
+
+    report = prune_history(RetentionPolicy(user_max_bytes=budget), now=NOW)
+
+    assert report["entries_removed"] == 0
+    assert store.user_bytes("tester") == budget
+    assert history.load_entries("tester", "Norfind") == legacy + entries
+
+
+def test_disabled_policy_removes_nothing(backend):
+    entries = _write_days()
+
+    report = prune_history(RetentionPolicy(), now=NOW)
+
+    assert report["entries_removed"] == 0
+    assert history.load_entries("tester", "Norfind") == entries
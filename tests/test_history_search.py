@@ -0,0 +1,90 @@
+import pytest
+
+from nwn_roleplay_helper import history, settings, storage
+from nwn_roleplay_helper.history_search import make_snippet
+from tests.test_history_api import _logged_in_client
+
+
+def _seed(user="tester", name="Norfind"):
+    messages = [
+        "[Talk] I lost my gauntlet in the swamp",
+        "[Talk] Anyone seen the tavern keeper?",
+        "[Talk] The gauntlet, the gauntlet! Where is my gauntlet?",
+        "[Talk] Found a gauntlet and a sword",
+    ]
+    history.append_entries(
+        user,
+        name,
+        [history.make_entry("2025-01-01 10:00:00", "other", m) for m in messages],
+    )
+    return messages
+
+
+@pytest.fixture(params=["json", "sqlite"])
+def backend(request, tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "CHAT_HISTORY_DIR", str(tmp_path / "history"))
+    monkeypatch.setattr(settings, "STORAGE_BACKEND", request.param)
+    monkeypatch.setattr(settings, "SQLITE_DB_PATH", str(tmp_path / "test.db"))
+    return request.param
+
+
+def test_search_ranks_hits_and_requires_every_word(backend):
+    messages = _seed()
+
+    hits = history.search_entries("tester", "Norfind", "Gauntlet", limit=10)
+    assert [hit["message"] for hit in hits][0] == messages[2]
+    assert {hit["message"] for hit in hits} == {messages[0], messages[2], messages[3]}
+    assert "**gauntlet**" in hits[-1]["snippet"]
+
+    hits = history.search_entries("tester", "Norfind", "gauntlet sword", limit=10)
+    assert [hit["message"] for hit in hits] == [messages[3]]
+    assert history.search_entries("tester", "Norfind", "dragon", limit=10) == []
+    assert history.search_entries("tester", "Guthric", "gauntlet", limit=10) == []
+
+
+def test_search_index_picks_up_new_entries(backend):
+    _seed()
+    assert len(history.search_entries("tester", "Norfind", "sword", limit=10)) == 1
+
+    history.append_entries(
+        "tester",
+        "Norfind",
+        [history.make_entry("2025-01-02 10:00:00", "self", "[Talk] Sword drawn")],
+    )
+
+    hits = history.search_entries("tester", "Norfind", "sword", limit=10)
+    assert len(hits) == 2
+
+
+def test_sqlite_search_without_fts_falls_back(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "STORAGE_BACKEND", "sqlite")
+    monkeypatch.setattr(settings, "SQLITE_DB_PATH", str(tmp_path / "nofts.db"))
+    storage.get_sqlite_store().fts_enabled = False
+    messages = _seed()
+
+    hits = history.search_entries("tester", "Norfind", "tavern", limit=10)
+
+    assert [hit["message"] for hit in hits] == [messages[1]]
+
+
+def test_snippet_marks_matches_around_first_hit():
+    message = "x" * 100 + " the Gauntlet here " + "y" * 100
+    snippet = make_snippet(message, ["gauntlet"])
+    assert snippet.startswith("…")
+    assert snippet.endswith("…")
+    assert "**Gauntlet**" in snippet
+
+
+def test_search_route(backend):
+    _seed()
+    client = _logged_in_client()
+
+    assert client.get("/api/history/Norfind/search?q=").status_code == 400
+
+    resp = client.get("/api/history/Norfind/search?q=tavern")
+    assert resp.status_code == 200
+    body = resp.get_json()
+    assert body["query"] == "tavern"
+    assert [hit["message"] for hit in body["hits"]] == [
+        "[Talk] Anyone seen the tavern keeper?"
+    ]
@@ -0,0 +1,131 @@
+import threading
+
+from nwn_roleplay_helper import history, settings
+from nwn_roleplay_helper.chat_processing import process_new_messages
+from nwn_roleplay_helper.history_writer import HISTORY_WRITER, HistoryWriteBuffer
+
+
+class FakeSocketIO:
+    def emit(self, event, payload, **kwargs):
+        pass
+
+
+def _entry(message):
+    return history.make_entry("2025-01-01 10:00:00", "other", message)
+
+
+def test_batch_for_one_character_is_a_single_append():
+    calls = []
+
+    def fake_append(user, name, entries):
+        calls.append((user, name, list(entries)))
+        return 10
+
+    writer = HistoryWriteBuffer(max_entries=100, interval=60, append_func=fake_append)
+
+    writer.enqueue("tester", "Norfind", [_entry("one"), _entry("two")])
+    writer.enqueue("tester", "Norfind", [_entry("three")])
+    writer.enqueue("tester", "Guthric", [_entry("four")])
+    assert writer.stats()["buffer_depth"] == 4
+
+    writer.flush("tester", "Norfind")
+
+    assert calls == [
+        ("tester", "Norfind", [_entry("one"), _entry("two"), _entry("three")])
+    ]
+    stats = writer.stats()
+    assert stats["buffer_depth"] == 1
+    assert stats["entries_written"] == 3
+    assert stats["bytes_written"] == 10
+    writer.close()
+    assert calls[-1][1] == "Guthric"
+    assert writer.stats()["buffer_depth"] == 0
+
+
+def test_flush_finds_entries_buffered_under_either_spelling():
+    calls = []
+
+    def fake_append(user, name, entries):
+        calls.append((name, len(entries)))
+        return 10
+
+    writer = HistoryWriteBuffer(max_entries=100, interval=60, append_func=fake_append)
+
+    writer.enqueue("tester", "Alt_Two", [_entry("one")])
+    writer.enqueue("tester", "Alt Two", [_entry("two")])
+    writer.flush("tester", "Alt Two")
+
+    assert calls == [("Alt_Two", 2)]
+    assert writer.stats()["buffer_depth"] == 0
+    writer.close()
+
+
+def test_close_flushes_to_disk(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "CHAT_HISTORY_DIR", str(tmp_path))
+    writer = HistoryWriteBuffer(max_entries=100, interval=60)
+
+    writer.enqueue("tester", "Norfind", [_entry("one"), _entry("two")])
+    writer.close()
+
+    assert history.load_entries("tester", "Norfind") == [_entry("one"), _entry("two")]
+    assert writer.stats()["bytes_written"] > 0
+
+
+def test_process_new_messages_buffers_whole_batch(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "CHAT_HISTORY_DIR", str(tmp_path))
+    calls = []
+
+    def counting_append(user, name, entries):
+        calls.append(len(entries))
+        return history.append_entries(user, name, entries)
+
+    monkeypatch.setattr(HISTORY_WRITER, "_append", counting_append)
+    lines = "\n".join(
+        f"[Viper's Wit] Auguste Detourne: [Talk] Line {i}" for i in range(50)
+    )
+
+    process_new_messages(
+        lines,
+        client="tester",
+        user_characters={"Norfind": {"owner": "tester"}},
+        character_profiles={},
+        socketio=FakeSocketIO(),
+    )
+    HISTORY_WRITER.flush("tester", "Norfind")
+
+    assert calls == [50]
+    assert len(history.load_entries("tester", "Norfind")) == 50
+
+
+def test_concurrent_writers_keep_per_character_order(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "CHAT_HISTORY_DIR", str(tmp_path))
+    writer = HistoryWriteBuffer(max_entries=7, interval=0.01, shards=3)
+    names = [f"Character {i}" for i in range(6)]
+
+    def produce(name):
+        for i in range(100):
+            writer.enqueue("tester", name, [_entry(f"{name} {i}")])
+
+    threads = [threading.Thread(target=produce, args=(name,)) for name in names]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    writer.close()
+
+    for name in names:
+        messages = [e["message"] for e in history.load_entries("tester", name)]
+        assert messages == [f"{name} {i}" for i in range(100)]
+    stats = writer.stats()
+    assert stats["entries_written"] == 600
+    assert stats["shards"] == 3
+    assert stats["buffer_depth"] == 0
+
+
+def test_character_always_maps_to_the_same_shard():
+    writer = HistoryWriteBuffer(shards=8, append_func=lambda *args: 0)
+
+    shard = writer.shard_for("tester", "Elvith Ma'for")
+
+    assert writer.shard_for("tester", "Elvith_Ma'for") == shard
+    assert {writer.shard_for("tester", f"C{i}") for i in range(50)} == set(range(8))
@@ -0,0 +1,215 @@
+import gzip
+import io
+import json
+
+import pytest
+
+import app as app_module
+from nwn_roleplay_helper import ingestion, settings
+
+
+def _ndjson(records):
+    return "".join(json.dumps(record) + "\n" for record in records).encode("utf-8")
+
+
+def test_iter_bulk_lines_reads_gzipped_ndjson():
+    body = gzip.compress(_ndjson(["[a] Hero: [Talk] hi", {"line": "second"}]))
+
+    lines = ingestion.iter_bulk_lines(
+        io.BytesIO(body),
+        content_type="application/x-ndjson",
+        content_encoding="gzip",
+    )
+
+    assert list(lines) == [(None, "[a] Hero: [Talk] hi"), (None, "second")]
+
+
+def test_iter_bulk_lines_reads_plain_text_and_skips_blank_lines():
+    body = b"first\r\n\nsecond\nthird"
+
+    assert list(ingestion.iter_bulk_lines(io.BytesIO(body), seq=7)) == [
+        (7, "first"),
+        (8, "second"),
+        (9, "third"),
+    ]
+
+
+def test_iter_bulk_lines_enforces_the_decompressed_limit(monkeypatch):
+    monkeypatch.setattr(settings, "INGEST_BULK_MAX_BYTES", 1024)
+    body = gzip.compress(b"x" * 100 + b"\n" * 2000)
+
+    with pytest.raises(ingestion.PayloadTooLarge):
+        list(ingestion.iter_bulk_lines(io.BytesIO(body), content_encoding="gzip"))
+
+
+def test_batched_groups_lines():
+    assert list(ingestion.batched(iter("abcde"), 2)) == [["a", "b"], ["c", "d"], ["e"]]
+
+
+def _accept(tracker, client, lines, seq=None, *, stream=None):
+    numbered = ingestion.numbered(lines, seq)
+    with tracker.accepting(client, numbered, stream=stream) as accepted:
+        return accepted
+
+
+def test_tracker_skips_numbered_lines_at_or_below_the_high_water_mark():
+    tracker = ingestion.IngestionTracker()
+
+    assert _accept(tracker, "c", ["a", "b", "c"], 0) == ["a", "b", "c"]
+    # A reconnect resends lines 1-2 together with the new line 3.
+    assert _accept(tracker, "c", ["b", "c", "d"], 1) == ["d"]
+    assert _accept(tracker, "c", ["a"], 0) == []
+    assert tracker.high_water("c") == 3
+    # A new stream starts its numbering again.
+    assert _accept(tracker, "c", ["x"], 0, stream="run-2") == ["x"]
+    assert tracker.stats()["skipped_seq"] == 3
+
+
+def test_tracker_handles_unordered_and_mixed_numbering():
+    tracker = ingestion.IngestionTracker()
+    _accept(tracker, "c", ["a", "b", "c", "d"], 0)
+
+    # NDJSON records carry their own seq, which need not be consecutive.
+    records = [(2, "c"), (5, "f"), (None, "*nods*"), (4, "e"), (6, "g")]
+    with tracker.accepting("c", records) as lines:
+        assert lines == ["f", "*nods*", "g"]
+    assert tracker.high_water("c") == 6
+    assert tracker.stats()["skipped_seq"] == 2
+
+
+def test_unnumbered_lines_are_kept_by_default():
+    tracker = ingestion.IngestionTracker()
+
+    assert _accept(tracker, "c", ["*nods*"]) == ["*nods*"]
+    assert _accept(tracker, "c", ["*nods*"]) == ["*nods*"]
+
+
+def test_tracker_drops_resent_unnumbered_lines(monkeypatch):
+    monkeypatch.setattr(settings, "INGEST_DEDUP_WINDOW", 3)
+    tracker = ingestion.IngestionTracker()
+
+    # Repeats inside one update are kept.
+    assert _accept(tracker, "c", ["hi", "hi", "a"]) == ["hi", "hi", "a"]
+    assert _accept(tracker, "c", ["a", "b", "c", "d"]) == ["b", "c", "d"]
+    # "hi" and "a" have left the three-line window.
+    assert _accept(tracker, "c", ["hi", "d"]) == ["hi"]
+    assert _accept(tracker, "other", ["d"]) == ["d"]
+
+
+def test_lines_count_as_delivered_only_after_processing_succeeds():
+    tracker = ingestion.IngestionTracker()
+
+    with pytest.raises(RuntimeError):
+        with tracker.accepting("c", ingestion.numbered(["a", "b"], 0)) as lines:
+            assert lines == ["a", "b"]
+            raise RuntimeError("processing failed")
+    assert tracker.high_water("c") is None
+
+    with tracker.accepting("c", ingestion.numbered(["a", "b"], 0)) as lines:
+        assert lines == ["a", "b"]
+    with tracker.accepting("c", ingestion.numbered(["b", "c"], 1)) as lines:
+        assert lines == ["c"]
+    assert tracker.high_water("c") == 2
+
+
+def test_log_update_skips_resent_lines(monkeypatch):
+    ingestion.INGESTION_TRACKER.reset()
+    processed = []
+
+    def fake_process(lines, **kwargs):
+        processed.append(list(lines))
+        return len(processed[-1])
+
+    monkeypatch.setattr(
+        app_module.chat_processing, "process_new_messages", fake_process
+    )
+    client = app_module.app.test_client()
+
+    for seq, lines in ((0, ["one", "two"]), (1, ["two", "three"])):
+        resp = client.post(
+            "/api/log_update",
+            json={"client": "seq-client", "seq": seq, "lines": lines},
+        )
+        assert resp.status_code == 202
+    app_module.INGESTION_QUEUE.drain()
+
+    assert processed == [["one", "two"], ["three"]]
+    resp = client.post(
+        "/api/log_update", json={"client": "seq-client", "seq": -1, "lines": ["x"]}
+    )
+    assert resp.status_code == 400
+
+
+def test_bulk_endpoint_processes_lines_in_batches(monkeypatch):
+    ingestion.INGESTION_TRACKER.reset()
+    monkeypatch.setattr(app_module, "INGEST_BULK_BATCH_LINES", 2)
+    batches = []
+
+    def fake_process(lines, **kwargs):
+        batches.append((list(lines), kwargs["client"]))
+        return len(batches[-1][0])
+
+    monkeypatch.setattr(
+        app_module.chat_processing, "process_new_messages", fake_process
+    )
+    body = gzip.compress(_ndjson([f"line {i}" for i in range(5)]))
+
+    resp = app_module.app.test_client().post(
+        "/api/log_update/bulk?client=D6lab",
+        data=body,
+        headers={
+            "Content-Type": "application/x-ndjson",
+            "Content-Encoding": "gzip",
+        },
+    )
+
+    assert resp.status_code == 202
+    assert resp.get_json() == {"success": True, "queued": True, "lines": 5}
+    app_module.INGESTION_QUEUE.drain()
+    assert [len(lines) for lines, _ in batches] == [2, 2, 1]
+    assert {client for _, client in batches} == {"D6lab"}
+
+
+def test_bulk_endpoint_rejects_corrupt_bodies():
+    resp = app_module.app.test_client().post(
+        "/api/log_update/bulk",
+        data=b"not gzip",
+        headers={"Content-Encoding": "gzip"},
+    )
+
+    assert resp.status_code == 400
+    assert resp.get_json()["success"] is False
+
+
+def test_log_update_asks_clients_to_retry_when_the_queue_is_full(monkeypatch):
+    monkeypatch.setattr(
+        app_module.INGESTION_QUEUE, "submit", lambda *args, **kwargs: False
+    )
+
+    resp = app_module.app.test_client().post(
+        "/api/log_update", json={"client": "busy", "lines": ["hello"]}
+    )
+
+    assert resp.status_code == 503
+    assert int(resp.headers["Retry-After"]) >= 1
+    assert resp.get_json()["success"] is False
+
+
+def test_log_update_refuses_lines_that_are_not_strings(monkeypatch):
+    submitted = []
+    monkeypatch.setattr(
+        app_module.INGESTION_QUEUE,
+        "submit",
+        lambda *args, **kwargs: submitted.append(args) or True,
+    )
+    payload = {"client": "bad", "lines": ["hello", 5]}
+
+    resp = app_module.app.test_client().post("/api/log_update", json=payload)
+    assert resp.status_code == 400
+    assert resp.get_json()["success"] is False
+
+    socket_client = app_module.socketio.test_client(app_module.app)
+    ack = socket_client.emit("log_update", payload, callback=True)
+    socket_client.disconnect()
+    assert ack["success"] is False
+    assert submitted == []
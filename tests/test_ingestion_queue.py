@@ -0,0 +1,84 @@
+import threading
+
+from nwn_roleplay_helper.ingestion_queue import IngestionQueue
+
+
+def test_jobs_for_one_client_run_in_order():
+    ingestion_queue = IngestionQueue(workers=3, max_depth=100)
+    seen = {"a": [], "b": []}
+
+    for i in range(20):
+        for client in seen:
+            assert ingestion_queue.submit(
+                client, lambda client=client, i=i: seen[client].append(i)
+            )
+    ingestion_queue.drain()
+    ingestion_queue.close()
+
+    assert seen == {"a": list(range(20)), "b": list(range(20))}
+    stats = ingestion_queue.stats()
+    assert stats["processed"] == 40
+    assert stats["depth"] == 0
+
+
+def test_full_queue_refuses_jobs_until_drained():
+    ingestion_queue = IngestionQueue(workers=1, max_depth=1)
+    started = threading.Event()
+    release = threading.Event()
+
+    def blocker():
+        started.set()
+        release.wait(5)
+
+    assert ingestion_queue.submit("a", blocker)
+    assert started.wait(5)
+    assert ingestion_queue.submit("a", lambda: None)
+    assert not ingestion_queue.submit("a", lambda: None)
+    assert ingestion_queue.stats()["rejected"] == 1
+
+    release.set()
+    ingestion_queue.drain()
+    assert ingestion_queue.submit("a", lambda: None)
+    ingestion_queue.close()
+    assert ingestion_queue.stats()["processed"] == 3
+
+
+def test_failing_jobs_are_counted_and_do_not_stop_the_worker():
+    ingestion_queue = IngestionQueue(workers=1, max_depth=10)
+    done = []
+
+    def fail():
+        raise RuntimeError("boom")
+
+    ingestion_queue.submit("a", fail)
+    ingestion_queue.submit("a", lambda: done.append(True))
+    ingestion_queue.drain()
+    ingestion_queue.close()
+
+    assert done == [True]
+    assert ingestion_queue.stats()["errors"] == 1
+
+
+def test_close_does_not_block_on_a_full_queue():
+    ingestion_queue = IngestionQueue(workers=1, max_depth=1)
+    started = threading.Event()
+    release = threading.Event()
+    done = []
+
+    def blocker():
+        started.set()
+        release.wait(5)
+
+    ingestion_queue.submit("a", blocker)
+    assert started.wait(5)
+    assert ingestion_queue.submit("a", lambda: done.append(True))
+
+    closer = threading.Thread(target=ingestion_queue.close)
+    closer.start()
+    closer.join(0.2)
+    release.set()
+    closer.join(5)
+
+    assert not closer.is_alive()
+    assert done == [True]
+    assert ingestion_queue.stats()["processed"] == 2
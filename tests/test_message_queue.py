@@ -0,0 +1,97 @@
+import time
+import uuid
+
+import pytest
+import socketio
+
+import app as app_module
+from nwn_roleplay_helper.message_queue import (
+    LocalPubSubManager,
+    socketio_queue_options,
+)
+from nwn_roleplay_helper.shared_state import (
+    MemoryStateStore,
+    SharedDict,
+    create_state_store,
+)
+
+
+def _server(channel):
+    server = socketio.Server(
+        async_mode="threading", client_manager=LocalPubSubManager(channel=channel)
+    )
+    # A running server starts its queue listener on the first connection.
+    server.manager_initialized = True
+    server.manager.initialize()
+    sent = []
+    server._send_eio_packet = lambda eio_sid, packet: sent.append((eio_sid, packet))
+    return server, sent
+
+
+def test_emits_reach_sockets_connected_to_another_process():
+    channel = uuid.uuid4().hex
+    emitter, emitter_sent = _server(channel)
+    other, other_sent = _server(channel)
+    # Flask-SocketIO's test client refuses message queues, so connect a socket
+    # to the second server's manager directly.
+    sid = other.manager.connect("eio-1", "/")
+    other.manager.enter_room(sid, "/", "user:alice")
+
+    emitter.emit("new_messages", {"client": "alice"}, to="user:alice")
+
+    deadline = time.monotonic() + 5
+    while not other_sent and time.monotonic() < deadline:
+        time.sleep(0.01)
+    [(eio_sid, packet)] = other_sent
+    assert eio_sid == "eio-1"
+    assert "new_messages" in packet.data
+    assert emitter_sent == []
+
+
+def test_socketio_queue_options():
+    assert socketio_queue_options("", "nwn") == {}
+    assert socketio_queue_options("redis://localhost:6379/0", "nwn") == {
+        "message_queue": "redis://localhost:6379/0",
+        "channel": "nwn",
+    }
+    [manager] = socketio_queue_options("local://", "nwn").values()
+    assert isinstance(manager, LocalPubSubManager)
+    assert manager.channel == "nwn"
+
+
+def test_shared_dict_round_trips_through_the_store():
+    store = MemoryStateStore()
+    last = SharedDict(store, "last_log_update", {"client": None, "lines": None})
+
+    last.update({"lines": ["one", "two"]})
+
+    assert store.hash_incr("presence", "alice") == 1
+    assert store.hash_incr("presence", "alice", -1) == 0
+    assert last.to_dict() == {"client": None, "lines": ["one", "two"]}
+    with pytest.raises(ValueError):
+        create_state_store("mongodb://nowhere")
+
+
+def test_profiles_are_reloaded_after_another_process_changes_them(monkeypatch):
+    class SharedMemoryStore(MemoryStateStore):
+        shared = True
+
+    store = SharedMemoryStore()
+    monkeypatch.setattr(app_module, "SHARED_STATE", store)
+    monkeypatch.setattr(app_module, "profiles_version", 0)
+    original = dict(app_module.character_profiles)
+    monkeypatch.setattr(
+        app_module.character_manager,
+        "load_all_profiles",
+        lambda: {"Remote": {"name": "Remote", "owner": "alice"}},
+    )
+
+    store.incr("profiles_version")
+    try:
+        app_module.sync_profiles()
+        assert app_module.character_profiles.owned_by("alice") == {
+            "Remote": {"name": "Remote", "owner": "alice"}
+        }
+        assert app_module.profiles_version == 1
+    finally:
+        app_module.character_profiles.replace(original)
@@ -0,0 +1,112 @@
+import pytest
+
+from nwn_roleplay_helper import chat_processing, settings
+from nwn_roleplay_helper.mode_router import ModeRouter, parse_routes
+
+
+class FakeSocketIO:
+    def __init__(self):
+        self.events = []
+
+    def emit(self, event, payload, **kwargs):
+        self.events.append((event, payload))
+
+
+class FakeWriter:
+    def __init__(self):
+        self.entries = {}
+
+    def enqueue(self, user, character_name, entries):
+        self.entries.setdefault(character_name, []).extend(entries)
+
+
+def test_parse_routes_applies_overrides_to_the_defaults():
+    routes = parse_routes("Shout=drop; Party=persist+broadcast,Emote=broadcast")
+
+    assert routes["Shout"].dropped
+    assert routes["Party"].persist and routes["Party"].broadcast
+    assert not routes["Emote"].persist and routes["Emote"].broadcast
+    assert routes["Talk"].persist and routes["Talk"].broadcast
+    assert routes["unparsed"].dropped
+
+
+@pytest.mark.parametrize("overrides", ["Shout", "Shout=loud", "Shout=drop+persist"])
+def test_parse_routes_rejects_invalid_overrides(overrides):
+    with pytest.raises(ValueError):
+        parse_routes(overrides)
+
+
+def test_invalid_routes_fail_when_the_router_is_created(monkeypatch):
+    monkeypatch.setattr(settings, "INGEST_MODE_ROUTES", "Shout=loud")
+
+    with pytest.raises(ValueError):
+        ModeRouter()
+    assert ModeRouter("Shout=drop").route("Shout").dropped
+
+
+def _process(monkeypatch, lines, router):
+    writer = FakeWriter()
+    monkeypatch.setattr(chat_processing, "HISTORY_WRITER", writer)
+    monkeypatch.setattr(chat_processing, "MODE_ROUTER", router)
+    socketio = FakeSocketIO()
+    chat_processing.process_new_messages(
+        "\n".join(lines),
+        client="D6lab",
+        user_characters={"Hero": {}},
+        character_profiles={},
+        socketio=socketio,
+    )
+    return writer.entries.get("Hero", []), socketio.events
+
+
+def _modes(payload):
+    column = payload["fields"].index("mode")
+    return [row[column] for row in payload["rows"]]
+
+
+def test_unparsed_lines_are_dropped_before_persistence(monkeypatch):
+    router = ModeRouter()
+
+    persisted, events = _process(
+        monkeypatch,
+        [
+            "[D6lab] Hero: [Talk] Hello.",
+            "Hero attacks Goblin : *hit* : (12 + 5 = 17)",
+            "[D6lab] Hero: [Party] On my way.",
+        ],
+        router,
+    )
+
+    assert [entry["message"] for entry in persisted] == [
+        "[D6lab] Hero: [Talk] Hello.",
+        "[D6lab] Hero: [Party] On my way.",
+    ]
+    [(event, payload)] = events
+    assert _modes(payload) == ["Talk"]
+    assert router.stats()["counts"] == {
+        "Talk": {"persisted": 1, "broadcast": 1},
+        "unparsed": {"dropped": 1},
+        "Party": {"persisted": 1},
+    }
+
+
+def test_mode_routes_can_be_overridden(monkeypatch):
+    monkeypatch.setattr(
+        settings, "INGEST_MODE_ROUTES", "Shout=drop;unparsed=persist;Party=broadcast"
+    )
+
+    persisted, events = _process(
+        monkeypatch,
+        [
+            "[D6lab] Hero: [Shout] Over here!",
+            "Hero attacks Goblin : *hit* : (12 + 5 = 17)",
+            "[D6lab] Hero: [Party] On my way.",
+        ],
+        ModeRouter(),
+    )
+
+    assert [entry["message"] for entry in persisted] == [
+        "Hero attacks Goblin : *hit* : (12 + 5 = 17)"
+    ]
+    [(event, payload)] = events
+    assert _modes(payload) == ["Party"]
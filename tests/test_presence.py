@@ -0,0 +1,128 @@
+import app as app_module
+from nwn_roleplay_helper import settings
+from nwn_roleplay_helper.auth import issue_socket_token
+from nwn_roleplay_helper.presence import PRESENCE, PresenceTracker
+from nwn_roleplay_helper.shared_state import MemoryStateStore
+
+
+def _tracker():
+    sent = []
+    tracker = PresenceTracker(MemoryStateStore())
+    tracker.bind(lambda event, payload: sent.append((event, payload)))
+    return tracker, sent
+
+
+def test_user_stays_online_until_their_last_socket_disconnects():
+    tracker, sent = _tracker()
+
+    assert tracker.connect("tab-1", "alice") is True
+    assert tracker.connect("tab-2", "alice") is False
+    assert tracker.disconnect("tab-1") is None
+    assert tracker.online() == ["alice"]
+
+    assert tracker.disconnect("tab-2") == "alice"
+    assert tracker.disconnect("tab-2") is None
+    assert tracker.online() == []
+
+
+def test_a_storm_of_connects_is_sent_as_one_delta():
+    tracker, sent = _tracker()
+
+    for n in range(50):
+        tracker.connect(f"sid-{n}", f"user{n % 10}")
+    tracker.disconnect("sid-0")
+
+    assert sent == []
+    delta = tracker.flush()
+    assert sent == [("active_users_delta", delta)]
+    assert delta["joined"] == sorted(f"user{n}" for n in range(10))
+    assert delta["left"] == []
+    assert tracker.flush() is None
+    assert tracker.stats()["deltas_sent"] == 1
+
+
+def test_a_reconnect_within_the_window_sends_nothing():
+    tracker, sent = _tracker()
+    tracker.connect("old", "alice")
+    tracker.flush()
+
+    tracker.disconnect("old")
+    tracker.connect("new", "alice")
+
+    assert tracker.flush() is None
+    assert len(sent) == 1
+
+
+def test_zero_debounce_sends_each_change_immediately(monkeypatch):
+    monkeypatch.setattr(settings, "PRESENCE_DEBOUNCE_SECONDS", 0)
+    tracker, sent = _tracker()
+
+    tracker.connect("sid", "alice")
+    tracker.disconnect("sid")
+
+    assert sent == [
+        ("active_users_delta", {"joined": ["alice"], "left": []}),
+        ("active_users_delta", {"joined": [], "left": ["alice"]}),
+    ]
+
+
+def test_socket_disconnect_is_tracked_by_sid_not_session():
+    token = issue_socket_token(app_module.app.config["SECRET_KEY"], "carol")
+    tabs = [
+        app_module.socketio.test_client(app_module.app, auth={"token": token})
+        for _ in range(2)
+    ]
+
+    [listing] = [
+        event for event in tabs[1].get_received() if event["name"] == "active_users"
+    ]
+    assert "carol" in listing["args"][0]
+
+    tabs[0].disconnect()
+    assert "carol" in PRESENCE.online()
+    tabs[1].disconnect()
+    assert "carol" not in PRESENCE.online()
+    PRESENCE.flush()
+
+
+def _processes():
+    store = MemoryStateStore()
+    trackers = [PresenceTracker(store, server_id=name) for name in "abc"]
+    for tracker in trackers:
+        tracker.heartbeat()
+    return store, trackers
+
+
+def test_users_of_a_dead_process_are_dropped_and_can_join_again():
+    store, (a, b, c) = _processes()
+    a.connect("sid-1", "alice")
+    b.connect("sid-2", "bob")
+    b.flush()
+
+    # Process "a" crashes: its heartbeat stops.
+    store.hash_update("presence:servers", {"a": "0"})
+
+    assert b.heartbeat() == ["alice"]
+    assert b.online() == ["bob"]
+    assert b.flush() == {"joined": [], "left": ["alice"]}
+    # Only one process takes the dead one's share out of the counts.
+    assert c.heartbeat() == []
+    assert b.connect("sid-3", "alice") is True
+
+
+def test_a_process_releases_its_sockets_on_exit_and_after_a_stall():
+    store, (a, b, _) = _processes()
+    a.connect("sid-1", "alice")
+    a.connect("sid-2", "alice")
+
+    # "a" stalled long enough to be written off, then beats again.
+    store.hash_update("presence:servers", {"a": "0"})
+    b.heartbeat()
+    assert b.online() == []
+    a.heartbeat()
+    assert b.online() == ["alice"]
+
+    a.disconnect("sid-1")
+    a.close()
+    assert b.online() == []
+    assert store.hash_get_all("presence") == {"alice": "0"}
@@ -0,0 +1,48 @@
+from nwn_roleplay_helper.profiles import ProfileStore, owned_by
+
+
+def test_owner_index_follows_create_update_and_delete():
+    profiles = ProfileStore({"Hero": {"name": "Hero", "owner": "alice"}})
+    profiles["Alt"] = {"name": "Alt", "owner": "alice"}
+    profiles["Rogue"] = {"name": "Rogue", "owner": "bob"}
+
+    assert list(profiles.owned_by("alice")) == ["Hero", "Alt"]
+    assert list(profiles.owned_by("bob")) == ["Rogue"]
+
+    profiles["Alt"] = {"name": "Alt", "owner": "bob", "race": "Elf"}
+    assert list(profiles.owned_by("alice")) == ["Hero"]
+    assert profiles.owned_by("bob")["Alt"]["race"] == "Elf"
+
+    del profiles["Hero"]
+    profiles.pop("Rogue")
+    assert profiles.owned_by("alice") == {}
+    assert list(profiles.owned_by("bob")) == ["Alt"]
+
+
+def test_replace_rebuilds_the_index():
+    profiles = ProfileStore({"Hero": {"name": "Hero", "owner": "alice"}})
+
+    profiles.replace({"Rogue": {"name": "Rogue", "owner": "bob"}})
+
+    assert profiles.owned_by("alice") == {}
+    assert list(profiles) == ["Rogue"]
+    assert owned_by(profiles, "bob") == {"Rogue": {"name": "Rogue", "owner": "bob"}}
+
+
+def test_owned_by_scans_plain_dicts():
+    profiles = {"Hero": {"owner": "alice"}, "Rogue": {"owner": "bob"}}
+
+    assert owned_by(profiles, "alice") == {"Hero": {"owner": "alice"}}
+
+
+def test_every_mutator_keeps_the_index_in_step():
+    profiles = ProfileStore()
+
+    profiles.setdefault("Hero", {"name": "Hero", "owner": "alice"})
+    profiles |= {"Rogue": {"name": "Rogue", "owner": "bob"}}
+    assert list(profiles.owned_by("alice")) == ["Hero"]
+    assert list(profiles.owned_by("bob")) == ["Rogue"]
+
+    name, _ = profiles.popitem()
+    assert name not in profiles
+    assert name not in {**profiles.owned_by("alice"), **profiles.owned_by("bob")}
@@ -0,0 +1,60 @@
+import app as app_module
+from nwn_roleplay_helper import chat_processing, settings
+
+
+class FakeWriter:
+    def enqueue(self, user, character_name, entries):
+        pass
+
+
+def _socket_for(username):
+    flask_client = app_module.app.test_client()
+    with flask_client.session_transaction() as sess:
+        sess["user"] = username
+    socket = app_module.socketio.test_client(
+        app_module.app, flask_test_client=flask_client
+    )
+    socket.get_received()
+    return socket
+
+
+def test_chat_lines_only_reach_the_sending_users_sockets(monkeypatch):
+    monkeypatch.setattr(chat_processing, "HISTORY_WRITER", FakeWriter())
+    alice_tabs = [_socket_for("alice"), _socket_for("alice")]
+    bob = _socket_for("bob")
+
+    chat_processing.process_new_messages(
+        "[alice] Hero: [Talk] Hello.",
+        client="alice",
+        user_characters={"Hero": {}},
+        character_profiles={},
+        socketio=app_module.socketio,
+    )
+
+    for socket in alice_tabs:
+        [event] = socket.get_received()
+        assert event["name"] == "new_messages"
+        assert event["args"][0]["client"] == "alice"
+    assert bob.get_received() == []
+    for socket in (*alice_tabs, bob):
+        socket.disconnect()
+
+
+def test_character_change_is_sent_to_the_users_room_only(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "CHAT_HISTORY_DIR", str(tmp_path))
+    monkeypatch.setitem(
+        app_module.character_profiles, "Hero", {"name": "Hero", "owner": "alice"}
+    )
+    alice = _socket_for("alice")
+    bob = _socket_for("bob")
+    flask_client = app_module.app.test_client()
+    with flask_client.session_transaction() as sess:
+        sess["user"] = "alice"
+
+    resp = flask_client.post("/api/character/Hero/activate")
+
+    assert resp.status_code == 200
+    assert [event["name"] for event in alice.get_received()] == ["character_change"]
+    assert bob.get_received() == []
+    alice.disconnect()
+    bob.disconnect()
@@ -0,0 +1,69 @@
+import app as app_module
+from nwn_roleplay_helper import chat_processing
+from nwn_roleplay_helper.auth import issue_socket_token, verify_socket_token
+from nwn_roleplay_helper.diagnostics import SOCKET_LATENCY
+
+
+class FakeWriter:
+    def enqueue(self, user, character_name, entries):
+        pass
+
+
+def test_socket_tokens_round_trip_and_reject_tampering():
+    token = issue_socket_token("secret", "alice")
+
+    assert verify_socket_token("secret", token) == "alice"
+    assert verify_socket_token("other-secret", token) is None
+    assert verify_socket_token("secret", token + "x") is None
+    assert verify_socket_token("secret", token, max_age=-1) is None
+    assert verify_socket_token("secret", None) is None
+
+
+def test_socket_token_endpoint_requires_login():
+    client = app_module.app.test_client()
+
+    assert client.get("/api/socket_token").status_code == 302
+
+    with client.session_transaction() as sess:
+        sess["user"] = "alice"
+    data = client.get("/api/socket_token").get_json()
+    secret = app_module.app.config["SECRET_KEY"]
+    assert verify_socket_token(secret, data["token"]) == "alice"
+    assert data["expires_in"] > 0
+
+
+def test_token_identifies_the_socket_without_a_session(monkeypatch):
+    monkeypatch.setattr(chat_processing, "HISTORY_WRITER", FakeWriter())
+    token = issue_socket_token(app_module.app.config["SECRET_KEY"], "alice")
+    verified = app_module.socketio.test_client(app_module.app, auth={"token": token})
+    claimed = app_module.socketio.test_client(
+        app_module.app, auth={"username": "alice"}
+    )
+    verified.get_received()
+    claimed.get_received()
+
+    chat_processing.process_new_messages(
+        "[alice] Hero: [Talk] Hello.",
+        client="alice",
+        user_characters={"Hero": {}},
+        character_profiles={},
+        socketio=app_module.socketio,
+    )
+
+    assert [event["name"] for event in verified.get_received()] == ["new_messages"]
+    assert claimed.get_received() == []
+    verified.disconnect()
+    claimed.disconnect()
+
+
+def test_latency_probe_acks_and_records_the_reported_round_trip():
+    socket = app_module.socketio.test_client(app_module.app)
+    before = sum(stats["count"] for stats in SOCKET_LATENCY.stats().values())
+
+    ack = socket.emit("latency_probe", {"rtt_ms": 12.5}, callback=True)
+    socket.emit("latency_probe", {"rtt_ms": None}, callback=True)
+
+    assert ack["server_time"] > 0
+    after = sum(stats["count"] for stats in SOCKET_LATENCY.stats().values())
+    assert after == before + 1
+    socket.disconnect()
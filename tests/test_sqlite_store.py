@@ -0,0 +1,107 @@
+import json
+
+import pytest
+
+from nwn_roleplay_helper import history, migrate_sqlite, settings, storage
+from nwn_roleplay_helper.sqlite_store import SqliteStore
+
+
+@pytest.fixture
+def sqlite_backend(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "STORAGE_BACKEND", "sqlite")
+    monkeypatch.setattr(settings, "SQLITE_DB_PATH", str(tmp_path / "test.db"))
+    return storage.get_sqlite_store()
+
+
+def test_history_api_runs_on_sqlite(sqlite_backend):
+    entries = [
+        history.make_entry(
+            f"2025-01-0{i % 3 + 1} 10:00:00", "ai" if i % 2 else "other", f"line {i}"
+        )
+        for i in range(10)
+    ]
+    history.append_entries("tester", "Elvith Ma'for", entries)
+
+    assert history.load_entries("tester", "Elvith Ma'for") == entries
+    assert history.entry_count("tester", "Elvith Ma'for") == 10
+    assert history.tail_entries("tester", "Elvith Ma'for", 2, senders={"ai"}) == [
+        entries[7],
+        entries[9],
+    ]
+    assert history.entries_between(
+        "tester", "Elvith Ma'for", since="2025-01-02", until="2025-01-02 23:59"
+    ) == [entries[1], entries[4], entries[7]]
+
+    latest = history.read_page("tester", "Elvith Ma'for", limit=4)
+    assert [e["message"] for e in latest["entries"]] == [
+        "line 6",
+        "line 7",
+        "line 8",
+        "line 9",
+    ]
+    older = history.read_page(
+        "tester", "Elvith Ma'for", limit=4, before=latest["before"]
+    )
+    assert [e["message"] for e in older["entries"]] == [
+        "line 2",
+        "line 3",
+        "line 4",
+        "line 5",
+    ]
+    version = history.history_version("tester", "Elvith Ma'for")
+    history.append_entries("tester", "Elvith Ma'for", entries[:1])
+    assert history.history_version("tester", "Elvith Ma'for") != version
+
+
+def test_sqlite_database_uses_wal(sqlite_backend):
+    mode = sqlite_backend._connection().execute("PRAGMA journal_mode").fetchone()[0]
+    assert mode == "wal"
+
+
+def test_users_and_feedback_on_sqlite(sqlite_backend):
+    storage.save_users({"tester": "hash"})
+    assert storage.load_users() == {"tester": "hash"}
+    storage.save_user("other", "other-hash")
+    storage.save_user("tester", "new-hash")
+    assert storage.load_users() == {"tester": "new-hash", "other": "other-hash"}
+    assert storage.load_user("tester") == "new-hash"
+    assert storage.load_user("missing") is None
+
+    sqlite_backend.add_feedback(
+        "tester", "Norfind", {"timestamp": "t", "message": "Hi", "rating": 1}
+    )
+    sqlite_backend.add_feedback(
+        "tester", "Norfind", {"timestamp": "t", "message": "Bye", "rating": 0}
+    )
+    summary = sqlite_backend.feedback_summary("tester", "Norfind")
+    assert summary["total_responses"] == 2
+    assert summary["positive_feedback"] == 1
+    assert summary["feedback_ratio"] == 0.5
+    assert summary["recent_feedbacks"][0]["message_snippet"] == "Bye"
+
+
+def test_migration_imports_existing_directories(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "CHAT_HISTORY_DIR", str(tmp_path / "chat_history"))
+    monkeypatch.setattr(settings, "FEEDBACK_DIR", str(tmp_path / "feedback_data"))
+    monkeypatch.setattr(settings, "USERS_FILE", str(tmp_path / "users.json"))
+    monkeypatch.setattr(storage, "USERS_FILE", str(tmp_path / "users.json"))
+    (tmp_path / "users.json").write_text(json.dumps({"tester": "hash"}))
+    entries = [history.make_entry("2025-01-01", "other", f"line {i}") for i in range(3)]
+    history.append_entries("tester", "Elvith Ma'for", entries)
+    feedback_dir = tmp_path / "feedback_data" / "tester" / "Elvith_Ma'for"
+    feedback_dir.mkdir(parents=True)
+    (feedback_dir / "feedback_20250101_100000.json").write_text(
+        json.dumps({"timestamp": "2025-01-01", "message": "Hi", "rating": 1})
+    )
+
+    db_path = str(tmp_path / "migrated.db")
+    # An earlier run was interrupted after the first entry.
+    SqliteStore(db_path).append_entries("tester", "Elvith Ma'for", entries[:1])
+    counts = migrate_sqlite.migrate(db_path)
+    assert counts == {"users": 1, "history_entries": 2, "feedback_entries": 1}
+    assert migrate_sqlite.migrate(db_path)["history_entries"] == 0
+
+    monkeypatch.setattr(settings, "STORAGE_BACKEND", "sqlite")
+    monkeypatch.setattr(settings, "SQLITE_DB_PATH", db_path)
+    assert history.load_entries("tester", "Elvith Ma'for") == entries
+    assert storage.load_users() == {"tester": "hash"}